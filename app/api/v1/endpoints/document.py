@@ -14,21 +14,30 @@ from app.core.dependencies import get_current_user
 from app.core.config import settings
 from app.services.document_parser import DocumentParser
 from app.services.text_processor import TextProcessor
-from app.services.embedding_service import EmbeddingService
+from app.services.indexing_service import IndexingService
+from app.services.analysis_store import get_analysis_store
+from app.services.minhash_service import get_minhash_service
+from app.services.simhash_service import get_simhash_service, to_signed
+from app.services.document_scope import allows_cross_institution
 from app.database.vector_db import vector_db
+from app.services.cache_service import cache_service
+from app.services.query_planner import document_frequencies
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
 @router.post("/upload", response_model=DocumentResponse, status_code=status.HTTP_201_CREATED)
-async def upload_document(
+def upload_document(
     file: UploadFile = File(...),
     title: Optional[str] = Form(None),
+    term: Optional[str] = Form(None),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
     """Upload a document for plagiarism checking"""
+    # A plain def runs in FastAPI's threadpool: parsing, hashing, the
+    # near-duplicate lookup and indexing never block the event loop
     
     # Validate file extension
     file_ext = Path(file.filename).suffix.lower()
@@ -85,6 +94,9 @@ async def upload_document(
     clean_content = text_processor.clean_text(content)
     content_hash = text_processor.generate_fingerprint(clean_content)
     word_count = text_processor.calculate_word_count(clean_content)
+    minhash_signatures = get_minhash_service().encode(
+        text_processor.chunk_text(clean_content, settings.CHUNK_SIZE, settings.OVERLAP)
+    )
     
     # Check if document already exists (by hash)
     existing_doc = db.query(Document).filter(
@@ -100,6 +112,22 @@ async def upload_document(
             detail="This document has already been uploaded"
         )
     
+    # Flag near-duplicates of any prior document this institution may see (not just this user's)
+    simhash_service = get_simhash_service()
+    fingerprint = simhash_service.fingerprint(clean_content)
+    doc_metadata = {'term': term} if term else {}
+    near_duplicate = simhash_service.find_near_duplicate(
+        db,
+        fingerprint,
+        current_user.institution_id,
+        allow_cross_institution=allows_cross_institution(current_user.institution)
+    )
+    if near_duplicate:
+        doc_metadata['near_duplicate_of'] = {
+            'document_id': near_duplicate[0],
+            'distance': near_duplicate[1]
+        }
+    
     # Create document record
     document = Document(
         filename=unique_filename,
@@ -111,6 +139,9 @@ async def upload_document(
         content_hash=content_hash,
         word_count=word_count,
         char_count=len(clean_content),
+        minhash_signatures=minhash_signatures,
+        simhash=to_signed(fingerprint),
+        doc_metadata=doc_metadata,
         user_id=current_user.id,
         institution_id=current_user.institution_id
     )
@@ -118,33 +149,33 @@ async def upload_document(
     db.add(document)
     db.commit()
     db.refresh(document)
+    simhash_service.add(document.id, fingerprint)
+    document_frequencies.add_document(clean_content)
+    cache_service.bump_corpus_epoch(document.institution_id)
+    
+    if near_duplicate:
+        logger.info(
+            f"Document {document.id} is a near-duplicate of document {near_duplicate[0]} "
+            f"(distance {near_duplicate[1]})"
+        )
     
-    # Generate and store embedding in background (optional if ChromaDB available)
+    # Generate and store chunk embeddings (optional if a vector DB is available)
     if vector_db.is_available():
         try:
-            embedding_service = EmbeddingService()
-            embedding = embedding_service.generate_embedding(clean_content[:1000])  # First 1000 chars
-            
-            vector_db.add_document(
-                doc_id=str(document.id),
-                text=clean_content[:1000],
-                embedding=embedding,
-                metadata={
-                    'user_id': current_user.id,
-                    'institution_id': current_user.institution_id,
-                    'filename': file.filename,
-                    'word_count': word_count
-                }
-            )
+            stored = IndexingService().index_document(document)
             
-            document.embedding_stored = True
-            db.commit()
-            logger.info(f"Embedding stored for document {document.id}")
+            if stored is not None:
+                document.embedding_stored = True
+                db.commit()
+                logger.info(f"Stored {stored} chunk embeddings for document {document.id}")
         except Exception as e:
             logger.error(f"Error storing embedding: {e}")
     else:
         logger.warning(f"Vector DB not available. Skipping embedding for document {document.id}")
     
+    if not document.embedding_stored:
+        IndexingService().analyze_document(document)
+    
     return DocumentResponse.model_validate(document)
 
 
@@ -215,13 +246,22 @@ def delete_document(
     # Delete from vector database (if available)
     if vector_db.is_available():
         try:
-            vector_db.delete_document(str(document.id))
+            vector_db.delete_document_vectors(document.id)
             logger.info(f"Deleted document {document.id} from vector DB")
         except Exception as e:
             logger.error(f"Error deleting from vector DB: {e}")
     
+    get_minhash_service().remove(document.id)
+    document_frequencies.remove_document(document.content)
+    store = get_analysis_store()
+    if store is not None:
+        store.delete(document.id)
+    get_simhash_service().remove(document.id)
+    
     # Delete from database
+    institution_id = document.institution_id
     db.delete(document)
     db.commit()
+    cache_service.bump_corpus_epoch(institution_id)
     
     return None
\ No newline at end of file
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
 from sqlalchemy.orm import Session
 from typing import List
+import time
 from app.database.session import get_db
 from app.models.user import User
 from app.models.document import Document
@@ -11,8 +12,11 @@ from app.schemas.plagiarism import (
     MatchResponse
 )
 from app.core.dependencies import get_current_user
-from app.tasks.plagiarism_tasks import check_plagiarism_task
+from app.tasks.plagiarism_tasks import check_plagiarism_task, complete_submission, recheck_submission_task
 from app.services.cache_service import cache_service
+from app.services.plagiarism_detector import corpus_high_water_mark, exact_duplicate_result, find_exact_duplicate
+from app.services.metrics import metrics
+from app.services.document_scope import allows_cross_institution
 
 router = APIRouter()
 
@@ -38,12 +42,70 @@ def check_plagiarism(
             detail="Document not found"
         )
     
-    # Check cache first
-    cached_result = cache_service.get_cached_check(document.content_hash)
+    check_settings = {
+        'check_web': request.check_web,
+        'check_database': request.check_database,
+        'check_institution': request.check_institution,
+        'check_reference': request.check_reference
+    }
+    
+    # Fast path: byte-identical to a document already in the system
+    if request.check_database:
+        start_time = time.time()
+        original = find_exact_duplicate(db, document)
+        if original:
+            submission = Submission(
+                document_id=document.id,
+                user_id=current_user.id,
+                status=SubmissionStatus.PROCESSING,
+                check_settings={**check_settings, 'exact_duplicate_of': original.id}
+            )
+            db.add(submission)
+            db.commit()
+            db.refresh(submission)
+            submission.task_id = f"exact-duplicate-{submission.id}"
+            submission.corpus_high_water_mark = corpus_high_water_mark(db)
+            
+            originality_score, matches_data = exact_duplicate_result(document, original)
+            complete_submission(
+                db,
+                submission,
+                document,
+                originality_score,
+                matches_data,
+                processing_time=time.time() - start_time
+            )
+            metrics.increment("check.exact_duplicate.count")
+            metrics.observe("check.exact_duplicate.latency_ms", (time.time() - start_time) * 1000)
+            
+            matches = [MatchResponse.model_validate(m) for m in submission.matches]
+            return PlagiarismCheckResponse(
+                submission_id=submission.id,
+                task_id=submission.task_id,
+                status=submission.status,
+                originality_score=submission.originality_score,
+                plagiarism_percentage=submission.plagiarism_percentage,
+                total_matches=submission.total_matches,
+                web_matches=submission.web_matches,
+                database_matches=submission.database_matches,
+                processing_time=submission.processing_time,
+                submitted_at=submission.submitted_at,
+                completed_at=submission.completed_at,
+                matches=matches
+            )
+    
+    # Check cache first (only valid for the same settings and corpus version)
+    cached_result = cache_service.get_cached_check(
+        document.content_hash,
+        check_settings,
+        document.institution_id,
+        cache_service.get_corpus_epoch(document.institution_id, allows_cross_institution(document.institution))
+    )
     if cached_result:
         # Return cached result
         submission = db.query(Submission).filter(
-            Submission.id == cached_result['submission_id']
+            Submission.id == cached_result['submission_id'],
+            Submission.user_id == current_user.id
         ).first()
         
         if submission:
@@ -68,11 +130,7 @@ def check_plagiarism(
         document_id=document.id,
         user_id=current_user.id,
         status=SubmissionStatus.PENDING,
-        check_settings={
-            'check_web': request.check_web,
-            'check_database': request.check_database,
-            'check_institution': request.check_institution
-        }
+        check_settings=check_settings
     )
     
     db.add(submission)
@@ -84,7 +142,8 @@ def check_plagiarism(
         submission_id=submission.id,
         check_web=request.check_web,
         check_database=request.check_database,
-        check_institution=request.check_institution
+        check_institution=request.check_institution,
+        check_reference=request.check_reference
     )
     
     # Update task ID
@@ -107,6 +166,50 @@ def check_plagiarism(
     )
 
 
+@router.post("/recheck/{submission_id}", response_model=PlagiarismCheckResponse, status_code=status.HTTP_202_ACCEPTED)
+def recheck_submission(
+    submission_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Re-check a completed submission against documents added since it was checked"""
+    
+    submission = db.query(Submission).filter(
+        Submission.id == submission_id,
+        Submission.user_id == current_user.id
+    ).first()
+    
+    if not submission:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Submission not found"
+        )
+    
+    if submission.status != SubmissionStatus.COMPLETED:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only completed submissions can be re-checked"
+        )
+    
+    task = recheck_submission_task.delay(submission_id=submission.id)
+    
+    matches = [MatchResponse.model_validate(m) for m in submission.matches]
+    return PlagiarismCheckResponse(
+        submission_id=submission.id,
+        task_id=task.id,
+        status=submission.status,
+        originality_score=submission.originality_score,
+        plagiarism_percentage=submission.plagiarism_percentage,
+        total_matches=submission.total_matches,
+        web_matches=submission.web_matches,
+        database_matches=submission.database_matches,
+        processing_time=submission.processing_time,
+        submitted_at=submission.submitted_at,
+        completed_at=submission.completed_at,
+        matches=matches
+    )
+
+
 @router.get("/status/{submission_id}", response_model=PlagiarismCheckResponse)
 def get_check_status(
     submission_id: int,
@@ -0,0 +1,466 @@
+"""
+Import an offline reference corpus into the fingerprint and vector indexes.
+
+Reads a Wikipedia XML dump (.xml or .xml.bz2), a directory of PDF/DOCX/TXT
+files or a JSONL file (one {"id", "title", "url", "text"} object per line) as
+a stream, so memory stays bounded however large the source is. Records are
+cleaned, chunked, fingerprinted and embedded in a process pool; rows and
+vectors are written one batch at a time, and the number of source records
+fully written is checkpointed so an interrupted import resumes where it
+stopped. Cached check results are invalidated once new documents are in.
+
+Examples:
+    python -m app.commands.import_reference_corpus enwiki-latest-pages-articles.xml.bz2 --corpus enwiki --workers 8
+    python -m app.commands.import_reference_corpus ./textbooks --corpus textbooks
+    python -m app.commands.import_reference_corpus papers.jsonl --corpus papers --no-embed
+"""
+import argparse
+import bz2
+import gzip
+import hashlib
+import itertools
+import json
+import logging
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+from urllib.parse import quote
+from xml.etree import ElementTree
+from app.commands.reindex_embeddings import load_checkpoint, save_checkpoint
+from app.core.config import settings
+from app.database.session import SessionLocal
+from app.models.reference_document import ReferenceDocument
+
+logger = logging.getLogger(__name__)
+
+WIKIPEDIA_URL = "https://en.wikipedia.org/wiki/{title}"
+DOCUMENT_EXTENSIONS = (".pdf", ".docx", ".txt")
+
+
+class ReferenceRecord:
+    """One source document: text inline, or a file the worker parses"""
+    
+    __slots__ = ("external_id", "title", "url", "text", "path", "markup")
+    
+    def __init__(
+        self,
+        external_id: str,
+        title: str,
+        url: Optional[str] = None,
+        text: Optional[str] = None,
+        path: Optional[str] = None,
+        markup: Optional[str] = None
+    ):
+        self.external_id = external_id
+        self.title = title
+        self.url = url
+        self.text = text
+        self.path = path
+        self.markup = markup
+
+
+_WIKI_PATTERNS = [
+    (re.compile(r"<!--.*?-->", re.S), ""),
+    (re.compile(r"<ref[^>/]*/>|<ref[^>]*>.*?</ref>", re.S | re.I), ""),
+    (re.compile(r"\{\|.*?\|\}", re.S), ""),  # Tables
+    (re.compile(r"\[\[(?:File|Image|Category):[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]", re.I), ""),
+    (re.compile(r"\[\[[^\]|]*\|([^\]]*)\]\]"), r"\1"),
+    (re.compile(r"\[\[([^\]]*)\]\]"), r"\1"),
+    (re.compile(r"\[https?://[^\s\]]+\s([^\]]*)\]"), r"\1"),
+    (re.compile(r"\[https?://[^\]]*\]"), ""),
+    (re.compile(r"'{2,}"), ""),
+    (re.compile(r"^=+\s*(.*?)\s*=+\s*$", re.M), r"\1."),
+    (re.compile(r"<[^>]+>"), ""),
+    (re.compile(r"^[*#:;]+\s*", re.M), ""),
+]
+_WIKI_TEMPLATE = re.compile(r"\{\{[^{}]*\}\}")
+
+
+def strip_wikitext(text: str) -> str:
+    """Plain prose from MediaWiki markup (templates, tables, references and link syntax removed)"""
+    # Templates nest: remove innermost ones until none are left
+    for _ in range(10):
+        text, removed = _WIKI_TEMPLATE.subn("", text)
+        if not removed:
+            break
+    for pattern, replacement in _WIKI_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _local_name(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child(element, name: str):
+    for child in element:
+        if _local_name(child.tag) == name:
+            return child
+    return None
+
+
+def iter_wikipedia(path: str, url_template: Optional[str] = None) -> Iterator[ReferenceRecord]:
+    """Articles (namespace 0, no redirects) of a MediaWiki XML dump, parsed incrementally"""
+    url_template = url_template or WIKIPEDIA_URL
+    opener = bz2.open if path.endswith(".bz2") else open
+    with opener(path, "rb") as handle:
+        context = ElementTree.iterparse(handle, events=("start", "end"))
+        _, root = next(context)
+        for event, element in context:
+            if event != "end" or _local_name(element.tag) != "page":
+                continue
+            
+            namespace, page_id, title = _child(element, "ns"), _child(element, "id"), _child(element, "title")
+            revision = _child(element, "revision")
+            text = _child(revision, "text") if revision is not None else None
+            if (
+                (namespace is None or namespace.text == "0")
+                and _child(element, "redirect") is None
+                and page_id is not None and title is not None
+                and text is not None and text.text
+            ):
+                yield ReferenceRecord(
+                    page_id.text,
+                    title.text,
+                    url=url_template.format(title=quote(title.text.replace(" ", "_"))),
+                    text=text.text,
+                    markup="wikitext"
+                )
+            # Drop parsed pages so memory stays flat over the whole dump
+            root.clear()
+
+
+def iter_directory(path: str, url_template: Optional[str] = None) -> Iterator[ReferenceRecord]:
+    """PDF, DOCX and TXT files under a directory, in a stable (sorted) order"""
+    for directory, subdirectories, filenames in os.walk(path):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if not filename.lower().endswith(DOCUMENT_EXTENSIONS):
+                continue
+            file_path = os.path.join(directory, filename)
+            relative = os.path.relpath(file_path, path)
+            yield ReferenceRecord(
+                relative,
+                os.path.splitext(filename)[0],
+                url=url_template.format(title=quote(relative)) if url_template else None,
+                path=file_path
+            )
+
+
+def iter_jsonl(path: str, url_template: Optional[str] = None) -> Iterator[ReferenceRecord]:
+    """One JSON object per line with text (or content) and optional id, title and url"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as handle:
+        for line_number, line in enumerate(handle, 1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                logger.warning(f"Skipping malformed line {line_number}")
+                continue
+            text = item.get("text") or item.get("content")
+            if not text:
+                continue
+            external_id = str(item.get("id", line_number))
+            title = item.get("title") or external_id
+            url = item.get("url") or (url_template.format(title=quote(title)) if url_template else None)
+            yield ReferenceRecord(external_id, title, url=url, text=text)
+
+
+SOURCES = {
+    "wikipedia": iter_wikipedia,
+    "directory": iter_directory,
+    "jsonl": iter_jsonl
+}
+
+
+def detect_format(path: str) -> str:
+    if os.path.isdir(path):
+        return "directory"
+    if re.search(r"\.xml(\.bz2)?$", path):
+        return "wikipedia"
+    if re.search(r"\.jsonl?(\.gz)?$", path):
+        return "jsonl"
+    raise ValueError(f"Cannot tell the format of {path}; pass --format")
+
+
+_worker = None
+
+
+def _prepare_batch(item: Tuple[List[ReferenceRecord], bool]) -> List[Tuple]:
+    """
+    Clean, chunk, fingerprint and (optionally) embed a batch of records (runs in a
+    worker process). Returns (record, content, chunks, signatures, embeddings) per
+    record; embeddings is None when they could not be generated.
+    """
+    from app.services.document_parser import DocumentParser
+    from app.services.indexing_service import IndexingService
+    from app.services.minhash_service import get_minhash_service
+    global _worker
+    
+    if _worker is None:
+        _worker = IndexingService()
+    hasher = get_minhash_service().hasher
+    
+    records, embed = item
+    prepared = []
+    for record in records:
+        try:
+            text = record.text if record.path is None else DocumentParser.parse_document(record.path)
+        except Exception as e:
+            logger.warning(f"Skipping {record.external_id}: {e}")
+            text = ""
+        if record.markup == "wikitext":
+            text = strip_wikitext(text)
+        content = _worker.text_processor.clean_text(text or "")[:settings.REFERENCE_MAX_DOCUMENT_CHARS]
+        chunks = _worker.text_processor.chunk_text(content, settings.CHUNK_SIZE, settings.OVERLAP)
+        signatures = hasher.to_bytes(hasher.chunk_signatures(chunks))
+        # Ship plain strings back; chunk offsets are not needed by the writer
+        prepared.append([record, content, [str(chunk) for chunk in chunks], signatures, []])
+    
+    # One embedding call for every chunk in the batch
+    if embed:
+        all_chunks = [chunk for entry in prepared for chunk in entry[2]]
+        embeddings = _worker.embedding_service.generate_embeddings(all_chunks)
+        offset = 0
+        for entry in prepared:
+            count = len(entry[2])
+            entry[4] = embeddings[offset:offset + count] if embeddings is not None else None
+            offset += count
+    return [tuple(entry) for entry in prepared]
+
+
+class ReferenceImporter:
+    """Streams a reference corpus into the database and vector index with checkpointing"""
+    
+    def __init__(
+        self,
+        source: str,
+        corpus: str,
+        source_format: Optional[str] = None,
+        url_template: Optional[str] = None,
+        workers: int = 0,
+        batch_size: int = 256,
+        checkpoint_path: Optional[str] = None,
+        resume: bool = True,
+        embed: bool = True,
+        limit: Optional[int] = None
+    ):
+        self.source = source
+        self.corpus = corpus
+        self.source_format = source_format or detect_format(source)
+        self.url_template = url_template
+        self.workers = workers
+        self.batch_size = batch_size
+        self.checkpoint_path = checkpoint_path or f"./reference_import_{corpus}.json"
+        self.embed = embed
+        self.limit = limit
+        
+        self.state = load_checkpoint(self.checkpoint_path) if resume else {}
+        if self.state.get("finished") or self.state.get("source") != os.path.abspath(source):
+            self.state = {}
+        self.position = self.state.get("records", 0)
+        self.documents = 0
+        self.chunks = 0
+        self.skipped = 0
+        self.failed = 0
+        self.started = time.time()
+    
+    def _batches(self) -> Iterator[Tuple[int, List[ReferenceRecord]]]:
+        """(records consumed, records still to import) per batch, after the checkpointed position"""
+        records = SOURCES[self.source_format](self.source, self.url_template)
+        records = itertools.islice(records, self.position, self.limit)
+        while True:
+            batch = list(itertools.islice(records, self.batch_size))
+            if not batch:
+                return
+            yield len(batch), batch
+    
+    def _pending(self, db, batch: List[ReferenceRecord]) -> List[ReferenceRecord]:
+        """Records not yet fully imported (last one wins for repeated ids)"""
+        by_id = {record.external_id: record for record in batch}
+        done = db.query(ReferenceDocument.external_id).filter(
+            ReferenceDocument.corpus == self.corpus,
+            ReferenceDocument.external_id.in_(list(by_id))
+        )
+        if self.embed:
+            done = done.filter(ReferenceDocument.embedding_stored.is_(True))
+        done = {row.external_id for row in done}
+        db.rollback()
+        self.skipped += len(batch) - len(by_id) + len(done)
+        return [record for external_id, record in by_id.items() if external_id not in done]
+    
+    def run(self) -> Dict:
+        """Import every record of the source, returning the throughput report"""
+        from app.database.vector_db import vector_db
+        
+        if self.embed and not vector_db.is_available():
+            raise RuntimeError("Vector database is not available (use --no-embed for fingerprints only)")
+        
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 0 else None
+        db = SessionLocal()
+        # Parsed-ahead batches are bounded so a fast reader cannot outrun the writer
+        in_flight: "deque[Tuple[int, Future]]" = deque()
+        try:
+            for consumed, batch in self._batches():
+                item = (self._pending(db, batch), self.embed)
+                if pool is None:
+                    self._write(db, consumed, _prepare_batch(item))
+                    continue
+                in_flight.append((consumed, pool.submit(_prepare_batch, item)))
+                while len(in_flight) >= self.workers * 2:
+                    consumed, future = in_flight.popleft()
+                    self._write(db, consumed, future.result())
+            while in_flight:
+                consumed, future = in_flight.popleft()
+                self._write(db, consumed, future.result())
+        finally:
+            db.close()
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            if self.documents:
+                self._invalidate_cached_checks()
+        
+        report = self.report()
+        self.state.update({"finished": True, "report": report})
+        save_checkpoint(self.checkpoint_path, self.state)
+        return report
+    
+    def _write(self, db, consumed: int, prepared: List[Tuple]):
+        """Store one prepared batch (rows, then vectors) and advance the checkpoint"""
+        from app.database.vector_db import vector_db
+        from app.services.reference_corpus import reference_records
+        
+        external_ids = [record.external_id for record, *_ in prepared]
+        existing = {
+            document.external_id: document
+            for document in db.query(ReferenceDocument).filter(
+                ReferenceDocument.corpus == self.corpus,
+                ReferenceDocument.external_id.in_(external_ids)
+            )
+        } if external_ids else {}
+        
+        written = []
+        for record, content, chunks, signatures, embeddings in prepared:
+            if not chunks:
+                self.skipped += 1
+                continue
+            document = existing.get(record.external_id)
+            if document is None:
+                document = ReferenceDocument(corpus=self.corpus, external_id=record.external_id)
+                db.add(document)
+            document.title = record.title
+            document.url = record.url
+            document.content = content
+            document.content_hash = hashlib.sha256(content.encode()).hexdigest()
+            document.word_count = len(content.split())
+            document.minhash_signatures = signatures
+            document.embedding_stored = False
+            written.append((document, chunks, embeddings))
+            self.documents += 1
+            self.chunks += len(chunks)
+        db.commit()
+        
+        if self.embed and written:
+            replaced = [document.id for document in existing.values()]
+            if replaced:
+                vector_db.delete_reference_vectors(replaced)
+            
+            ids, texts, vectors, metadatas, stored = [], [], [], [], []
+            for document, chunks, embeddings in written:
+                if embeddings is None:
+                    self.failed += 1
+                    continue
+                metadata = {'corpus': self.corpus, 'title': document.title, 'url': document.url}
+                for target, values in zip((ids, texts, vectors, metadatas), reference_records(
+                    document.id, metadata, chunks, embeddings
+                )):
+                    target.extend(values)
+                stored.append(document)
+            if ids:
+                vector_db.add_documents(ids, texts, vectors, metadatas)
+            for document in stored:
+                document.embedding_stored = True
+            db.commit()
+        
+        # Everything up to the end of this batch is durable before checkpointing
+        self.position += consumed
+        self.state.update({
+            "source": os.path.abspath(self.source),
+            "corpus": self.corpus,
+            "records": self.position,
+            "finished": False
+        })
+        save_checkpoint(self.checkpoint_path, self.state)
+        
+        elapsed = time.time() - self.started
+        logger.info(
+            f"{self.position} records, {self.documents} documents, {self.chunks} chunks "
+            f"({self.documents / elapsed:.1f} docs/s, {self.chunks / elapsed:.1f} chunks/s)"
+        )
+    
+    def _invalidate_cached_checks(self):
+        from app.services.cache_service import cache_service
+        
+        if cache_service.bump_corpus_epoch() is None:
+            logger.warning("Could not bump the corpus epoch; cached check results may miss the new documents")
+    
+    def report(self) -> Dict:
+        elapsed = time.time() - self.started
+        return {
+            "corpus": self.corpus,
+            "format": self.source_format,
+            "records": self.position,
+            "documents": self.documents,
+            "chunks": self.chunks,
+            "skipped": self.skipped,
+            "failed_embeddings": self.failed,
+            "elapsed_seconds": round(elapsed, 2),
+            "documents_per_second": round(self.documents / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_second": round(self.chunks / elapsed, 2) if elapsed else 0.0
+        }
+
+
+def main():
+    from app.database.session import init_db
+    
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Wikipedia dump, directory of documents or JSONL file")
+    parser.add_argument("--corpus", required=True, help="Corpus name stored with every document (e.g. enwiki)")
+    parser.add_argument("--format", choices=sorted(SOURCES), help="Source format (detected from the path by default)")
+    parser.add_argument("--url-template", help="Source URL pattern with a {title} placeholder")
+    parser.add_argument("--workers", type=int, default=0, help="Process pool size (0 = in-process)")
+    parser.add_argument("--batch-size", type=int, default=256, help="Records prepared and written per batch")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default ./reference_import_<corpus>.json)")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--no-embed", action="store_true", help="Fingerprints only, no vectors")
+    parser.add_argument("--limit", type=int, help="Stop after this many source records")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    importer = ReferenceImporter(
+        args.source,
+        args.corpus,
+        source_format=args.format,
+        url_template=args.url_template,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        checkpoint_path=args.checkpoint,
+        resume=not args.restart,
+        embed=not args.no_embed,
+        limit=args.limit
+    )
+    if importer.position:
+        print(f"Resuming after record {importer.position}")
+    
+    report = importer.run()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,53 @@
+"""
+Recount the corpus document-frequency table used by the web query planner.
+
+Uploads and deletes keep the table current; run this once to backfill
+documents ingested before the table existed, or after restoring Redis.
+
+Example:
+    python -m app.commands.rebuild_document_frequencies --batch-size 500
+"""
+import argparse
+import logging
+import time
+from typing import Iterator
+from app.database.session import SessionLocal
+from app.models.document import Document
+
+logger = logging.getLogger(__name__)
+
+
+def iter_contents(batch_size: int) -> Iterator[str]:
+    """Document texts in id order, one keyset page at a time"""
+    db = SessionLocal()
+    try:
+        after_id = 0
+        while True:
+            rows = db.query(Document.id, Document.content).filter(
+                Document.id > after_id
+            ).order_by(Document.id).limit(batch_size).all()
+            db.rollback()
+            if not rows:
+                return
+            for row in rows:
+                yield row.content or ""
+            after_id = rows[-1].id
+    finally:
+        db.close()
+
+
+def main():
+    from app.services.query_planner import document_frequencies
+    
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=500, help="Documents read per query")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    started = time.time()
+    documents = document_frequencies.rebuild(iter_contents(args.batch_size))
+    print(f"Counted {documents} documents in {time.time() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,269 @@
+"""
+Rebuild the vector index from the documents table.
+
+Pages through documents in id order, re-chunks and batch-embeds them (optionally
+in a process pool), writes vectors in large batches and checkpoints the
+last fully written document id so an interrupted run can resume (a checkpoint
+written with other --all / --institution-id options is discarded). Each
+document's analysis sidecar is rewritten with its new embeddings. Shards whose
+IVF index has grown enough are retrained at the end.
+
+Examples:
+    python -m app.commands.reindex_embeddings                # stale documents only
+    python -m app.commands.reindex_embeddings --all --workers 4
+    python -m app.commands.reindex_embeddings --all --dry-run
+"""
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import update
+from app.database.session import SessionLocal
+from app.models.document import Document
+
+logger = logging.getLogger(__name__)
+
+_indexer = None
+
+
+def _prepare_document(
+    item: Tuple[int, str, Optional[str], bool]
+) -> Tuple[int, List[str], Optional[List[List[float]]]]:
+    """Chunk and embed one document and rewrite its analysis sidecar (runs in a worker process)"""
+    from app.services.indexing_service import IndexingService
+    global _indexer
+    
+    if _indexer is None:
+        _indexer = IndexingService()
+    
+    document_id, content, content_hash, embed = item
+    chunks = _indexer.chunk_document(content)
+    if not embed:
+        return document_id, chunks, []
+    embeddings = _indexer.embedding_service.generate_embeddings(chunks) if chunks else []
+    # The sidecar only needs the document's id, text and hash
+    document = SimpleNamespace(id=document_id, content=content, content_hash=content_hash)
+    _indexer.analyze_document(document, embeddings or None)
+    return document_id, chunks, embeddings
+
+
+def load_checkpoint(path: str) -> Dict:
+    if os.path.exists(path):
+        with open(path) as handle:
+            return json.load(handle)
+    return {}
+
+
+def save_checkpoint(path: str, state: Dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as handle:
+        json.dump(state, handle)
+    os.replace(tmp_path, path)
+
+
+class Reindexer:
+    """Streams documents into the vector index with checkpointing"""
+    
+    def __init__(
+        self,
+        stale_only: bool = True,
+        institution_id: Optional[int] = None,
+        workers: int = 0,
+        batch_size: int = 64,
+        write_batch: int = 2000,
+        checkpoint_path: str = "./reindex_checkpoint.json",
+        resume: bool = True,
+        dry_run: bool = False
+    ):
+        self.stale_only = stale_only
+        self.institution_id = institution_id
+        self.workers = workers
+        self.batch_size = batch_size
+        self.write_batch = write_batch
+        self.checkpoint_path = checkpoint_path
+        self.resume = resume
+        self.dry_run = dry_run
+        
+        self.options = {"stale_only": stale_only, "institution_id": institution_id}
+        self.state = load_checkpoint(checkpoint_path) if resume else {}
+        # A position from a run over a different document set would skip documents
+        if self.state.get("finished") or self.state.get("options") != self.options:
+            self.state = {"options": self.options}
+        self.last_id = self.state.get("last_id", 0)
+        self.documents = 0
+        self.chunks = 0
+        self.failed: List[int] = []
+        self.started = time.time()
+        
+        self._pending: Tuple[List, List, List, List] = ([], [], [], [])
+        self._written_ids: Dict[str, List[int]] = {}
+    
+    def _query(self, db, after_id: int):
+        query = db.query(
+            Document.id,
+            Document.content,
+            Document.content_hash,
+            Document.user_id,
+            Document.institution_id,
+            Document.original_filename,
+            Document.word_count,
+            Document.doc_metadata
+        ).filter(Document.id > after_id)
+        
+        if self.stale_only:
+            query = query.filter(Document.embedding_stored.isnot(True))
+        if self.institution_id is not None:
+            query = query.filter(Document.institution_id == self.institution_id)
+        
+        return query.order_by(Document.id).limit(self.batch_size)
+    
+    def run(self) -> Dict:
+        """Process every matching document, returning the throughput report"""
+        from app.database.vector_db import vector_db
+        
+        if not self.dry_run and not vector_db.is_available():
+            raise RuntimeError("Vector database is not available")
+        
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 0 else None
+        read_db = SessionLocal()
+        try:
+            # Keyset pages keep memory bounded without holding a read cursor
+            # (and SQLite's shared lock) open while vectors are written
+            after_id = self.last_id
+            while True:
+                batch = self._query(read_db, after_id).all()
+                read_db.rollback()
+                if not batch:
+                    break
+                self._process_batch(batch, pool)
+                after_id = batch[-1].id
+        finally:
+            read_db.close()
+            if pool is not None:
+                pool.shutdown()
+        
+        report = self.report()
+        if not self.dry_run:
+            report["retrained_shards"] = vector_db.train_indexes()
+            self.state.update({"finished": True, "report": report})
+            save_checkpoint(self.checkpoint_path, self.state)
+        return report
+    
+    def _process_batch(self, rows, pool: Optional[ProcessPoolExecutor]):
+        from app.database.vector_db import shard_for
+        from app.services.indexing_service import build_records, document_metadata
+        
+        items = [(row.id, row.content, row.content_hash, not self.dry_run) for row in rows]
+        if pool is not None:
+            prepared = list(pool.map(_prepare_document, items, chunksize=max(1, len(items) // (self.workers * 4))))
+        else:
+            prepared = [_prepare_document(item) for item in items]
+        
+        for row, (document_id, chunks, embeddings) in zip(rows, prepared):
+            self.documents += 1
+            self.chunks += len(chunks)
+            if self.dry_run:
+                continue
+            if embeddings is None:
+                self.failed.append(document_id)
+                continue
+            
+            metadata = document_metadata(row)
+            records = build_records(document_id, metadata, chunks, embeddings)
+            for target, values in zip(self._pending, records):
+                target.extend(values)
+            self._written_ids.setdefault(shard_for(metadata), []).append(document_id)
+            
+            if len(self._pending[0]) >= self.write_batch:
+                self._flush()
+        
+        # Everything up to the last row of this batch is durable before checkpointing
+        if not self.dry_run:
+            self._flush()
+            self.last_id = rows[-1].id
+            self.state.update({"last_id": self.last_id, "finished": False})
+            save_checkpoint(self.checkpoint_path, self.state)
+        
+        elapsed = time.time() - self.started
+        logger.info(
+            f"{self.documents} documents, {self.chunks} chunks "
+            f"({self.documents / elapsed:.1f} docs/s, {self.chunks / elapsed:.1f} chunks/s)"
+        )
+    
+    def _flush(self):
+        """Write pending vectors and mark their documents as stored"""
+        from app.database.vector_db import vector_db
+        
+        ids, texts, embeddings, metadatas = self._pending
+        # Old vectors live in the shard the document maps to; no other shard is scanned
+        for shard, document_ids in self._written_ids.items():
+            vector_db.delete_document_vectors(document_ids, shards=[shard])
+        if ids:
+            vector_db.add_documents(ids, texts, embeddings, metadatas)
+        
+        written = [document_id for document_ids in self._written_ids.values() for document_id in document_ids]
+        if written:
+            db = SessionLocal()
+            try:
+                db.execute(
+                    update(Document)
+                    .where(Document.id.in_(written))
+                    .values(embedding_stored=True)
+                )
+                db.commit()
+            finally:
+                db.close()
+        
+        self._pending = ([], [], [], [])
+        self._written_ids = {}
+    
+    def report(self) -> Dict:
+        elapsed = time.time() - self.started
+        return {
+            "dry_run": self.dry_run,
+            "documents": self.documents,
+            "chunks": self.chunks,
+            "failed": self.failed,
+            "last_id": self.last_id,
+            "elapsed_seconds": round(elapsed, 2),
+            "documents_per_second": round(self.documents / elapsed, 2) if elapsed else 0.0,
+            "chunks_per_second": round(self.chunks / elapsed, 2) if elapsed else 0.0
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--all", action="store_true", help="Re-index every document, not just stale ones")
+    parser.add_argument("--institution-id", type=int, help="Only documents of this institution")
+    parser.add_argument("--workers", type=int, default=0, help="Process pool size (0 = in-process)")
+    parser.add_argument("--batch-size", type=int, default=64, help="Documents fetched and embedded per batch")
+    parser.add_argument("--write-batch", type=int, default=2000, help="Vectors per index write")
+    parser.add_argument("--checkpoint", default="./reindex_checkpoint.json", help="Checkpoint file")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Only count documents and chunks")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    reindexer = Reindexer(
+        stale_only=not args.all,
+        institution_id=args.institution_id,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        write_batch=args.write_batch,
+        checkpoint_path=args.checkpoint,
+        resume=not args.restart,
+        dry_run=args.dry_run
+    )
+    if reindexer.last_id:
+        print(f"Resuming after document {reindexer.last_id}")
+    
+    report = reindexer.run()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -42,32 +42,146 @@ class Settings(BaseSettings):
     GROQ_MODEL: str = "llama-3.1-70b-versatile"
     
     GEMINI_API_KEY: Optional[str] = None
+    
+    # AI call scheduling; limits are per worker process (account limit / processes)
+    AI_REQUEST_DEADLINE_SECONDS: float = 30.0  # Queueing plus call, per request
+    AI_COST_PER_SECOND: float = 0.001  # USD one second of latency is worth, when picking a provider
+    AI_DEFAULT_LATENCY_MS: float = 1500.0  # Until a provider has latency history
+    AI_WORKERS: int = 16  # Threads running blocking provider calls
+    AI_TIMEOUT: float = 30.0  # Per provider HTTP call
+    AI_HTTP_MAX_CONNECTIONS: int = 20  # Keep-alive pool per provider SDK
+    AI_PARAPHRASE_TOKEN_BUDGET: int = 300  # Text tokens (both sides) per paraphrase prompt
+    AI_SUMMARY_TOKEN_BUDGET: int = 1500  # Text tokens per summary prompt
+    AI_ALIGN_MIN_SIMILARITY: float = 15.0  # Sentence pairs aligned below this (Jaccard 0-100) are left out
+    GROQ_RPM: int = 30  # 0 = unlimited
+    GROQ_TPM: int = 6000
+    GROQ_MAX_CONCURRENCY: int = 4
+    GROQ_COST_PER_1K_TOKENS: float = 0.0006
+    GEMINI_RPM: int = 60
+    GEMINI_TPM: int = 32000
+    GEMINI_MAX_CONCURRENCY: int = 4
+    GEMINI_COST_PER_1K_TOKENS: float = 0.0005
+    OPENAI_RPM: int = 500
+    OPENAI_TPM: int = 60000
+    OPENAI_MAX_CONCURRENCY: int = 8
+    OPENAI_COST_PER_1K_TOKENS: float = 0.0015
 
     # Search APIs
     SERPAPI_KEY: Optional[str] = None
     SERPER_API_KEY: Optional[str] = None
     USE_DUCKDUCKGO: bool = True
+    SERPER_MONTHLY_QUOTA: int = 2500  # 0 = unlimited
+    SERPAPI_MONTHLY_QUOTA: int = 100
+    SEARCH_HEDGE: bool = True  # Query the next provider when the current one is slower than usual
+    SEARCH_HEDGE_PERCENTILE: float = 95.0
+    SEARCH_HEDGE_MIN_MS: float = 300.0
+    SEARCH_HEDGE_MAX_MS: float = 3000.0  # Also the delay before a provider has latency history
+    SEARCH_TIMEOUT: float = 15.0  # Per query, across all providers
+    SEARCH_WORKERS: int = 8
+    CIRCUIT_BREAKER_FAILURES: int = 5  # Consecutive failures before a provider is skipped
+    CIRCUIT_BREAKER_COOLDOWN_SECONDS: float = 60.0
+
+    # Shared HTTP connection pools (per worker process)
+    HTTP_POOL_CONNECTIONS: int = 20  # Hosts kept pooled per session
+    HTTP_POOL_MAXSIZE: int = 20  # Keep-alive connections per host
+    HTTP_KEEPALIVE_SECONDS: float = 60.0  # Idle time before an httpx connection is closed
 
     # Embeddings
     USE_LOCAL_EMBEDDINGS: bool = True
     EMBEDDING_MODEL: str = "sentence-transformers/all-MiniLM-L6-v2"
     DEVICE: str = "cpu"
+    ENABLE_EMBEDDING_CACHE: bool = True
+    EMBEDDING_CACHE_PATH: str = "./embedding_cache/embeddings.sqlite3"
+    EMBEDDING_CACHE_DTYPE: str = "float16"  # float16 or float32
+    EMBEDDING_CACHE_MEMORY_ITEMS: int = 10000
+    EMBEDDING_CACHE_VERSION: str = "1"  # Bump to invalidate cached vectors
+    EMBEDDING_SERVER_ADDRESS: Optional[str] = None  # e.g. /tmp/embeddings.sock or 127.0.0.1:8765
+    EMBEDDING_SERVER_MAX_BATCH: int = 64
+    EMBEDDING_SERVER_MAX_WAIT_MS: float = 10.0
+    EMBEDDING_SERVER_FALLBACK_LOCAL: bool = True
+    EMBEDDING_SERVER_RETRY_SECONDS: float = 30.0  # Treat the server as down this long after a failed connect or timeout
+    EMBEDDING_SERVER_TIMEOUT: float = 30.0  # Wait this long for a reply before embedding locally
 
     # Vector Database
-    USE_VECTOR_DB: str = "chroma"
+    USE_VECTOR_DB: str = "chroma"  # chroma or local
     CHROMA_PERSIST_DIR: str = "./chroma_db"
+    LOCAL_VECTOR_DIR: str = "./vector_index"
+    LOCAL_VECTOR_INDEX_TYPE: str = "flat"  # flat, ivf or ivfpq
+    LOCAL_VECTOR_IVF_MIN_ROWS: int = 50000  # Exact search below this size
+    LOCAL_VECTOR_TRAIN_INTERVAL_SECONDS: int = 3600  # Celery beat retrains grown IVF indexes this often
+    LOCAL_VECTOR_IVF_NLIST: int = 0  # 0 = sqrt(rows)
+    LOCAL_VECTOR_IVF_NPROBE: int = 8
+    LOCAL_VECTOR_PQ_SUBVECTORS: int = 16
+    LOCAL_VECTOR_PQ_RERANK: int = 10  # Exact re-rank n_results * this many PQ candidates
+    VECTOR_SHARD_BY: str = "institution"  # none, institution or institution_term
+    VECTOR_SEARCH_WORKERS: int = 8
+    VECTOR_CROSS_INSTITUTION_SEARCH: bool = False  # Institutions can also opt in via settings.allow_cross_check
 
     # Detection
     EXACT_MATCH_THRESHOLD: float = 90.0
     PARAPHRASE_THRESHOLD: float = 75.0
     SEMANTIC_SIMILARITY_THRESHOLD: float = 0.85
     MIN_MATCH_LENGTH: int = 8
+    # Local paraphrase scores (0-100) settle clear cases; the band between goes to the AI
+    ENABLE_LOCAL_PARAPHRASE: bool = True
+    PARAPHRASE_LOCAL_ACCEPT: float = 75.0
+    PARAPHRASE_LOCAL_REJECT: float = 50.0
+    PARAPHRASE_AUDIT_RATE: float = 0.05  # Locally settled pairs also sent to the AI, to track agreement
     CHUNK_SIZE: int = 100
     OVERLAP: int = 20
+    # End chunks on sentence boundaries (fixed word windows when False)
+    SENTENCE_AWARE_CHUNKING: bool = True
+    
+    # MinHash / LSH candidate retrieval
+    ENABLE_LSH_CANDIDATES: bool = True
+    MINHASH_NUM_PERM: int = 128
+    MINHASH_SHINGLE_SIZE: int = 5  # Words per shingle
+    LSH_BANDS: int = 42  # bands * rows must not exceed MINHASH_NUM_PERM
+    LSH_ROWS: int = 3  # Threshold ~ (1 / bands) ** (1 / rows): more rows = higher precision
+    LSH_MIN_BAND_HITS: int = 1
+    
+    # SimHash near-duplicate detection
+    SIMHASH_MAX_DISTANCE: int = 3  # Hamming bits; the index uses this + 1 blocks
+    ENABLE_NEAR_DUPLICATE_SHORTCUT: bool = True
+    
+    # Ingest-time analysis sidecars (token hashes, chunk bounds, shingles, keywords, embeddings)
+    ENABLE_ANALYSIS_SIDECAR: bool = True
+    ANALYSIS_DIR: str = "./analysis"
+    
+    # Web search planning: rare quoted phrases from a corpus document-frequency table
+    ENABLE_QUERY_PLANNER: bool = True
+    WEB_SEARCH_BUDGET: int = 10  # Searches per check
+    QUERY_PHRASE_WORDS: int = 8
+    QUERY_QUOTE_PHRASES: bool = True  # Exact-phrase queries
+    WEB_WINDOW_WORDS: int = 100  # Fetched pages are compared window by window
+    WEB_WINDOW_STEP: int = 20
+    WEB_MAX_PAGE_WORDS: int = 20000  # Tokens of a page considered at all
+    WEB_FETCH_MAX_BYTES: int = 2000000  # Response bodies are cut off here
+    WEB_FETCH_TIMEOUT: float = 10.0
+    WEB_FETCH_CONTENT_TYPES: str = "text/html,application/xhtml+xml,text/plain"
+    WEB_EXTRACT_MAX_LINK_DENSITY: float = 0.5  # Link lists with more anchor text than this are dropped
+    
+    # Local corpus of fetched web pages, searched before any search provider
+    ENABLE_WEB_CORPUS: bool = True
+    WEB_CORPUS_SKIP_SEARCH_SCORE: float = 90.0  # Chunks matching a stored page this well are not searched
+    WEB_CORPUS_MAX_PAGES: int = 50000  # Least recently matched pages are dropped beyond this
+    WEB_CORPUS_MAX_AGE_DAYS: int = 90  # Pages not matched for this long are dropped
+    WEB_CORPUS_REFETCH_DAYS: int = 30  # Stored copies older than this are fetched again
+    WEB_CORPUS_MAX_PAGE_CHARS: int = 200000
+    WEB_CORPUS_PRUNE_INTERVAL_SECONDS: int = 3600  # Celery beat runs retention this often
+    
+    # Offline reference corpora (Wikipedia dumps, local document sets) imported in bulk
+    ENABLE_REFERENCE_CORPUS: bool = True
+    REFERENCE_USE_LSH: bool = True  # In-memory fingerprint index; disable for very large corpora (vectors only)
+    REFERENCE_MAX_DOCUMENT_CHARS: int = 500000
+    
+    # Resubmissions: reuse a prior draft's per-chunk results for unchanged chunks
+    ENABLE_REVISION_REUSE: bool = True
+    REVISION_MIN_SIMILARITY: float = 0.5  # MinHash Jaccard with the earlier draft
 
     # API Strategy
     SEARCH_PRIORITY: str = "duckduckgo,serper,serpapi"
-    AI_PRIORITY: str = "groq,gemini,openai"
+    AI_PRIORITY: str = "groq,gemini,openai"  # Providers to use; the scheduler picks among them
     EMBEDDING_PRIORITY: str = "local,openai"
 
     # Rate Limiting
@@ -75,6 +189,13 @@ class Settings(BaseSettings):
     MAX_CONCURRENT_CHECKS: int = 3
     ENABLE_CACHING: bool = True
     CACHE_EXPIRY_HOURS: int = 24
+    CACHE_LOCAL_MAX_ITEMS: int = 10000  # In-process tier in front of Redis
+    CACHE_LOCAL_TTL_SECONDS: int = 60  # Caps staleness of the local tier
+    CACHE_NEGATIVE_TTL_SECONDS: int = 5  # How long a Redis miss is remembered
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_SOCKET_TIMEOUT: float = 1.0
+    REDIS_RETRY_AFTER_SECONDS: int = 30  # Skip Redis this long after an error
+    METRICS_PUBLISH_SECONDS: float = 5.0  # Push each process's metrics to Redis this often (0 = local only)
 
     class Config:
         env_file = ".env"
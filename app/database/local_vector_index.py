@@ -0,0 +1,562 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def matches_where(metadata: Dict, where: Optional[Dict]) -> bool:
+    """Evaluate a Chroma-style metadata filter against one metadata dict"""
+    if not where:
+        return True
+    
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(matches_where(metadata, c) for c in condition):
+                return False
+            continue
+        if key == "$or":
+            if not any(matches_where(metadata, c) for c in condition):
+                return False
+            continue
+        
+        value = metadata.get(key)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        
+        for op, expected in condition.items():
+            if op == "$eq" and value != expected:
+                return False
+            if op == "$ne" and value == expected:
+                return False
+            if op == "$in" and value not in expected:
+                return False
+            if op == "$nin" and value in expected:
+                return False
+            if op in ("$gt", "$gte", "$lt", "$lte"):
+                if value is None:
+                    return False
+                if op == "$gt" and not value > expected:
+                    return False
+                if op == "$gte" and not value >= expected:
+                    return False
+                if op == "$lt" and not value < expected:
+                    return False
+                if op == "$lte" and not value <= expected:
+                    return False
+    return True
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on unit vectors, returns k x dim centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    
+    for _ in range(iterations):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        for c in range(k):
+            members = data[assign == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+            else:
+                centroids[c] = data[rng.integers(len(data))]
+    return centroids
+
+
+def _kmeans_l2(data: np.ndarray, k: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Euclidean k-means used for product-quantizer codebooks"""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(data))
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    
+    for _ in range(iterations):
+        distances = (
+            (data ** 2).sum(axis=1, keepdims=True)
+            - 2 * data @ centroids.T
+            + (centroids ** 2).sum(axis=1)
+        )
+        assign = np.argmin(distances, axis=1)
+        for c in range(k):
+            members = data[assign == c]
+            if len(members):
+                centroids[c] = members.mean(axis=0)
+    return centroids
+
+
+class LocalVectorIndex:
+    """
+    In-process vector collection.
+    Normalised float32 rows are appended to a memory-mapped file (cosine
+    search is a matrix multiply); ids, texts and metadata live in SQLite.
+    Large collections can use an IVF coarse quantizer with optional PQ codes.
+    """
+    
+    SEARCH_BLOCK_ROWS = 65536
+    
+    def __init__(self, path: str, index_type: Optional[str] = None):
+        self.path = path
+        self.index_type = index_type or settings.LOCAL_VECTOR_INDEX_TYPE
+        os.makedirs(path, exist_ok=True)
+        
+        self._vectors_path = os.path.join(path, "vectors.f32")
+        self._ivf_path = os.path.join(path, "ivf.npz")
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(os.path.join(path, "meta.sqlite3"), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS rows ("
+            "row INTEGER PRIMARY KEY, id TEXT NOT NULL, document TEXT, "
+            "metadata TEXT, deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS rows_id ON rows (id)")
+        # Append-only log of deleted rows so other processes apply deletes without a reload
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tombstones (seq INTEGER PRIMARY KEY, row INTEGER NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        
+        self.dim: Optional[int] = None
+        self._matrix: Optional[np.memmap] = None
+        self._ids: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._rows_by_id: Dict[str, int] = {}
+        # Metadata values per key, one entry per row, built on first filter use
+        self._columns: Dict[str, np.ndarray] = {}
+        self._numeric_columns: Dict[str, np.ndarray] = {}
+        self._ivf: Optional[Dict[str, np.ndarray]] = None
+        self._ivf_mtime = None
+        self._data_version = None
+        self._tombstone_seq = 0
+        self._load_dim()
+    
+    def _load_dim(self):
+        row = self._conn.execute("SELECT value FROM info WHERE key = 'dim'").fetchone()
+        if row:
+            self.dim = int(row[0])
+    
+    @contextmanager
+    def _file_lock(self):
+        """Serialise writers across processes sharing the same directory"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.path, ".lock"), "w") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+    
+    def _row_count(self) -> int:
+        if self.dim is None or not os.path.exists(self._vectors_path):
+            return 0
+        return os.path.getsize(self._vectors_path) // (self.dim * 4)
+    
+    def _refresh(self):
+        """Pick up rows and deletes written since the last call, possibly by another process"""
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            # Another connection committed: apply only its deletes (rows past the loaded count follow)
+            self._data_version = version
+            if self.dim is None:
+                self._load_dim()
+            self._apply_tombstones()
+        
+        count = self._row_count()
+        loaded = len(self._ids)
+        if count == 0:
+            self._matrix = None
+            return
+        if count == loaded and self._matrix is not None:
+            self._reload_ivf_if_changed()
+            self._extend_ivf(count)
+            return
+        
+        self._matrix = np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+        if count > loaded:
+            rows = self._conn.execute(
+                "SELECT row, id, metadata, deleted FROM rows WHERE row >= ? AND row < ? ORDER BY row",
+                (loaded, count)
+            ).fetchall()
+            self._ids.extend([""] * (count - loaded))
+            self._metadatas.extend([{}] * (count - loaded))
+            self._alive = np.concatenate([self._alive, np.zeros(count - loaded, dtype=bool)])
+            for row, doc_id, metadata, deleted in rows:
+                self._ids[row] = doc_id
+                self._metadatas[row] = json.loads(metadata) if metadata else {}
+                self._alive[row] = not deleted
+                if not deleted:
+                    self._rows_by_id[doc_id] = row
+        
+        self._reload_ivf_if_changed()
+        self._extend_ivf(count)
+    
+    def _apply_tombstones(self):
+        """Mark rows deleted by any connection since the last call"""
+        tombstones = self._conn.execute(
+            "SELECT seq, row FROM tombstones WHERE seq > ? ORDER BY seq",
+            (self._tombstone_seq,)
+        ).fetchall()
+        if not tombstones:
+            return
+        self._tombstone_seq = tombstones[-1][0]
+        loaded = len(self._ids)
+        for _, row in tombstones:
+            # Rows not loaded yet are read with their deleted flag
+            if row < loaded and self._alive[row]:
+                self._alive[row] = False
+                if self._rows_by_id.get(self._ids[row]) == row:
+                    del self._rows_by_id[self._ids[row]]
+    
+    def _reload_ivf_if_changed(self):
+        """Load the quantizer on first use and again after any process retrains it"""
+        mtime = os.path.getmtime(self._ivf_path) if os.path.exists(self._ivf_path) else None
+        if mtime != self._ivf_mtime:
+            self._ivf_mtime = mtime
+            self._ivf = self._load_ivf()
+    
+    def _load_ivf(self) -> Optional[Dict[str, np.ndarray]]:
+        if self.index_type == "flat" or not os.path.exists(self._ivf_path):
+            return None
+        try:
+            with np.load(self._ivf_path) as data:
+                return {key: data[key] for key in data.files}
+        except Exception as e:
+            logger.error(f"Failed to load IVF index for {self.path}: {e}")
+            return None
+    
+    def _extend_ivf(self, count: int):
+        """Assign rows appended after training to their nearest centroid"""
+        ivf = self._ivf
+        if ivf is None or len(ivf["assign"]) >= count:
+            return
+        extra = np.asarray(self._matrix[len(ivf["assign"]):count])
+        ivf["assign"] = np.concatenate([ivf["assign"], np.argmax(extra @ ivf["centroids"].T, axis=1)])
+        if "codebooks" in ivf:
+            ivf["codes"] = np.concatenate([ivf["codes"], self._encode_pq(extra, ivf["codebooks"])])
+    
+    def _delete_rows(self, ids: List[str]):
+        """Flag live rows of ids as deleted and log them (caller holds the file lock and commits)"""
+        params = [(doc_id,) for doc_id in ids]
+        self._conn.executemany(
+            "INSERT INTO tombstones (row) SELECT row FROM rows WHERE id = ? AND deleted = 0",
+            params
+        )
+        self._conn.executemany("UPDATE rows SET deleted = 1 WHERE id = ? AND deleted = 0", params)
+    
+    def count(self) -> int:
+        """Number of live vectors"""
+        with self._lock:
+            self._refresh()
+            return int(self._alive.sum())
+    
+    def add(
+        self,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict]
+    ):
+        """Append vectors; an existing id is replaced"""
+        if not ids:
+            return
+        
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms == 0, 1.0, norms)
+        
+        with self._lock, self._file_lock():
+            self._refresh()
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('dim', ?)", (str(self.dim),))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+            
+            start = self._row_count()
+            self._delete_rows(ids)
+            self._conn.executemany(
+                "INSERT INTO rows (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (start + i, doc_id, document, json.dumps(metadata or {}))
+                    for i, (doc_id, document, metadata) in enumerate(zip(ids, documents, metadatas))
+                ]
+            )
+            with open(self._vectors_path, "ab") as handle:
+                handle.write(vectors.tobytes())
+            self._conn.commit()
+            # data_version only moves for other connections' commits
+            self._apply_tombstones()
+            self._refresh()
+    
+    def delete(self, ids: List[str]):
+        """Mark vectors as deleted"""
+        with self._lock, self._file_lock():
+            self._refresh()
+            self._delete_rows(ids)
+            self._conn.commit()
+            self._apply_tombstones()
+    
+    def delete_where(self, where: Dict):
+        """Mark every vector whose metadata matches the filter as deleted"""
+        with self._lock:
+            self._refresh()
+            ids = [self._ids[row] for row in np.flatnonzero(self._candidate_mask(where))]
+        if ids:
+            self.delete(ids)
+    
+    def get(self, doc_id: str) -> Optional[Dict]:
+        """Fetch a stored vector's text and metadata"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, document, metadata FROM rows WHERE id = ? AND deleted = 0 ORDER BY row DESC LIMIT 1",
+                (doc_id,)
+            ).fetchone()
+        if not row:
+            return None
+        return {"id": row[0], "document": row[1], "metadata": json.loads(row[2]) if row[2] else {}}
+    
+    def maybe_train(self) -> bool:
+        """
+        (Re)train the coarse quantizer once the collection is large enough
+        (or has doubled since the last training). Slow on large collections,
+        so it runs from the reindex command and a Celery beat task, never on
+        the upload path.
+        """
+        if self.index_type == "flat":
+            return False
+        with self._lock:
+            self._refresh()
+            count = len(self._ids)
+            trained = int(self._ivf["trained_rows"]) if self._ivf is not None else 0
+        if count < settings.LOCAL_VECTOR_IVF_MIN_ROWS or (trained and count < trained * 2):
+            return False
+        self.train()
+        return True
+    
+    def train(self):
+        """Train IVF centroids (and PQ codebooks) over the current vectors"""
+        with self._lock:
+            self._refresh()
+            count = len(self._ids)
+            if count == 0:
+                return
+            
+            nlist = settings.LOCAL_VECTOR_IVF_NLIST or int(np.sqrt(count))
+            nlist = max(1, min(nlist, count))
+            rng = np.random.default_rng(0)
+            sample_size = min(count, max(nlist * 64, 10000))
+            sample = np.asarray(self._matrix[np.sort(rng.choice(count, size=sample_size, replace=False))])
+            
+            centroids = _kmeans(sample, nlist)
+            assign = np.empty(count, dtype=np.int32)
+            codes_blocks = []
+            codebooks = None
+            if self.index_type == "ivfpq":
+                codebooks = self._train_pq(sample)
+            
+            for start in range(0, count, self.SEARCH_BLOCK_ROWS):
+                block = np.asarray(self._matrix[start:start + self.SEARCH_BLOCK_ROWS])
+                assign[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+                if codebooks is not None:
+                    codes_blocks.append(self._encode_pq(block, codebooks))
+            
+            ivf = {"centroids": centroids, "assign": assign, "trained_rows": np.array(count)}
+            if codebooks is not None:
+                ivf["codebooks"] = codebooks
+                ivf["codes"] = np.concatenate(codes_blocks)
+            
+            tmp_path = self._ivf_path + ".tmp.npz"
+            np.savez(tmp_path, **ivf)
+            os.replace(tmp_path, self._ivf_path)
+            self._ivf = ivf
+            self._ivf_mtime = os.path.getmtime(self._ivf_path)
+            logger.info(f"Trained {self.index_type} index for {self.path}: {count} rows, {nlist} lists")
+    
+    def _train_pq(self, sample: np.ndarray) -> np.ndarray:
+        """Train one 256-entry codebook per sub-vector"""
+        m = settings.LOCAL_VECTOR_PQ_SUBVECTORS
+        if self.dim % m:
+            raise ValueError(f"Dimension {self.dim} is not divisible by {m} PQ sub-vectors")
+        sub = self.dim // m
+        codebooks = np.zeros((m, 256, sub), dtype=np.float32)
+        for j in range(m):
+            trained = _kmeans_l2(sample[:, j * sub:(j + 1) * sub], 256)
+            codebooks[j, :len(trained)] = trained
+        return codebooks
+    
+    def _encode_pq(self, vectors: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+        m, _, sub = codebooks.shape
+        codes = np.empty((len(vectors), m), dtype=np.uint8)
+        for j in range(m):
+            part = vectors[:, j * sub:(j + 1) * sub]
+            distances = (part ** 2).sum(axis=1, keepdims=True) - 2 * part @ codebooks[j].T + (codebooks[j] ** 2).sum(axis=1)
+            codes[:, j] = np.argmin(distances, axis=1)
+        return codes
+    
+    def _column(self, key: str) -> np.ndarray:
+        """Object array of every row's metadata value for key (rows are append-only, so it only grows)"""
+        column = self._columns.get(key)
+        count = len(self._metadatas)
+        if column is None or len(column) < count:
+            start = 0 if column is None else len(column)
+            extra = np.empty(count - start, dtype=object)
+            extra[:] = [metadata.get(key) for metadata in self._metadatas[start:count]]
+            column = extra if column is None else np.concatenate([column, extra])
+            self._columns[key] = column
+        return column
+    
+    def _numeric_column(self, key: str) -> np.ndarray:
+        """float64 view of a column; missing and non-numeric values are NaN (never compare true)"""
+        column = self._column(key)
+        numeric = self._numeric_columns.get(key)
+        if numeric is None or len(numeric) < len(column):
+            # Like _column, only rows appended since the last call are converted
+            start = 0 if numeric is None else len(numeric)
+            extra = np.array(
+                [
+                    float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+                    for value in column[start:]
+                ],
+                dtype=np.float64
+            )
+            numeric = extra if numeric is None else np.concatenate([numeric, extra])
+            self._numeric_columns[key] = numeric
+        return numeric
+    
+    def _where_mask(self, where: Dict) -> np.ndarray:
+        """Vectorised matches_where over all rows"""
+        mask = np.ones(len(self._metadatas), dtype=bool)
+        for key, condition in where.items():
+            if key == "$and":
+                for clause in condition:
+                    mask &= self._where_mask(clause)
+                continue
+            if key == "$or":
+                either = np.zeros(len(mask), dtype=bool)
+                for clause in condition:
+                    either |= self._where_mask(clause)
+                mask &= either
+                continue
+            
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            for op, expected in condition.items():
+                if op in ("$eq", "$ne", "$in", "$nin"):
+                    column = self._column(key)
+                    values = [expected] if op in ("$eq", "$ne") else list(expected)
+                    hit = np.zeros(len(mask), dtype=bool)
+                    for value in values:
+                        hit |= np.asarray(column == value, dtype=bool)
+                    mask &= hit if op in ("$eq", "$in") else ~hit
+                elif op in ("$gt", "$gte", "$lt", "$lte"):
+                    column = self._numeric_column(key)
+                    with np.errstate(invalid="ignore"):
+                        if op == "$gt":
+                            mask &= column > expected
+                        elif op == "$gte":
+                            mask &= column >= expected
+                        elif op == "$lt":
+                            mask &= column < expected
+                        else:
+                            mask &= column <= expected
+        return mask
+    
+    def _candidate_mask(self, where: Optional[Dict]) -> np.ndarray:
+        mask = self._alive.copy()
+        if where:
+            mask &= self._where_mask(where)
+        return mask
+    
+    def _exact_scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Inner products against all rows (blocked) or a subset of rows"""
+        if rows is not None:
+            return np.asarray(self._matrix[rows]) @ query
+        scores = np.empty(len(self._ids), dtype=np.float32)
+        for start in range(0, len(scores), self.SEARCH_BLOCK_ROWS):
+            block = self._matrix[start:start + self.SEARCH_BLOCK_ROWS]
+            scores[start:start + len(block)] = block @ query
+        return scores
+    
+    def search(self, query_embedding: List[float], n_results: int = 10, where: Optional[Dict] = None) -> Dict:
+        """Top-k cosine search, returning Chroma-shaped results"""
+        with self._lock:
+            self._refresh()
+            empty = {"ids": [[]], "distances": [[]], "documents": [[]], "metadatas": [[]]}
+            if self._matrix is None:
+                return empty
+            
+            query = np.asarray(query_embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            mask = self._candidate_mask(where)
+            
+            if self._ivf is not None:
+                rows, scores = self._search_ivf(query, n_results, mask)
+            else:
+                rows = np.flatnonzero(mask)
+                if len(rows) == 0:
+                    scores = np.zeros(0, dtype=np.float32)
+                elif len(rows) < len(self._ids) // 4:
+                    # Selective filters (e.g. a delta recheck's document_id $gt) only read their own rows
+                    scores = self._exact_scores(query, rows)
+                else:
+                    scores = self._exact_scores(query)[rows]
+            
+            if len(rows) == 0:
+                return empty
+            
+            k = min(n_results, len(rows))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            rows, scores = rows[top], scores[top]
+            
+            # The connection is shared by every thread using this index
+            texts = {}
+            placeholders = ",".join("?" * len(rows))
+            for row, document in self._conn.execute(
+                f"SELECT row, document FROM rows WHERE row IN ({placeholders})",
+                [int(r) for r in rows]
+            ):
+                texts[row] = document
+            
+            return {
+                "ids": [[self._ids[r] for r in rows]],
+                "distances": [[float(1 - s) for s in scores]],
+                "documents": [[texts.get(int(r)) for r in rows]],
+                "metadatas": [[self._metadatas[r] for r in rows]],
+            }
+    
+    def _search_ivf(self, query: np.ndarray, n_results: int, mask: np.ndarray):
+        """Probe the nearest inverted lists, then score (PQ) and re-rank exactly"""
+        ivf = self._ivf
+        nprobe = min(settings.LOCAL_VECTOR_IVF_NPROBE, len(ivf["centroids"]))
+        probes = np.argsort(-(ivf["centroids"] @ query))[:nprobe]
+        rows = np.flatnonzero(np.isin(ivf["assign"], probes) & mask[:len(ivf["assign"])])
+        if len(rows) == 0:
+            return rows, np.zeros(0, dtype=np.float32)
+        
+        if "codes" in ivf:
+            m, _, sub = ivf["codebooks"].shape
+            tables = np.einsum("mks,ms->mk", ivf["codebooks"], query.reshape(m, sub))
+            approx = tables[np.arange(m), ivf["codes"][rows]].sum(axis=1)
+            keep = min(len(rows), n_results * settings.LOCAL_VECTOR_PQ_RERANK)
+            rows = rows[np.argpartition(-approx, keep - 1)[:keep]]
+        
+        return self._rerank(query, rows)
+    
+    def _rerank(self, query: np.ndarray, rows: np.ndarray):
+        """Exact scores for candidate rows (sorted for sequential memmap reads)"""
+        rows = np.sort(rows)
+        return rows, self._exact_scores(query, rows).astype(np.float32)
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import Index, create_engine, inspect
 from sqlalchemy.orm import sessionmaker, declarative_base
 from app.core.config import settings
 
@@ -34,7 +34,80 @@ def init_db():
     import app.models.submission  # noqa
     import app.models.match  # noqa
     import app.models.report  # noqa
+    import app.models.web_source  # noqa
+    import app.models.reference_document  # noqa
     
     # Now create all tables
     Base.metadata.create_all(bind=engine)
-    print("✅ Database tables created successfully")
\ No newline at end of file
+    _add_missing_columns()
+    _add_missing_enum_values()
+    _drop_unique_content_hash()
+    print("✅ Database tables created successfully")
+
+
+# Columns added to existing tables since the first release, as (table, column).
+# create_all only creates missing tables, so these are added by _add_missing_columns.
+_ADDED_COLUMNS = [
+    ("documents", "minhash_signatures"),
+    ("documents", "simhash"),
+    ("submissions", "corpus_high_water_mark"),
+]
+
+
+def _add_missing_columns():
+    """Add _ADDED_COLUMNS (and their indexes) to tables created by older versions"""
+    inspector = inspect(engine)
+    for table_name, column_name in _ADDED_COLUMNS:
+        if not inspector.has_table(table_name):
+            continue
+        if column_name in {column["name"] for column in inspector.get_columns(table_name)}:
+            continue
+        
+        table = Base.metadata.tables[table_name]
+        column_type = table.c[column_name].type.compile(dialect=engine.dialect)
+        with engine.begin() as connection:
+            connection.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}")
+            for index in table.indexes:
+                if [column.name for column in index.columns] == [column_name]:
+                    index.create(bind=connection, checkfirst=True)
+        print(f"✅ Added column {table_name}.{column_name}")
+
+
+# Values added to PostgreSQL enum types since the first release, as (type, label).
+# SQLAlchemy's Enum stores member names, so the label is the upper-case name.
+_ADDED_ENUM_VALUES = [
+    ("sourcetype", "REFERENCE"),
+]
+
+
+def _add_missing_enum_values():
+    """Add _ADDED_ENUM_VALUES to enum types created by older versions (PostgreSQL only)"""
+    if engine.dialect.name != "postgresql":
+        return
+    # ADD VALUE cannot run inside a transaction block before PostgreSQL 12
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        for type_name, label in _ADDED_ENUM_VALUES:
+            connection.exec_driver_sql(f"ALTER TYPE {type_name} ADD VALUE IF NOT EXISTS '{label}'")
+
+
+def _drop_unique_content_hash():
+    """
+    Copies of one text may now be stored for several users, but create_all
+    does not alter existing tables: replace a unique content_hash index left
+    by older versions with the plain one the model declares.
+    """
+    from app.models.document import Document
+    
+    unique = [
+        index["name"] for index in inspect(engine).get_indexes(Document.__tablename__)
+        if index.get("unique") and index.get("column_names") == ["content_hash"]
+    ]
+    if not unique:
+        return
+    
+    model_index = next(index for index in Document.__table__.indexes if index.name == "ix_documents_content_hash")
+    with engine.begin() as connection:
+        for name in unique:
+            Index(name, Document.__table__.c.content_hash).drop(bind=connection)
+        model_index.create(bind=connection, checkfirst=True)
+    print("✅ Dropped the unique index on documents.content_hash")
\ No newline at end of file
@@ -1,4 +1,9 @@
-from typing import List, Dict, Optional
+from abc import ABC, abstractmethod
+from typing import List, Dict, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+import os
+import re
+import threading
 from app.core.config import settings
 import logging
 
@@ -11,40 +16,249 @@ try:
     CHROMADB_AVAILABLE = True
 except ImportError:
     CHROMADB_AVAILABLE = False
-    logger.warning("ChromaDB not installed. Vector search functionality will be disabled.")
+    logger.warning("ChromaDB not installed. The local vector index will be used instead.")
 
 
-class VectorDB:
-    """ChromaDB wrapper for vector storage and similarity search"""
+SHARED_SHARD = "inst_shared"
+# Vectors of imported reference corpora; never searched by the database stage
+REFERENCE_SHARD = "reference"
+
+
+def _sanitize(value) -> str:
+    """Keep shard names within Chroma's collection-name alphabet"""
+    return re.sub(r"[^A-Za-z0-9_-]+", "-", str(value)).strip("-") or "none"
+
+
+def shard_for(metadata: Dict) -> str:
+    """Collection a vector belongs to, based on VECTOR_SHARD_BY"""
+    if metadata.get('reference_id') is not None:
+        return REFERENCE_SHARD
+    if settings.VECTOR_SHARD_BY == "none":
+        return "documents"
+    
+    institution_id = metadata.get('institution_id')
+    shard = f"inst_{_sanitize(institution_id)}" if institution_id is not None else SHARED_SHARD
+    if settings.VECTOR_SHARD_BY == "institution_term" and metadata.get('term'):
+        shard = f"{shard}_term_{_sanitize(metadata['term'])}"
+    return shard
+
+
+def merge_results(results: List[Dict], n_results: int) -> Dict:
+    """Merge Chroma-shaped per-shard results into one global top-k"""
+    rows = []
+    for result in results:
+        if not result or not result.get('ids') or not result['ids'][0]:
+            continue
+        documents = (result.get('documents') or [[]])[0] or [None] * len(result['ids'][0])
+        metadatas = (result.get('metadatas') or [[]])[0] or [{}] * len(result['ids'][0])
+        rows.extend(zip(result['distances'][0], result['ids'][0], documents, metadatas))
+    
+    rows.sort(key=lambda row: row[0])
+    rows = rows[:n_results]
+    return {
+        'ids': [[row[1] for row in rows]],
+        'distances': [[row[0] for row in rows]],
+        'documents': [[row[2] for row in rows]],
+        'metadatas': [[row[3] for row in rows]]
+    }
+
+
+class VectorBackend(ABC):
+    """Interface every vector storage engine implements"""
+    
+    name = "base"
+    
+    @abstractmethod
+    def add_documents(
+        self,
+        collection: str,
+        ids: List[str],
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict]
+    ):
+        ...
+    
+    @abstractmethod
+    def search_similar(
+        self,
+        collection: str,
+        query_embedding: List[float],
+        n_results: int = 10,
+        where: Optional[Dict] = None
+    ) -> Dict:
+        """Return Chroma-shaped results: ids/distances/documents/metadatas, each [[...]]"""
+    
+    @abstractmethod
+    def delete_documents(self, collection: str, ids: List[str]):
+        ...
+    
+    @abstractmethod
+    def delete_where(self, collection: str, where: Dict):
+        ...
+    
+    @abstractmethod
+    def get_document(self, collection: str, doc_id: str) -> Optional[Dict]:
+        ...
+    
+    @abstractmethod
+    def list_collections(self) -> List[str]:
+        ...
+    
+    def is_available(self) -> bool:
+        return True
+    
+    def train_indexes(self) -> List[str]:
+        """(Re)train approximate indexes that have grown enough; returns the retrained collections"""
+        return []
+
+
+class ChromaBackend(VectorBackend):
+    """ChromaDB (HNSW) backend, one Chroma collection per shard"""
+    
+    name = "chroma"
     
     def __init__(self):
-        if not CHROMADB_AVAILABLE:
-            logger.warning("ChromaDB is not available. Vector operations will be disabled.")
-            self.client = None
-            self.collection = None
-            return
-            
-        try:
-            self.client = chromadb.PersistentClient(
-                path=settings.CHROMA_PERSIST_DIR,
-                settings=ChromaSettings(anonymized_telemetry=False)
-            )
-            self.collection = self.client.get_or_create_collection(
-                name="documents",
+        self.client = chromadb.PersistentClient(
+            path=settings.CHROMA_PERSIST_DIR,
+            settings=ChromaSettings(anonymized_telemetry=False)
+        )
+        self._collections = {}
+        logger.info("ChromaDB initialized successfully")
+    
+    def _collection(self, name: str):
+        if name not in self._collections:
+            self._collections[name] = self.client.get_or_create_collection(
+                name=name,
                 metadata={"hnsw:space": "cosine"}
             )
-            logger.info("ChromaDB initialized successfully")
+        return self._collections[name]
+    
+    def add_documents(self, collection, ids, texts, embeddings, metadatas):
+        # Chroma rejects None metadata values
+        metadatas = [{k: v for k, v in (m or {}).items() if v is not None} for m in metadatas]
+        self._collection(collection).upsert(
+            ids=ids,
+            embeddings=embeddings,
+            documents=texts,
+            metadatas=metadatas
+        )
+    
+    def search_similar(self, collection, query_embedding, n_results=10, where=None):
+        target = self._collection(collection)
+        count = target.count()
+        if count == 0:
+            return merge_results([], n_results)
+        return target.query(
+            query_embeddings=[query_embedding],
+            n_results=min(n_results, count),
+            where=where
+        )
+    
+    def delete_documents(self, collection, ids):
+        self._collection(collection).delete(ids=ids)
+    
+    def delete_where(self, collection, where):
+        self._collection(collection).delete(where=where)
+    
+    def get_document(self, collection, doc_id):
+        results = self._collection(collection).get(ids=[doc_id])
+        if results and results['ids']:
+            return {
+                'id': results['ids'][0],
+                'document': results['documents'][0],
+                'metadata': results['metadatas'][0]
+            }
+        return None
+    
+    def list_collections(self):
+        # Older Chroma versions return Collection objects, newer ones names
+        return [getattr(c, 'name', c) for c in self.client.list_collections()]
+
+
+class LocalBackend(VectorBackend):
+    """In-process NumPy backend (memory-mapped flat / IVF / IVF-PQ index per shard)"""
+    
+    name = "local"
+    
+    def __init__(self):
+        os.makedirs(settings.LOCAL_VECTOR_DIR, exist_ok=True)
+        self._indexes = {}
+        self._lock = threading.Lock()
+        logger.info(f"Local vector index initialized ({settings.LOCAL_VECTOR_INDEX_TYPE})")
+    
+    def _index(self, name: str):
+        from app.database.local_vector_index import LocalVectorIndex
+        with self._lock:
+            if name not in self._indexes:
+                self._indexes[name] = LocalVectorIndex(os.path.join(settings.LOCAL_VECTOR_DIR, name))
+            return self._indexes[name]
+    
+    def add_documents(self, collection, ids, texts, embeddings, metadatas):
+        self._index(collection).add(ids, embeddings, texts, metadatas)
+    
+    def search_similar(self, collection, query_embedding, n_results=10, where=None):
+        return self._index(collection).search(query_embedding, n_results=n_results, where=where)
+    
+    def delete_documents(self, collection, ids):
+        self._index(collection).delete(ids)
+    
+    def delete_where(self, collection, where):
+        self._index(collection).delete_where(where)
+    
+    def get_document(self, collection, doc_id):
+        return self._index(collection).get(doc_id)
+    
+    def list_collections(self):
+        return sorted(
+            name for name in os.listdir(settings.LOCAL_VECTOR_DIR)
+            if os.path.isdir(os.path.join(settings.LOCAL_VECTOR_DIR, name))
+        )
+    
+    def train_indexes(self):
+        return [name for name in self.list_collections() if self._index(name).maybe_train()]
+
+
+def create_backend(name: Optional[str] = None) -> Optional[VectorBackend]:
+    """Build the configured backend, falling back to the local index if Chroma is unusable"""
+    name = (name or settings.USE_VECTOR_DB).lower()
+    
+    if name == "chroma":
+        if CHROMADB_AVAILABLE:
+            try:
+                return ChromaBackend()
+            except Exception as e:
+                logger.error(f"Failed to initialize ChromaDB: {e}")
+        logger.warning("ChromaDB unavailable, falling back to the local vector index")
+        name = "local"
+    
+    if name == "local":
+        try:
+            return LocalBackend()
         except Exception as e:
-            logger.error(f"Failed to initialize ChromaDB: {e}")
-            self.client = None
-            self.collection = None
+            logger.error(f"Failed to initialize local vector index: {e}")
+            return None
+    
+    logger.error(f"Unknown vector backend: {name}")
+    return None
+
+
+class VectorDB:
+    """Vector storage and similarity search over a pluggable, sharded backend"""
+    
+    def __init__(self, backend: Optional[str] = None):
+        self.backend = create_backend(backend)
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.VECTOR_SEARCH_WORKERS,
+            thread_name_prefix="vector-search"
+        )
     
     def _check_availability(self):
-        """Check if ChromaDB is available"""
-        if not CHROMADB_AVAILABLE or self.collection is None:
+        """Check if a vector backend is available"""
+        if self.backend is None or not self.backend.is_available():
             raise RuntimeError(
-                "ChromaDB is not available. "
-                "Install it with: pip install chromadb"
+                "No vector database is available. "
+                "Install chromadb or set USE_VECTOR_DB=local"
             )
     
     def add_document(
@@ -55,49 +269,123 @@ class VectorDB:
         metadata: Dict
     ):
         """Add document to vector database"""
+        self.add_documents([doc_id], [text], [embedding], [metadata])
+    
+    def add_documents(
+        self,
+        ids: List[str],
+        texts: List[str],
+        embeddings: List[List[float]],
+        metadatas: List[Dict]
+    ):
+        """Add a batch of vectors to their shards (existing ids are replaced)"""
         self._check_availability()
-        self.collection.add(
-            ids=[doc_id],
-            embeddings=[embedding],
-            documents=[text],
-            metadatas=[metadata]
-        )
+        
+        grouped: Dict[str, List[int]] = {}
+        for i, metadata in enumerate(metadatas):
+            grouped.setdefault(shard_for(metadata or {}), []).append(i)
+        
+        for shard, indices in grouped.items():
+            self.backend.add_documents(
+                shard,
+                [ids[i] for i in indices],
+                [texts[i] for i in indices],
+                [embeddings[i] for i in indices],
+                [metadatas[i] for i in indices]
+            )
+    
+    def list_shards(self) -> List[str]:
+        """Names of all existing shards"""
+        self._check_availability()
+        return self.backend.list_collections()
+    
+    def train_indexes(self) -> List[str]:
+        """Retrain shards' IVF quantizers that have grown enough (slow; kept off the upload path)"""
+        self._check_availability()
+        return self.backend.train_indexes()
+    
+    def visible_shards(self, institution_id: Optional[int], allow_cross_institution: bool = False) -> List[str]:
+        """Shards a check for the given institution may search"""
+        shards = [shard for shard in self.list_shards() if shard != REFERENCE_SHARD]
+        if settings.VECTOR_SHARD_BY == "none" or allow_cross_institution:
+            return shards
+        
+        own = f"inst_{_sanitize(institution_id)}" if institution_id is not None else None
+        return [
+            shard for shard in shards
+            if shard.startswith(SHARED_SHARD)
+            or (own and (shard == own or shard.startswith(f"{own}_term_")))
+        ]
     
     def search_similar(
         self,
         query_embedding: List[float],
         n_results: int = 10,
-        where: Optional[Dict] = None
+        where: Optional[Dict] = None,
+        shards: Optional[List[str]] = None
     ) -> Dict:
-        """Search for similar documents"""
+        """Search the given shards (default: all) in parallel and merge the per-shard top-k"""
         self._check_availability()
-        results = self.collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results,
-            where=where
-        )
-        return results
+        
+        shards = self.list_shards() if shards is None else shards
+        if len(shards) == 1:
+            return self.backend.search_similar(shards[0], query_embedding, n_results=n_results, where=where)
+        
+        futures = [
+            self._executor.submit(self.backend.search_similar, shard, query_embedding, n_results, where)
+            for shard in shards
+        ]
+        results = []
+        for shard, future in zip(shards, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"Vector search failed on shard {shard}: {e}")
+        return merge_results(results, n_results)
+    
+    def delete_document(self, doc_id: str, shard: Optional[str] = None):
+        """Delete document from vector database (from every shard unless one is given)"""
+        self._check_availability()
+        for name in ([shard] if shard else self.list_shards()):
+            self.backend.delete_documents(name, [doc_id])
+    
+    def delete_document_vectors(self, document_ids: Union[int, List[int]], shards: Optional[List[str]] = None):
+        """
+        Delete every chunk vector of the documents (and any legacy whole-document
+        vectors) from the given shards. Re-indexing passes the documents' own
+        shard (shard_for their metadata); without shards every document shard is
+        scanned, which is only meant for explicit deletes. The reference shard is
+        never touched.
+        """
+        self._check_availability()
+        if isinstance(document_ids, int):
+            document_ids = [document_ids]
+        existing = self.list_shards()
+        targets = existing if shards is None else [shard for shard in shards if shard in existing]
+        for shard in targets:
+            if shard == REFERENCE_SHARD:
+                continue
+            self.backend.delete_where(shard, {'document_id': {'$in': list(document_ids)}})
+            self.backend.delete_documents(shard, [str(document_id) for document_id in document_ids])
     
-    def delete_document(self, doc_id: str):
-        """Delete document from vector database"""
+    def delete_reference_vectors(self, reference_ids: List[int]):
+        """Delete every chunk vector of the reference documents"""
         self._check_availability()
-        self.collection.delete(ids=[doc_id])
+        if REFERENCE_SHARD in self.list_shards():
+            self.backend.delete_where(REFERENCE_SHARD, {'reference_id': {'$in': list(reference_ids)}})
     
     def get_document(self, doc_id: str) -> Optional[Dict]:
         """Get document by ID"""
         self._check_availability()
-        results = self.collection.get(ids=[doc_id])
-        if results and results['ids']:
-            return {
-                'id': results['ids'][0],
-                'document': results['documents'][0],
-                'metadata': results['metadatas'][0]
-            }
+        for shard in self.list_shards():
+            document = self.backend.get_document(shard, doc_id)
+            if document:
+                return document
         return None
     
     def is_available(self) -> bool:
         """Check if vector database is available"""
-        return CHROMADB_AVAILABLE and self.collection is not None
+        return self.backend is not None and self.backend.is_available()
 
 
 # Global instance
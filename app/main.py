@@ -7,6 +7,7 @@ import time
 from app.core.config import settings
 from app.database.session import init_db
 from app.api.v1.router import api_router
+from app.services.metrics import metrics
 
 # Create FastAPI app
 app = FastAPI(
@@ -90,6 +91,12 @@ async def startup_event():
     os.makedirs(settings.CHROMA_PERSIST_DIR, exist_ok=True)
     print("✅ Storage directories created")
     
+    # Load the near-duplicate index now rather than in the first upload
+    from starlette.concurrency import run_in_threadpool
+    from app.services.simhash_service import get_simhash_service
+    await run_in_threadpool(get_simhash_service().refresh)
+    print("✅ Near-duplicate index loaded")
+    
     print(f"🌐 API Documentation: http://{settings.HOST}:{settings.PORT}/api/{settings.API_VERSION}/docs")
 
 
@@ -112,6 +119,13 @@ async def health_check():
     }
 
 
+# Metrics endpoint
+@app.get("/metrics")
+def get_metrics():
+    """Counters and latency summaries of every API and worker process (this process only if Redis is down)"""
+    return metrics.shared_snapshot() or metrics.snapshot()
+
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, JSON, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Float, JSON, Boolean, LargeBinary, BigInteger
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database.session import Base
@@ -18,7 +18,7 @@ class Document(Base):
     
     # Content
     content = Column(Text)  # Extracted text
-    content_hash = Column(String, unique=True, index=True)  # For deduplication
+    content_hash = Column(String, index=True)  # For deduplication (shared by copies across users)
     
     # Metadata
     word_count = Column(Integer)
@@ -28,6 +28,12 @@ class Document(Base):
     # Embedding for vector search
     embedding_stored = Column(Boolean, default=False)
     
+    # Per-chunk MinHash signatures (uint32 matrix) for LSH candidate retrieval
+    minhash_signatures = Column(LargeBinary)
+    
+    # 64-bit SimHash (stored signed) for near-duplicate detection
+    simhash = Column(BigInteger, index=True)
+    
     # Additional metadata
     doc_metadata = Column(JSON, default={})
     
@@ -4,6 +4,8 @@ from app.models.document import Document
 from app.models.submission import Submission, SubmissionStatus
 from app.models.match import Match, MatchType, SourceType
 from app.models.report import Report
+from app.models.web_source import WebSource
+from app.models.reference_document import ReferenceDocument
 
 __all__ = [
     "Institution",
@@ -14,5 +16,7 @@ __all__ = [
     "Match",
     "MatchType",
     "SourceType",
-    "Report"
+    "Report",
+    "WebSource",
+    "ReferenceDocument"
 ]
\ No newline at end of file
@@ -15,6 +15,7 @@ class SourceType(str, enum.Enum):
     WEB = "web"
     DATABASE = "database"
     INSTITUTION = "institution"
+    REFERENCE = "reference"
 
 
 class Match(Base):
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, LargeBinary, Boolean, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database.session import Base
+
+
+class ReferenceDocument(Base):
+    """A document from an offline reference corpus (e.g. a Wikipedia dump), imported in bulk"""
+    __tablename__ = "reference_documents"
+    __table_args__ = (
+        UniqueConstraint("corpus", "external_id", name="uq_reference_documents_corpus_external_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    
+    # Source info
+    corpus = Column(String, nullable=False, index=True)  # e.g. enwiki, textbooks
+    external_id = Column(String, nullable=False)  # Page id, relative path or JSONL id within the corpus
+    title = Column(String)
+    url = Column(String)
+    
+    # Content
+    content = Column(Text)  # Cleaned text
+    content_hash = Column(String, index=True)
+    word_count = Column(Integer)
+    
+    # Per-chunk MinHash signatures (uint32 matrix) for LSH candidate retrieval
+    minhash_signatures = Column(LargeBinary)
+    
+    # Chunk vectors written to the reference shard
+    embedding_stored = Column(Boolean, default=False)
+    
+    # Timestamps
+    imported_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
@@ -39,6 +39,9 @@ class Submission(Base):
     # Settings used
     check_settings = Column(JSON, default={})
     
+    # Highest document id the result was checked against (for delta re-checks)
+    corpus_high_water_mark = Column(Integer)
+    
     # Document relationship
     document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
     document = relationship("Document", back_populates="submissions")
@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, LargeBinary
+from sqlalchemy.sql import func
+from app.database.session import Base
+
+
+class WebSource(Base):
+    """A previously fetched web page, kept so later checks can match it without searching"""
+    __tablename__ = "web_sources"
+
+    id = Column(Integer, primary_key=True, index=True)
+    
+    # Page info
+    url = Column(String, unique=True, index=True, nullable=False)
+    title = Column(String)
+    
+    # Content
+    content = Column(Text)  # Extracted page text
+    content_hash = Column(String, index=True)
+    word_count = Column(Integer)
+    
+    # Per-chunk MinHash signatures (uint32 matrix) for LSH candidate retrieval
+    minhash_signatures = Column(LargeBinary)
+    
+    # Usage, for retention
+    hit_count = Column(Integer, default=0)
+    
+    # Timestamps
+    fetched_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_hit_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -16,6 +16,7 @@ class PlagiarismCheckRequest(BaseModel):
     check_web: bool = True
     check_database: bool = True
     check_institution: bool = True
+    check_reference: bool = True
 
 
 class MatchResponse(BaseModel):
@@ -0,0 +1,268 @@
+"""
+Rate-limit-aware scheduling of LLM provider calls.
+
+Requests run on a process-wide asyncio loop (in its own thread), so callers
+can submit many at once and each provider serves up to its own concurrency
+limit in parallel. Every provider has two token buckets, requests/min and
+tokens/min, sized from settings; a request that no provider can start right
+now waits in the loop until one can, or fails once its deadline has passed.
+
+The provider for each request is chosen by expected cost of waiting: time
+until its buckets admit the request, plus its recent median latency, plus its
+price converted to seconds with AI_COST_PER_SECOND. A 429 drains that
+provider's bucket and the request is re-routed; other errors count against
+the provider's circuit breaker (see provider_health).
+
+Limits are per worker process: set them to the provider's account limits
+divided by the number of worker processes.
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from app.core.config import settings
+from app.services.metrics import metrics
+from app.services.provider_health import get_provider_health
+
+logger = logging.getLogger(__name__)
+
+# A provider call: (prompt, max_tokens) -> (text, (prompt tokens, completion tokens) or None)
+ProviderCall = Callable[[str, int], Tuple[str, Optional[Tuple[int, int]]]]
+
+
+class TokenBucket:
+    """Continuous-refill bucket holding up to one minute's allowance"""
+    
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self._updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken (0 for an unlimited bucket)"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return max(0.0, (min(amount, self.capacity) - self.tokens) / self.rate)
+    
+    def take(self, amount: float):
+        if self.rate > 0:
+            self._refill()
+            self.tokens -= amount
+    
+    def drain(self, seconds: float):
+        """Provider said slow down: nothing is available for the given time"""
+        if self.rate > 0:
+            self._refill()
+            self.tokens = min(self.tokens, -self.rate * seconds)
+
+
+class ProviderLimits:
+    """Rate limits, concurrency and price of one provider, from settings"""
+    
+    def __init__(self, name: str):
+        prefix = name.upper()
+        self.requests_per_minute = getattr(settings, f"{prefix}_RPM", 0)
+        self.tokens_per_minute = getattr(settings, f"{prefix}_TPM", 0)
+        self.max_concurrency = max(getattr(settings, f"{prefix}_MAX_CONCURRENCY", 1), 1)
+        self.cost_per_1k_tokens = getattr(settings, f"{prefix}_COST_PER_1K_TOKENS", 0.0)
+
+
+class RateLimited(Exception):
+    """A provider rejected a call with HTTP 429"""
+    
+    def __init__(self, retry_after: Optional[float] = None):
+        super().__init__("rate limited")
+        self.retry_after = retry_after
+
+
+def is_rate_limit_error(error: Exception) -> Tuple[bool, Optional[float]]:
+    """(rate limited?, retry-after seconds) for an SDK exception"""
+    if isinstance(error, RateLimited):
+        return True, error.retry_after
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status != 429 and "429" not in str(error) and "rate limit" not in str(error).lower():
+        return False, None
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return True, float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return True, None
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+class _Provider:
+    def __init__(self, name: str):
+        self.name = name
+        self.limits = ProviderLimits(name)
+        self.requests = TokenBucket(self.limits.requests_per_minute)
+        self.tokens = TokenBucket(self.limits.tokens_per_minute)
+        self.semaphore = asyncio.Semaphore(self.limits.max_concurrency)
+        self.in_flight = 0
+        self.health = get_provider_health("ai", name)
+
+
+class AIScheduler:
+    """Process-wide scheduler for LLM calls across providers"""
+    
+    def __init__(self):
+        self._loop = asyncio.new_event_loop()
+        self._executor = ThreadPoolExecutor(max_workers=settings.AI_WORKERS, thread_name_prefix="ai-call")
+        self._providers: Dict[str, _Provider] = {}
+        self._thread = threading.Thread(target=self._loop.run_forever, name="ai-scheduler", daemon=True)
+        self._thread.start()
+    
+    def submit(
+        self,
+        prompt: str,
+        calls: Dict[str, ProviderCall],
+        max_tokens: int = 200,
+        deadline_seconds: Optional[float] = None
+    ) -> Future:
+        """Schedule one completion; the future resolves to the text, or None if no provider answered in time"""
+        deadline = time.monotonic() + (deadline_seconds or settings.AI_REQUEST_DEADLINE_SECONDS)
+        return asyncio.run_coroutine_threadsafe(self._run(prompt, calls, max_tokens, deadline), self._loop)
+    
+    def complete(self, prompt: str, calls: Dict[str, ProviderCall], max_tokens: int = 200) -> Optional[str]:
+        return self.submit(prompt, calls, max_tokens).result()
+    
+    def complete_many(
+        self,
+        prompts: List[str],
+        calls: Dict[str, ProviderCall],
+        max_tokens: int = 200
+    ) -> List[Optional[str]]:
+        """Completions for many prompts, run concurrently within each provider's limits"""
+        futures = [self.submit(prompt, calls, max_tokens) for prompt in prompts]
+        return [future.result() for future in futures]
+    
+    def _provider(self, name: str) -> _Provider:
+        # Only touched from the loop thread
+        if name not in self._providers:
+            self._providers[name] = _Provider(name)
+        return self._providers[name]
+    
+    def _select(
+        self,
+        names: List[str],
+        estimated_tokens: int,
+        remaining: float
+    ) -> Tuple[Optional[_Provider], float]:
+        """Provider with the lowest expected cost in seconds, and how long its rate limits make us wait"""
+        best, best_score, best_wait = None, float("inf"), 0.0
+        for name in names:
+            provider = self._provider(name)
+            if not provider.health.breaker.available():
+                continue
+            latency = (provider.health.latency_percentile(50) or settings.AI_DEFAULT_LATENCY_MS) / 1000
+            wait = max(provider.requests.wait_time(1), provider.tokens.wait_time(estimated_tokens))
+            # At its concurrency limit: expect to queue for about one call's latency
+            queued = latency if provider.in_flight >= provider.limits.max_concurrency else 0.0
+            if wait + queued >= remaining:
+                continue
+            cost = estimated_tokens / 1000 * provider.limits.cost_per_1k_tokens
+            score = wait + queued + latency + cost / settings.AI_COST_PER_SECOND
+            if score < best_score:
+                best, best_score, best_wait = provider, score, wait
+        return best, best_wait
+    
+    async def _run(
+        self,
+        prompt: str,
+        calls: Dict[str, ProviderCall],
+        max_tokens: int,
+        deadline: float
+    ) -> Optional[str]:
+        estimated_tokens = estimate_tokens(prompt) + max_tokens
+        candidates = list(calls)
+        started = time.monotonic()
+        
+        while candidates:
+            remaining = deadline - time.monotonic()
+            provider, wait = self._select(candidates, estimated_tokens, remaining)
+            if provider is None:
+                break
+            if wait > 0:
+                # Queue: re-select once the best provider should have capacity
+                await asyncio.sleep(wait)
+                continue
+            if not provider.health.breaker.allow():
+                candidates.remove(provider.name)
+                continue
+            
+            provider.requests.take(1)
+            provider.tokens.take(estimated_tokens)
+            provider.in_flight += 1
+            try:
+                await asyncio.wait_for(provider.semaphore.acquire(), timeout=max(deadline - time.monotonic(), 0.001))
+            except asyncio.TimeoutError:
+                provider.in_flight -= 1
+                break
+            
+            call_started = time.monotonic()
+            metrics.observe("ai.queue_ms", (call_started - started) * 1000)
+            try:
+                text, usage = await self._loop.run_in_executor(
+                    self._executor, calls[provider.name], prompt, max_tokens
+                )
+            except Exception as e:
+                rate_limited, retry_after = is_rate_limit_error(e)
+                if rate_limited:
+                    # Only throttled: back off without counting a failure or closing a half-open breaker
+                    metrics.increment(f"ai.{provider.name}.rate_limited")
+                    provider.health.breaker.release_trial()
+                    provider.requests.drain(retry_after or 60 / max(provider.limits.requests_per_minute, 1))
+                else:
+                    provider.health.record((time.monotonic() - call_started) * 1000, ok=False)
+                    logger.warning(f"Error with {provider.name}: {e}")
+                    candidates.remove(provider.name)
+                continue
+            finally:
+                provider.in_flight -= 1
+                provider.semaphore.release()
+            
+            provider.health.record((time.monotonic() - call_started) * 1000, ok=True)
+            if usage is not None:
+                prompt_tokens, completion_tokens = usage
+                used = prompt_tokens + completion_tokens
+                # Settle the estimate against what the provider reports
+                provider.tokens.take(used - estimated_tokens)
+                metrics.increment(f"ai.{provider.name}.prompt_tokens", prompt_tokens)
+                metrics.increment(f"ai.{provider.name}.completion_tokens", completion_tokens)
+                metrics.increment(f"ai.{provider.name}.tokens", used)
+                metrics.increment(f"ai.{provider.name}.cost_usd", used / 1000 * provider.limits.cost_per_1k_tokens)
+                metrics.observe(f"ai.{provider.name}.tokens_per_call", used)
+            metrics.increment(f"ai.{provider.name}.calls")
+            return text
+        
+        metrics.increment("ai.unanswered")
+        return None
+
+
+_scheduler: Optional[AIScheduler] = None
+_scheduler_pid: Optional[int] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_ai_scheduler() -> AIScheduler:
+    """Return the process-wide AI scheduler (a fresh one in forked children)"""
+    global _scheduler, _scheduler_pid
+    
+    with _scheduler_lock:
+        if _scheduler is None or _scheduler_pid != os.getpid():
+            _scheduler = AIScheduler()
+            _scheduler_pid = os.getpid()
+        return _scheduler
\ No newline at end of file
@@ -1,88 +1,167 @@
-from typing import Optional, Dict
+import os
+import threading
+from functools import partial
+from typing import Optional, Dict, List, Tuple
 import openai
 from groq import Groq
 import google.generativeai as genai
 from app.core.config import settings
+from app.services.ai_scheduler import ProviderCall, get_ai_scheduler
+from app.services.http_clients import get_httpx_client
+from app.services.prompt_builder import PARAPHRASE_MAX_TOKENS, paraphrase_prompt, summary_prompt
+
+
+_clients: Dict[str, object] = {}
+_clients_lock = threading.Lock()
+
+
+def _client(name: str, factory):
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
+
+
+def get_openai_client():
+    """Process-wide OpenAI client on a shared connection pool (None without an API key)"""
+    if not settings.OPENAI_API_KEY:
+        return None
+    # No SDK retries: the scheduler re-routes rate-limited and failed calls itself
+    return _client("openai", lambda: openai.OpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        http_client=get_httpx_client("openai"),
+        timeout=settings.AI_TIMEOUT,
+        max_retries=0
+    ))
+
+
+def get_groq_client():
+    """Process-wide Groq client on a shared connection pool (None without an API key)"""
+    if not settings.GROQ_API_KEY:
+        return None
+    return _client("groq", lambda: Groq(
+        api_key=settings.GROQ_API_KEY,
+        http_client=get_httpx_client("groq"),
+        timeout=settings.AI_TIMEOUT,
+        max_retries=0
+    ))
+
+
+def get_gemini_model():
+    """Process-wide Gemini model (None without an API key)"""
+    if not settings.GEMINI_API_KEY:
+        return None
+    
+    def create():
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+        return genai.GenerativeModel('gemini-pro')
+    
+    return _client("gemini", create)
+
+
+def _usage(usage, prompt_field: str, completion_field: str) -> Optional[Tuple[int, int]]:
+    """(prompt tokens, completion tokens) from an SDK usage object, if it has them"""
+    prompt_tokens = getattr(usage, prompt_field, None)
+    completion_tokens = getattr(usage, completion_field, None)
+    if prompt_tokens is None and completion_tokens is None:
+        return None
+    return prompt_tokens or 0, completion_tokens or 0
+
+
+def _reset_after_fork():
+    # SDK clients hold the parent's connections (and Gemini a gRPC channel)
+    global _clients_lock
+    
+    _clients.clear()
+    _clients_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 class AIService:
     """AI service for paraphrase detection and semantic analysis"""
     
-    def __init__(self):
-        self.openai_client = None
-        self.groq_client = None
-        self.gemini_model = None
-        
-        if settings.OPENAI_API_KEY:
-            openai.api_key = settings.OPENAI_API_KEY
-            self.openai_client = openai
-        
-        if settings.GROQ_API_KEY:
-            self.groq_client = Groq(api_key=settings.GROQ_API_KEY)
-        
-        if settings.GEMINI_API_KEY:
-            genai.configure(api_key=settings.GEMINI_API_KEY)
-            self.gemini_model = genai.GenerativeModel('gemini-pro')
+    @property
+    def openai_client(self):
+        return get_openai_client()
+    
+    @property
+    def groq_client(self):
+        return get_groq_client()
+    
+    @property
+    def gemini_model(self):
+        return get_gemini_model()
     
     def detect_paraphrase(self, text1: str, text2: str) -> Dict:
         """Detect if text2 is a paraphrase of text1 using AI"""
-        prompt = f"""
-Compare these two texts and determine if they convey the same meaning (paraphrase).
-Respond with a JSON object containing:
-- is_paraphrase (boolean)
-- confidence (0-100)
-- explanation (brief)
-
-Text 1: {text1}
-
-Text 2: {text2}
-
-Response:"""
-        
-        for ai_method in settings.AI_PRIORITY.split(","):
-            try:
-                if ai_method == "groq" and self.groq_client:
-                    return self._detect_with_groq(prompt)
-                elif ai_method == "gemini" and self.gemini_model:
-                    return self._detect_with_gemini(prompt)
-                elif ai_method == "openai" and self.openai_client:
-                    return self._detect_with_openai(prompt)
-            except Exception as e:
-                print(f"Error with {ai_method}: {e}")
-                continue
-        
-        # Fallback
-        return {"is_paraphrase": False, "confidence": 0, "explanation": "AI detection failed"}
+        return self.detect_paraphrase_many([(text1, text2)])[0]
+    
+    def detect_paraphrase_many(self, pairs: List[Tuple[str, str]]) -> List[Dict]:
+        """Paraphrase verdicts for many (text1, text2) pairs, requested concurrently"""
+        if not pairs:
+            return []
+        responses = get_ai_scheduler().complete_many(
+            [paraphrase_prompt(text1, text2) for text1, text2 in pairs],
+            self._provider_calls(temperature=0.3),
+            max_tokens=PARAPHRASE_MAX_TOKENS
+        )
+        return [
+            self._parse_ai_response(response) if response is not None
+            # Fallback
+            else {"is_paraphrase": False, "confidence": 0, "explanation": "AI detection failed"}
+            for response in responses
+        ]
     
-    def _detect_with_openai(self, prompt: str) -> Dict:
-        """Detect paraphrase using OpenAI"""
+    def _provider_calls(self, temperature: Optional[float] = None) -> Dict[str, ProviderCall]:
+        """Configured providers allowed by AI_PRIORITY, as scheduler calls"""
+        available = {
+            "groq": self.groq_client is not None,
+            "gemini": self.gemini_model is not None,
+            "openai": self.openai_client is not None
+        }
+        calls = {}
+        for name in settings.ai_priority_list:
+            name = name.strip()
+            if available.get(name):
+                calls[name] = partial(getattr(self, f"_complete_with_{name}"), temperature=temperature)
+        return calls
+    
+    def _complete_with_openai(self, prompt: str, max_tokens: int, temperature: Optional[float] = None):
+        """(text, (prompt tokens, completion tokens)) from OpenAI"""
         response = self.openai_client.chat.completions.create(
             model=settings.OPENAI_MODEL,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=200
+            max_tokens=max_tokens,
+            **({"temperature": temperature} if temperature is not None else {})
+        )
+        return response.choices[0].message.content, _usage(
+            getattr(response, "usage", None), "prompt_tokens", "completion_tokens"
         )
-        
-        result = response.choices[0].message.content
-        return self._parse_ai_response(result)
     
-    def _detect_with_groq(self, prompt: str) -> Dict:
-        """Detect paraphrase using Groq"""
+    def _complete_with_groq(self, prompt: str, max_tokens: int, temperature: Optional[float] = None):
+        """(text, (prompt tokens, completion tokens)) from Groq"""
         response = self.groq_client.chat.completions.create(
             model=settings.GROQ_MODEL,
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.3,
-            max_tokens=200
+            max_tokens=max_tokens,
+            **({"temperature": temperature} if temperature is not None else {})
+        )
+        return response.choices[0].message.content, _usage(
+            getattr(response, "usage", None), "prompt_tokens", "completion_tokens"
         )
-        
-        result = response.choices[0].message.content
-        return self._parse_ai_response(result)
     
-    def _detect_with_gemini(self, prompt: str) -> Dict:
-        """Detect paraphrase using Gemini"""
-        response = self.gemini_model.generate_content(prompt)
-        result = response.text
-        return self._parse_ai_response(result)
+    def _complete_with_gemini(self, prompt: str, max_tokens: int, temperature: Optional[float] = None):
+        """(text, (prompt tokens, completion tokens)) from Gemini"""
+        config = {"max_output_tokens": max_tokens}
+        if temperature is not None:
+            config["temperature"] = temperature
+        response = self.gemini_model.generate_content(prompt, generation_config=config)
+        return response.text, _usage(
+            getattr(response, "usage_metadata", None), "prompt_token_count", "candidates_token_count"
+        )
     
     def _parse_ai_response(self, response: str) -> Dict:
         """Parse AI response to extract structured data"""
@@ -93,7 +172,15 @@ Response:"""
             # Try to extract JSON
             json_match = re.search(r'\{[^}]+\}', response)
             if json_match:
-                return json.loads(json_match.group())
+                data = json.loads(json_match.group())
+                if "p" in data:
+                    # Compact verdict: {"p": 0|1, "c": confidence}
+                    return {
+                        "is_paraphrase": bool(data["p"]),
+                        "confidence": int(data.get("c", 50)),
+                        "explanation": ""
+                    }
+                return data
             
             # Fallback parsing
             is_paraphrase = "true" in response.lower() or "yes" in response.lower()
@@ -111,32 +198,11 @@ Response:"""
     
     def generate_summary(self, text: str, max_length: int = 200) -> str:
         """Generate summary of text using AI"""
-        prompt = f"Summarize the following text in {max_length} characters or less:\n\n{text}"
+        prompt = summary_prompt(text, max_length)
         
-        for ai_method in settings.AI_PRIORITY.split(","):
-            try:
-                if ai_method == "groq" and self.groq_client:
-                    response = self.groq_client.chat.completions.create(
-                        model=settings.GROQ_MODEL,
-                        messages=[{"role": "user", "content": prompt}],
-                        max_tokens=100
-                    )
-                    return response.choices[0].message.content
-                
-                elif ai_method == "gemini" and self.gemini_model:
-                    response = self.gemini_model.generate_content(prompt)
-                    return response.text
-                
-                elif ai_method == "openai" and self.openai_client:
-                    response = self.openai_client.chat.completions.create(
-                        model=settings.OPENAI_MODEL,
-                        messages=[{"role": "user", "content": prompt}],
-                        max_tokens=100
-                    )
-                    return response.choices[0].message.content
-            except Exception as e:
-                print(f"Error with {ai_method}: {e}")
-                continue
+        summary = get_ai_scheduler().complete(prompt, self._provider_calls(), max_tokens=100)
+        if summary is not None:
+            return summary
         
         # Fallback: return first N characters
-        return text[:max_length] + "..." if len(text) > max_length else text
\ No newline at end of file
+        return text[:max_length] + "..." if len(text) > max_length else text
@@ -0,0 +1,257 @@
+"""
+Ingest-time analysis sidecar.
+
+Everything the detector derives from a document's text is computed once and
+stored next to the corpus as a directory of .npy arrays (memory-mapped on
+load) plus a small JSON file:
+
+    tokens.npy      uint32  hashed TF-IDF tokens (sklearn's default token pattern)
+    chunks.npy      int32   (chunks x 2) word offsets of each chunk
+    shingles.npy    uint32  sorted unique word-shingle hashes (MinHash shingles)
+    embeddings.npy  float16 (chunks x dim) chunk embeddings, when available
+    keywords.json           per-chunk search keywords and validity metadata
+"""
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.minhash_service import shingle_hashes
+from app.services.tokenized_document import TokenizedDocument, tokenize
+from app.services.chunker import TextChunk, chunk_bounds, make_chunk
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout or any derivation changes
+ANALYSIS_VERSION = 2
+
+# Same tokenization as sklearn's TfidfVectorizer default
+_TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+def token_hashes(text: str) -> np.ndarray:
+    """Lower-cased TF-IDF tokens of text as 32-bit hashes"""
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    return np.fromiter((zlib.crc32(t.encode()) for t in tokens), dtype=np.uint32, count=len(tokens))
+
+
+def term_counts(hashes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted unique token hashes and their counts"""
+    return np.unique(hashes, return_counts=True)
+
+
+class DocumentAnalysis:
+    """Precomputed per-document arrays (possibly memory-mapped)"""
+    
+    def __init__(
+        self,
+        tokens: np.ndarray,
+        chunk_bounds: np.ndarray,
+        shingles: np.ndarray,
+        keywords: List[List[str]],
+        embeddings: Optional[np.ndarray] = None,
+        meta: Optional[Dict] = None
+    ):
+        self.tokens = tokens
+        self.chunk_bounds = chunk_bounds
+        self.shingles = shingles
+        self.keywords = keywords
+        self.embeddings = embeddings
+        self.meta = meta or {}
+        self._counts = None
+    
+    def chunks(self, clean_text: str) -> List[TextChunk]:
+        """Chunks (with offsets), rebuilt from the stored word offsets"""
+        tokens = tokenize(clean_text)
+        return [
+            make_chunk(tokens, index, int(start), int(end))
+            for index, (start, end) in enumerate(self.chunk_bounds)
+        ]
+    
+    def term_counts(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._counts is None:
+            self._counts = term_counts(self.tokens)
+        return self._counts
+    
+    def chunk_embeddings(self) -> Optional[List[List[float]]]:
+        if self.embeddings is None:
+            return None
+        return np.asarray(self.embeddings, dtype=np.float32).tolist()
+
+
+class AnalysisStore:
+    """Builds, persists and loads document analysis sidecars"""
+    
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or settings.ANALYSIS_DIR
+        self._text_processor = None
+        self._embedding_service = None
+        self._lock = threading.Lock()
+    
+    @property
+    def text_processor(self):
+        if self._text_processor is None:
+            from app.services.text_processor import TextProcessor
+            self._text_processor = TextProcessor()
+        return self._text_processor
+    
+    @property
+    def embedding_service(self):
+        if self._embedding_service is None:
+            from app.services.embedding_service import EmbeddingService
+            self._embedding_service = EmbeddingService()
+        return self._embedding_service
+    
+    def path(self, document_id: int) -> str:
+        # Fan out so no single directory holds the whole corpus
+        return os.path.join(self.root, f"{document_id % 1000:03d}", str(document_id))
+    
+    def _meta(self, document) -> Dict:
+        return {
+            'version': ANALYSIS_VERSION,
+            'content_hash': document.content_hash,
+            'chunk_size': settings.CHUNK_SIZE,
+            'overlap': settings.OVERLAP,
+            'sentence_aware': settings.SENTENCE_AWARE_CHUNKING,
+            'shingle_size': settings.MINHASH_SHINGLE_SIZE,
+            'embedding_model': settings.EMBEDDING_MODEL
+        }
+    
+    def chunk_bounds(self, tokens: TokenizedDocument) -> np.ndarray:
+        """Word offsets of the chunks TextProcessor.chunk_text produces"""
+        bounds = list(chunk_bounds(tokens, settings.CHUNK_SIZE, settings.OVERLAP))
+        return np.array(bounds, dtype=np.int32).reshape(-1, 2)
+    
+    def _keywords(self, chunk: str) -> List[str]:
+        # An empty list makes the web stage extract keywords itself
+        try:
+            return self.text_processor.extract_keywords(chunk, top_n=5)
+        except Exception as e:
+            logger.warning(f"Keyword extraction failed: {e}")
+            return []
+    
+    def build(self, document, embeddings: Optional[List[List[float]]] = None, embed: bool = False) -> DocumentAnalysis:
+        """Analyze a document (embedding its chunks if asked and none are given)"""
+        clean_text = self.text_processor.clean_text(document.content or "")
+        tokens = tokenize(clean_text)
+        bounds = self.chunk_bounds(tokens)
+        chunks = [tokens[start:end].text for start, end in bounds]
+        
+        if embeddings is None and embed and chunks:
+            embeddings = self.embedding_service.generate_embeddings(chunks)
+        
+        return DocumentAnalysis(
+            tokens=token_hashes(clean_text),
+            chunk_bounds=bounds,
+            shingles=np.unique(shingle_hashes(clean_text).astype(np.uint32)),
+            keywords=[self._keywords(chunk) for chunk in chunks],
+            embeddings=np.asarray(embeddings, dtype=np.float16) if embeddings else None,
+            meta=self._meta(document)
+        )
+    
+    def save(self, document_id: int, analysis: DocumentAnalysis):
+        """Write the sidecar atomically (a temp directory renamed into place)"""
+        target = self.path(document_id)
+        parent = os.path.dirname(target)
+        os.makedirs(parent, exist_ok=True)
+        
+        tmp_dir = tempfile.mkdtemp(prefix=f".{document_id}.", dir=parent)
+        try:
+            np.save(os.path.join(tmp_dir, "tokens.npy"), analysis.tokens)
+            np.save(os.path.join(tmp_dir, "chunks.npy"), analysis.chunk_bounds)
+            np.save(os.path.join(tmp_dir, "shingles.npy"), analysis.shingles)
+            if analysis.embeddings is not None:
+                np.save(os.path.join(tmp_dir, "embeddings.npy"), analysis.embeddings)
+            with open(os.path.join(tmp_dir, "keywords.json"), "w") as handle:
+                json.dump({'meta': analysis.meta, 'keywords': analysis.keywords}, handle)
+            
+            with self._lock:
+                if os.path.exists(target):
+                    shutil.rmtree(target, ignore_errors=True)
+                os.replace(tmp_dir, target)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+    
+    def load(self, document) -> Optional[DocumentAnalysis]:
+        """Memory-map a document's sidecar, or None if missing or stale"""
+        target = self.path(document.id)
+        try:
+            with open(os.path.join(target, "keywords.json")) as handle:
+                stored = json.load(handle)
+        except (OSError, ValueError):
+            return None
+        
+        meta = stored.get('meta', {})
+        expected = self._meta(document)
+        if any(meta.get(k) != v for k, v in expected.items() if k != 'embedding_model'):
+            return None
+        
+        try:
+            embeddings = None
+            embeddings_path = os.path.join(target, "embeddings.npy")
+            if meta.get('embedding_model') == settings.EMBEDDING_MODEL and os.path.exists(embeddings_path):
+                embeddings = np.load(embeddings_path, mmap_mode="r")
+            return DocumentAnalysis(
+                tokens=np.load(os.path.join(target, "tokens.npy"), mmap_mode="r"),
+                chunk_bounds=np.load(os.path.join(target, "chunks.npy"), mmap_mode="r"),
+                shingles=np.load(os.path.join(target, "shingles.npy"), mmap_mode="r"),
+                keywords=stored.get('keywords', []),
+                embeddings=embeddings,
+                meta=meta
+            )
+        except (OSError, ValueError) as e:
+            logger.warning(f"Unreadable analysis sidecar for document {document.id}: {e}")
+            return None
+    
+    def get_or_build(self, document, embed: bool = False) -> DocumentAnalysis:
+        """Load the sidecar, (re)building and saving it when missing, stale or lacking embeddings"""
+        analysis = self.load(document)
+        if analysis is not None and (analysis.embeddings is not None or not embed):
+            return analysis
+        
+        if analysis is not None:
+            # Only the embeddings are missing: keep the rest of the sidecar
+            chunks = analysis.chunks(self.text_processor.clean_text(document.content or ""))
+            embeddings = self.embedding_service.generate_embeddings(chunks) if chunks else None
+            if embeddings is None:
+                return analysis
+            analysis = DocumentAnalysis(
+                tokens=np.array(analysis.tokens),
+                chunk_bounds=np.array(analysis.chunk_bounds),
+                shingles=np.array(analysis.shingles),
+                keywords=analysis.keywords,
+                embeddings=np.asarray(embeddings, dtype=np.float16),
+                meta=self._meta(document)
+            )
+        else:
+            analysis = self.build(document, embed=embed)
+        
+        try:
+            self.save(document.id, analysis)
+        except Exception as e:
+            logger.warning(f"Could not save analysis sidecar for document {document.id}: {e}")
+        return analysis
+    
+    def delete(self, document_id: int):
+        shutil.rmtree(self.path(document_id), ignore_errors=True)
+
+
+_store: Optional[AnalysisStore] = None
+
+
+def get_analysis_store() -> Optional[AnalysisStore]:
+    """Return the process-wide analysis store, or None if sidecars are disabled"""
+    global _store
+    
+    if not settings.ENABLE_ANALYSIS_SIDECAR:
+        return None
+    if _store is None:
+        _store = AnalysisStore()
+    return _store
\ No newline at end of file
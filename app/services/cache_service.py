@@ -1,28 +1,192 @@
 import redis
 import json
-from typing import Optional, Any
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Any, Dict, Iterable, List, Tuple
 from app.core.config import settings
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Try to import msgpack, fall back to JSON bytes
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+    logger.warning("msgpack not installed. Cache values will be JSON encoded.")
+
+# Marks a key known to be absent (negative caching)
+_MISSING = object()
+
+# Corpus versions per visibility domain (a Redis hash): one field per institution,
+# SHARED_EPOCH for documents without an institution and reference corpora (seen by
+# every check) and CROSS_EPOCH for checks allowed to see every institution
+CORPUS_EPOCHS_KEY = "corpus:epochs"
+SHARED_EPOCH = "shared"
+CROSS_EPOCH = "cross"
+
+
+def corpus_epoch_fields(institution_id: Optional[int], allow_cross_institution: bool = False) -> List[str]:
+    """Epoch fields covering every document a check for this institution can see"""
+    if allow_cross_institution:
+        return [SHARED_EPOCH, CROSS_EPOCH]
+    if institution_id is None:
+        return [SHARED_EPOCH]
+    return [SHARED_EPOCH, f"inst:{institution_id}"]
+
+
+def encode_value(value: Any) -> bytes:
+    """Tagged binary encoding: b'm' + msgpack, or b'j' + JSON"""
+    if MSGPACK_AVAILABLE:
+        return b"m" + msgpack.packb(value, use_bin_type=True)
+    return b"j" + json.dumps(value).encode()
+
+
+def decode_value(data: bytes) -> Any:
+    tag, payload = data[:1], data[1:]
+    if tag == b"m" and MSGPACK_AVAILABLE:
+        return msgpack.unpackb(payload, raw=False)
+    if tag == b"j":
+        return json.loads(payload)
+    raise ValueError("Unknown cache encoding")
+
+
+def check_cache_key(
+    content_hash: str,
+    check_settings: Dict,
+    institution_id: Optional[int],
+    corpus_epoch: str
+) -> str:
+    """Result key covering everything a check result depends on"""
+    flags = "".join(
+        stage[0] if check_settings.get(f"check_{stage}", True) else "-"
+        for stage in ("web", "database", "institution", "reference")
+    )
+    return f"plagiarism_check:v3:{content_hash}:{flags}:{institution_id or 0}:{corpus_epoch}"
+
+
+class LocalCache:
+    """Bounded in-process LRU with per-entry expiry"""
+    
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[Any]:
+        """The value, _MISSING for a cached miss, or None if unknown"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: Any, ttl: float):
+        if self.max_items <= 0 or ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+    
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
 
 
 class CacheService:
-    """Redis cache service for storing temporary data"""
+    """Two-tier cache: in-process LRU/TTL tier in front of a shared Redis tier"""
     
     def __init__(self):
-        self.redis_client = redis.from_url(
-            settings.REDIS_URL,
-            decode_responses=True
-        )
+        self.local = LocalCache(settings.CACHE_LOCAL_MAX_ITEMS)
+        self._pool = None
+        self._client = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+    
+    @property
+    def redis_client(self) -> Optional[redis.Redis]:
+        """Pooled client, connected lazily; None while Redis is marked down"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._pool = redis.ConnectionPool.from_url(
+                        settings.REDIS_URL,
+                        max_connections=settings.REDIS_MAX_CONNECTIONS,
+                        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                        socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT
+                    )
+                    self._client = redis.Redis(connection_pool=self._pool)
+        if time.monotonic() < self._retry_at:
+            return None
+        return self._client
+    
+    def mark_redis_failed(self, operation: str, error: Exception):
+        """Record a failed Redis call (by this service or a caller using redis_client) and skip Redis for a while"""
+        logger.warning(f"Cache {operation} error: {error}")
+        metrics.increment("cache.redis.error")
+        self._retry_at = time.monotonic() + settings.REDIS_RETRY_AFTER_SECONDS
+    
+    def _local_ttl(self, expiry: int) -> float:
+        # Bound how long other processes' writes can go unseen
+        return min(expiry, settings.CACHE_LOCAL_TTL_SECONDS)
     
     def get(self, key: str) -> Optional[Any]:
         """Get value from cache"""
+        return self.get_many([key]).get(key)
+    
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """Values for the keys found in either tier (one pipelined Redis call for local misses)"""
+        results = {}
+        remote_keys = []
+        for key in keys:
+            value = self.local.get(key)
+            if value is None:
+                remote_keys.append(key)
+            elif value is not _MISSING:
+                results[key] = value
+        metrics.increment("cache.local.hit", len(results))
+        metrics.increment("cache.local.miss", len(remote_keys))
+        
+        client = self.redis_client if remote_keys else None
+        if client is None:
+            return results
+        
+        start = time.perf_counter()
         try:
-            value = self.redis_client.get(key)
-            if value:
-                return json.loads(value)
-            return None
+            raw_values = client.mget(remote_keys)
         except Exception as e:
-            print(f"Cache get error: {e}")
-            return None
+            self.mark_redis_failed("get", e)
+            return results
+        metrics.observe("cache.redis.get_latency_ms", (time.perf_counter() - start) * 1000)
+        
+        for key, raw in zip(remote_keys, raw_values):
+            if raw is None:
+                metrics.increment("cache.redis.miss")
+                self.local.set(key, _MISSING, settings.CACHE_NEGATIVE_TTL_SECONDS)
+                continue
+            try:
+                value = decode_value(raw)
+            except Exception as e:
+                logger.warning(f"Cache decode error for {key}: {e}")
+                metrics.increment("cache.redis.miss")
+                continue
+            metrics.increment("cache.redis.hit")
+            results[key] = value
+            self.local.set(key, value, settings.CACHE_LOCAL_TTL_SECONDS)
+        return results
     
     def set(
         self,
@@ -31,41 +195,127 @@ class CacheService:
         expiry: int = 3600
     ) -> bool:
         """Set value in cache with expiry (seconds)"""
+        return self.set_many({key: value}, expiry=expiry)
+    
+    def set_many(self, values: Dict[str, Any], expiry: int = 3600) -> bool:
+        """Write both tiers; Redis writes go out in one pipeline"""
+        for key, value in values.items():
+            self.local.set(key, value, self._local_ttl(expiry))
+        
+        client = self.redis_client
+        if client is None or not values:
+            return False
+        
+        start = time.perf_counter()
         try:
-            serialized = json.dumps(value)
-            self.redis_client.setex(key, expiry, serialized)
-            return True
+            pipeline = client.pipeline(transaction=False)
+            for key, value in values.items():
+                pipeline.setex(key, expiry, encode_value(value))
+            pipeline.execute()
         except Exception as e:
-            print(f"Cache set error: {e}")
+            self.mark_redis_failed("set", e)
             return False
+        metrics.observe("cache.redis.set_latency_ms", (time.perf_counter() - start) * 1000)
+        return True
     
     def delete(self, key: str) -> bool:
         """Delete key from cache"""
+        self.local.delete(key)
+        client = self.redis_client
+        if client is None:
+            return False
         try:
-            self.redis_client.delete(key)
+            client.delete(key)
             return True
         except Exception as e:
-            print(f"Cache delete error: {e}")
+            self.mark_redis_failed("delete", e)
             return False
     
     def exists(self, key: str) -> bool:
         """Check if key exists"""
+        return key in self.get_many([key])
+    
+    def stats(self) -> Dict:
+        """Per-tier counters (also reported through /metrics)"""
+        counters = metrics.snapshot()['counters']
+        return {
+            'local': {
+                'items': len(self.local),
+                'hits': counters.get('cache.local.hit', 0),
+                'misses': counters.get('cache.local.miss', 0)
+            },
+            'redis': {
+                'hits': counters.get('cache.redis.hit', 0),
+                'misses': counters.get('cache.redis.miss', 0),
+                'errors': counters.get('cache.redis.error', 0),
+                'get_p95_ms': metrics.percentile('cache.redis.get_latency_ms', 95)
+            }
+        }
+    
+    def get_corpus_epoch(
+        self,
+        institution_id: Optional[int] = None,
+        allow_cross_institution: bool = False
+    ) -> Optional[str]:
+        """
+        Version of the corpus a check for this institution can see (its domains'
+        epochs joined), or None if Redis is unreachable
+        """
+        client = self.redis_client
+        if client is None:
+            return None
         try:
-            return self.redis_client.exists(key) > 0
+            values = client.hmget(CORPUS_EPOCHS_KEY, corpus_epoch_fields(institution_id, allow_cross_institution))
+            return ".".join(str(int(value or 0)) for value in values)
         except Exception as e:
-            print(f"Cache exists error: {e}")
-            return False
+            self.mark_redis_failed("epoch", e)
+            return None
     
-    def cache_document_check(self, content_hash: str, result: dict, hours: int = 24):
-        """Cache plagiarism check result"""
-        key = f"plagiarism_check:{content_hash}"
-        self.set(key, result, expiry=hours * 3600)
+    def bump_corpus_epoch(self, institution_id: Optional[int] = None) -> Optional[int]:
+        """
+        Invalidate cached results of the checks that can see a changed document of
+        institution_id: its own institution's and cross-institution checks, or every
+        check for a shared document or reference corpus (institution_id None)
+        """
+        client = self.redis_client
+        if client is None:
+            return None
+        fields = [SHARED_EPOCH] if institution_id is None else [f"inst:{institution_id}", CROSS_EPOCH]
+        try:
+            pipeline = client.pipeline(transaction=False)
+            for field in fields:
+                pipeline.hincrby(CORPUS_EPOCHS_KEY, field, 1)
+            return pipeline.execute()[0]
+        except Exception as e:
+            self.mark_redis_failed("epoch", e)
+            return None
     
-    def get_cached_check(self, content_hash: str) -> Optional[dict]:
+    def cache_document_check(
+        self,
+        content_hash: str,
+        result: dict,
+        check_settings: Dict,
+        institution_id: Optional[int],
+        corpus_epoch: Optional[str],
+        hours: Optional[int] = None
+    ):
+        """Cache plagiarism check result under the corpus epoch the check started at"""
+        if not settings.ENABLE_CACHING or corpus_epoch is None:
+            return
+        key = check_cache_key(content_hash, check_settings, institution_id, corpus_epoch)
+        self.set(key, result, expiry=(hours or settings.CACHE_EXPIRY_HOURS) * 3600)
+    
+    def get_cached_check(
+        self,
+        content_hash: str,
+        check_settings: Dict,
+        institution_id: Optional[int],
+        corpus_epoch: Optional[str]
+    ) -> Optional[dict]:
         """Get cached plagiarism check result"""
-        key = f"plagiarism_check:{content_hash}"
-        return self.get(key)
-
+        if not settings.ENABLE_CACHING or corpus_epoch is None:
+            return None
+        return self.get(check_cache_key(content_hash, check_settings, institution_id, corpus_epoch))
 
-# Global instance
+# Global instance (connects to Redis on first use)
 cache_service = CacheService()
\ No newline at end of file
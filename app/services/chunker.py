@@ -0,0 +1,143 @@
+"""
+Sentence-aware chunking with exact offsets.
+
+Chunks end on a sentence boundary when one falls in the second half of the
+window (otherwise the window is cut at chunk_size words), and the next chunk
+starts on the first sentence boundary inside the overlap (or a plain
+overlap-word step back when there is none). Every chunk is a
+TextChunk: a plain string that also knows its word and character span in the
+cleaned document, so match positions no longer have to be reconstructed from
+the chunk index.
+"""
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.tokenized_document import TextLike, TokenizedDocument, tokenize
+
+# Chunks shorter than this are dropped (or merged into the previous chunk)
+MIN_CHUNK_WORDS = 10
+
+_SENTENCE_END = ".!?"
+
+
+class TextChunk(str):
+    """Chunk text carrying its position in the cleaned document"""
+    
+    def __new__(
+        cls,
+        text: str,
+        index: int = 0,
+        word_start: int = 0,
+        word_end: int = 0,
+        char_start: int = 0,
+        char_end: int = 0
+    ):
+        chunk = super().__new__(cls, text)
+        chunk.index = index
+        chunk.word_start = word_start
+        chunk.word_end = word_end
+        chunk.char_start = char_start
+        chunk.char_end = char_end
+        return chunk
+    
+    @property
+    def word_count(self) -> int:
+        return self.word_end - self.word_start
+    
+    def __reduce__(self):
+        return (
+            TextChunk,
+            (str(self), self.index, self.word_start, self.word_end, self.char_start, self.char_end)
+        )
+
+
+def sentence_starts(tokens: TokenizedDocument) -> np.ndarray:
+    """Word indices that begin a sentence (after a word ending in . ! or ?)"""
+    source = tokens.source
+    ends_sentence = np.fromiter(
+        (source[end - 1] in _SENTENCE_END for end in tokens.ends.tolist()),
+        dtype=bool,
+        count=len(tokens)
+    )
+    return np.flatnonzero(ends_sentence[:-1]) + 1
+
+
+def chunk_bounds(
+    tokens: TokenizedDocument,
+    chunk_size: int,
+    overlap: int,
+    sentence_aware: Optional[bool] = None
+) -> Iterator[Tuple[int, int]]:
+    """Lazily yield (word_start, word_end) of each chunk"""
+    if sentence_aware is None:
+        sentence_aware = settings.SENTENCE_AWARE_CHUNKING
+    total = len(tokens)
+    step = max(chunk_size - overlap, 1)
+    
+    if not sentence_aware:
+        # Fixed word windows
+        for start in range(0, total, step):
+            end = min(start + chunk_size, total)
+            if end - start >= MIN_CHUNK_WORDS:
+                yield start, end
+        return
+    
+    boundaries = sentence_starts(tokens)
+    start = 0
+    while start < total:
+        end = min(start + chunk_size, total)
+        if end < total:
+            # Last sentence boundary in the second half of the window
+            i = np.searchsorted(boundaries, end, side="right") - 1
+            if i >= 0 and boundaries[i] - start >= chunk_size // 2:
+                end = int(boundaries[i])
+            # Fold a short tail into this chunk rather than emit a fragment
+            if total - end < MIN_CHUNK_WORDS:
+                end = total
+        if end - start >= MIN_CHUNK_WORDS:
+            yield start, end
+        if end >= total:
+            return
+        
+        # Overlap from the first sentence start in the last `overlap` words
+        # (or exactly `overlap` words when no sentence starts there)
+        next_start = end - overlap
+        i = np.searchsorted(boundaries, next_start, side="left")
+        if i < len(boundaries) and boundaries[i] < end:
+            next_start = int(boundaries[i])
+        start = max(next_start, start + 1)
+
+
+def iter_chunks(
+    text: TextLike,
+    chunk_size: int,
+    overlap: int,
+    sentence_aware: Optional[bool] = None
+) -> Iterator[TextChunk]:
+    """Lazily yield the chunks of text with their word and character offsets"""
+    tokens = tokenize(text)
+    for index, (start, end) in enumerate(chunk_bounds(tokens, chunk_size, overlap, sentence_aware)):
+        yield make_chunk(tokens, index, start, end)
+
+
+def make_chunk(tokens: TokenizedDocument, index: int, start: int, end: int) -> TextChunk:
+    span = tokens[start:end]
+    return TextChunk(
+        span.text,
+        index=index,
+        word_start=start,
+        word_end=end,
+        char_start=int(span.starts[0]),
+        char_end=int(span.ends[-1])
+    )
+
+
+def merge_spans(spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Union of half-open [start, end) spans as sorted, disjoint spans"""
+    merged = []
+    for start, end in sorted(span for span in spans if span[1] > span[0]):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
\ No newline at end of file
@@ -0,0 +1,37 @@
+"""
+Which stored documents a check may use as sources.
+
+Mirrors vector_db.visible_shards for rows of the documents table: an
+institution sees its own documents and shared ones (no institution), and
+every institution's only when cross-institution checks are allowed
+(VECTOR_CROSS_INSTITUTION_SEARCH or the institution's allow_cross_check).
+"""
+from typing import Optional
+from sqlalchemy import or_
+from app.core.config import settings
+from app.models.document import Document
+
+
+def allows_cross_institution(institution) -> bool:
+    """Whether checks for this institution may use other institutions' documents"""
+    if settings.VECTOR_CROSS_INSTITUTION_SEARCH:
+        return True
+    return bool(institution and (institution.settings or {}).get('allow_cross_check'))
+
+
+def visible_documents(query, institution_id: Optional[int], allow_cross_institution: bool = False):
+    """query restricted to documents the given institution may see"""
+    if allow_cross_institution:
+        return query
+    if institution_id is None:
+        return query.filter(Document.institution_id.is_(None))
+    return query.filter(or_(Document.institution_id == institution_id, Document.institution_id.is_(None)))
+
+
+def visible_to(query, document: Document):
+    """query restricted to documents a check of document may use"""
+    return visible_documents(
+        query,
+        document.institution_id,
+        allow_cross_institution=allows_cross_institution(document.institution)
+    )
@@ -0,0 +1,159 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingCache:
+    """Content-addressed embedding cache: in-process LRU in front of SQLite"""
+    
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        model_tag: Optional[str] = None,
+        dtype: Optional[str] = None,
+        memory_items: Optional[int] = None
+    ):
+        self.path = path or settings.EMBEDDING_CACHE_PATH
+        self.model_tag = model_tag or f"{settings.EMBEDDING_MODEL}@{settings.EMBEDDING_CACHE_VERSION}"
+        self.dtype = np.dtype(dtype or settings.EMBEDDING_CACHE_DTYPE)
+        self.memory_items = memory_items if memory_items is not None else settings.EMBEDDING_CACHE_MEMORY_ITEMS
+        
+        self._memory: "OrderedDict[bytes, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self.hits = 0
+        self.misses = 0
+    
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        """Open the SQLite store on first use"""
+        if self._conn is not None:
+            return self._conn
+        
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key BLOB PRIMARY KEY, dtype TEXT NOT NULL, vector BLOB NOT NULL)"
+            )
+            self._conn = conn
+        except Exception as e:
+            logger.error(f"Failed to open embedding cache at {self.path}: {e}")
+            self._conn = None
+        return self._conn
+    
+    def make_key(self, text: str) -> bytes:
+        """Hash chunk content together with the model version tag"""
+        return hashlib.sha256(f"{self.model_tag}\x00{text}".encode("utf-8")).digest()
+    
+    def _remember(self, key: bytes, vector: List[float]):
+        """Insert into the in-process LRU tier (caller holds the lock)"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+    
+    def get_many(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """Look up embeddings for texts, returning None for each miss"""
+        keys = [self.make_key(t) for t in texts]
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        pending: Dict[bytes, List[int]] = {}
+        
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                else:
+                    pending.setdefault(key, []).append(i)
+            
+            conn = self._connect() if pending else None
+            if conn is not None:
+                try:
+                    pending_keys = list(pending)
+                    # Stay well below SQLite's bound-parameter limit
+                    for start in range(0, len(pending_keys), 500):
+                        batch = pending_keys[start:start + 500]
+                        placeholders = ",".join("?" * len(batch))
+                        rows = conn.execute(
+                            f"SELECT key, dtype, vector FROM embeddings WHERE key IN ({placeholders})",
+                            batch
+                        ).fetchall()
+                        for key, dtype, blob in rows:
+                            vector = np.frombuffer(blob, dtype=dtype).astype(np.float32).tolist()
+                            self._remember(key, vector)
+                            for i in pending[key]:
+                                results[i] = vector
+                except Exception as e:
+                    logger.error(f"Embedding cache read error: {e}")
+        
+        found = sum(1 for r in results if r is not None)
+        self.hits += found
+        self.misses += len(texts) - found
+        return results
+    
+    def set_many(self, texts: List[str], vectors: List[List[float]]) -> List[List[float]]:
+        """
+        Store freshly computed embeddings in both tiers. Returns the vectors as
+        stored (rounded to the cache dtype), which is what later hits return, so
+        callers should use these rather than the model's output.
+        """
+        rows, stored = [], []
+        with self._lock:
+            for text, vector in zip(texts, vectors):
+                key = self.make_key(text)
+                array = np.asarray(vector, dtype=self.dtype)
+                served = array.astype(np.float32).tolist()
+                self._remember(key, served)
+                stored.append(served)
+                rows.append((key, self.dtype.name, array.tobytes()))
+            
+            conn = self._connect()
+            if conn is None:
+                return stored
+            try:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, dtype, vector) VALUES (?, ?, ?)",
+                    rows
+                )
+                conn.commit()
+            except Exception as e:
+                logger.error(f"Embedding cache write error: {e}")
+        return stored
+    
+    def stats(self) -> Dict:
+        """Return hit/miss counters"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / total * 100) if total else 0.0,
+            "memory_items": len(self._memory)
+        }
+
+
+_cache: Optional[EmbeddingCache] = None
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Return the process-wide embedding cache, or None if disabled"""
+    global _cache
+    
+    if not settings.ENABLE_EMBEDDING_CACHE:
+        return None
+    if _cache is None:
+        _cache = EmbeddingCache()
+    return _cache
\ No newline at end of file
@@ -0,0 +1,230 @@
+"""
+Shared embedding server.
+
+Hosts a single copy of the sentence-transformer model and coalesces
+concurrent requests from API workers and Celery tasks into micro-batches.
+
+Run with: python -m app.services.embedding_server
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+from typing import List, Optional, Tuple, Union
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _parse_address(address: str) -> Union[str, Tuple[str, int]]:
+    """Turn 'host:port' into a TCP address, anything else is a Unix socket path"""
+    if not address.startswith("/") and ":" in address:
+        host, port = address.rsplit(":", 1)
+        return host, int(port)
+    return address
+
+
+def _authkey() -> bytes:
+    return settings.SECRET_KEY.encode("utf-8")
+
+
+class _PendingRequest:
+    """A client request waiting to be served by the batcher"""
+    
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.done = threading.Event()
+        self.embeddings: Optional[List[List[float]]] = None
+        self.error: Optional[str] = None
+
+
+class EmbeddingServer:
+    """Model-hosting process that serves embeddings in dynamic micro-batches"""
+    
+    def __init__(
+        self,
+        address: Optional[str] = None,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None
+    ):
+        self.address = _parse_address(address or settings.EMBEDDING_SERVER_ADDRESS)
+        self.max_batch_size = max_batch_size or settings.EMBEDDING_SERVER_MAX_BATCH
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else settings.EMBEDDING_SERVER_MAX_WAIT_MS) / 1000
+        self._queue: "queue.Queue[_PendingRequest]" = queue.Queue()
+        self._model = None
+    
+    def serve_forever(self):
+        """Load the model and accept client connections until interrupted"""
+        from app.services.embedding_service import _load_model
+        
+        self._model = _load_model()
+        if self._model is None:
+            raise RuntimeError("Embedding model could not be loaded")
+        
+        if isinstance(self.address, str) and os.path.exists(self.address):
+            os.remove(self.address)
+        
+        threading.Thread(target=self._batch_loop, daemon=True).start()
+        
+        with Listener(self.address, authkey=_authkey()) as listener:
+            logger.info(f"Embedding server listening on {self.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.error(f"Embedding server accept error: {e}")
+                    continue
+                threading.Thread(target=self._handle_connection, args=(conn,), daemon=True).start()
+    
+    def _handle_connection(self, conn):
+        """Serve requests from one client connection"""
+        try:
+            while True:
+                message = conn.recv()
+                request = _PendingRequest(list(message.get("texts", [])))
+                if request.texts:
+                    self._queue.put(request)
+                    request.done.wait()
+                else:
+                    request.embeddings = []
+                
+                if request.error:
+                    conn.send({"error": request.error})
+                else:
+                    conn.send({"embeddings": request.embeddings})
+        except EOFError:
+            pass
+        except Exception as e:
+            logger.error(f"Embedding server connection error: {e}")
+        finally:
+            conn.close()
+    
+    def _collect_batch(self) -> List[_PendingRequest]:
+        """Block for one request, then gather more until the batch fills or the deadline passes"""
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+        
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        
+        return batch
+    
+    def _batch_loop(self):
+        """Encode coalesced batches and hand each caller its slice"""
+        while True:
+            batch = self._collect_batch()
+            texts = [text for request in batch for text in request.texts]
+            
+            try:
+                embeddings = self._model.encode(
+                    texts,
+                    batch_size=self.max_batch_size,
+                    convert_to_numpy=True
+                ).tolist()
+                offset = 0
+                for request in batch:
+                    request.embeddings = embeddings[offset:offset + len(request.texts)]
+                    offset += len(request.texts)
+            except Exception as e:
+                logger.error(f"Embedding server encode error: {e}")
+                for request in batch:
+                    request.error = str(e)
+            finally:
+                for request in batch:
+                    request.done.set()
+
+
+class EmbeddingServerClient:
+    """Client for the shared embedding server (one connection per thread)"""
+    
+    def __init__(self, address: Optional[str] = None):
+        self.address = _parse_address(address or settings.EMBEDDING_SERVER_ADDRESS)
+        self._local = threading.local()
+        # After a failed connect or a timed-out request the server counts as down until this time
+        self._down_until = 0.0
+    
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        # Connections must not be shared with a forked child
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            try:
+                conn = Client(self.address, authkey=_authkey())
+            except Exception:
+                self._down_until = time.monotonic() + settings.EMBEDDING_SERVER_RETRY_SECONDS
+                raise
+            self._down_until = 0.0
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+    
+    def is_available(self) -> bool:
+        """Whether the server accepts connections (probes at most once per retry interval)"""
+        if time.monotonic() < self._down_until:
+            return False
+        try:
+            self._connection()
+            return True
+        except Exception as e:
+            logger.warning(f"Embedding server unreachable: {e}")
+            return False
+    
+    def _reset(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local.conn = None
+    
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        """Request embeddings for texts, reconnecting once on a broken connection"""
+        for attempt in range(2):
+            try:
+                conn = self._connection()
+                conn.send({"texts": texts})
+                response = conn.recv() if conn.poll(settings.EMBEDDING_SERVER_TIMEOUT) else None
+                break
+            except (EOFError, OSError):
+                self._reset()
+                if attempt == 1:
+                    raise
+        
+        if response is None:
+            # A late reply must not be read as the answer to the next request
+            self._reset()
+            self._down_until = time.monotonic() + settings.EMBEDDING_SERVER_RETRY_SECONDS
+            raise TimeoutError(f"Embedding server did not answer within {settings.EMBEDDING_SERVER_TIMEOUT}s")
+        if "error" in response:
+            raise RuntimeError(f"Embedding server error: {response['error']}")
+        return response["embeddings"]
+
+
+_client: Optional[EmbeddingServerClient] = None
+
+
+def get_embedding_client() -> Optional[EmbeddingServerClient]:
+    """Return the process-wide server client, or None if no server is configured"""
+    global _client
+    
+    if not settings.EMBEDDING_SERVER_ADDRESS:
+        return None
+    if _client is None:
+        _client = EmbeddingServerClient()
+    return _client
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    EmbeddingServer().serve_forever()
\ No newline at end of file
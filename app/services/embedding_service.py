@@ -1,6 +1,9 @@
 from typing import List, Optional
 import numpy as np
 import logging
+from app.core.config import settings
+from app.services.embedding_cache import get_embedding_cache
+from app.services.embedding_server import get_embedding_client
 
 logger = logging.getLogger(__name__)
 
@@ -18,7 +21,7 @@ def _load_model():
     
     try:
         from sentence_transformers import SentenceTransformer
-        _model = SentenceTransformer('all-MiniLM-L6-v2')
+        _model = SentenceTransformer(settings.EMBEDDING_MODEL, device=settings.DEVICE)
         _model_loaded = True
         logger.info("✅ Sentence transformer model loaded successfully")
         return _model
@@ -37,22 +40,46 @@ class EmbeddingService:
     
     def generate_embedding(self, text: str) -> Optional[List[float]]:
         """Generate embedding for text"""
-        model = _load_model()
+        embeddings = self.generate_embeddings([text])
+        return embeddings[0] if embeddings else None
+    
+    def generate_embeddings(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Generate embeddings for multiple texts, encoding only cache misses"""
+        if not texts:
+            return []
         
-        if model is None:
-            logger.warning("Embedding model not available")
-            # Return a dummy embedding or raise error
-            return None
+        cache = get_embedding_cache()
+        results = cache.get_many(texts) if cache else [None] * len(texts)
         
-        try:
-            embedding = model.encode(text, convert_to_numpy=True)
-            return embedding.tolist()
-        except Exception as e:
-            logger.error(f"Error generating embedding: {e}")
-            return None
+        # Encode each distinct missing text once, then fill results in order
+        missing = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+        if missing:
+            encoded = self._encode(missing)
+            if encoded is None:
+                return None
+            
+            if cache:
+                # Serve the stored (dtype-rounded) vectors so hits and misses agree
+                encoded = cache.set_many(missing, encoded)
+            
+            by_text = dict(zip(missing, encoded))
+            results = [r if r is not None else by_text[t] for t, r in zip(texts, results)]
+        
+        return results
     
-    def generate_embeddings(self, texts: List[str]) -> Optional[List[List[float]]]:
-        """Generate embeddings for multiple texts"""
+    def _encode(self, texts: List[str]) -> Optional[List[List[float]]]:
+        """Run the model on texts, via the shared embedding server if configured"""
+        client = get_embedding_client()
+        if client is not None:
+            # Skipped while a recent connect failed, instead of reconnecting per call
+            if client.is_available():
+                try:
+                    return client.encode(texts)
+                except Exception as e:
+                    logger.error(f"Embedding server unavailable: {e}")
+            if not settings.EMBEDDING_SERVER_FALLBACK_LOCAL:
+                return None
+        
         model = _load_model()
         
         if model is None:
@@ -86,5 +113,11 @@ class EmbeddingService:
     
     def is_available(self) -> bool:
         """Check if embedding service is available"""
+        client = get_embedding_client()
+        if client is not None:
+            if client.is_available():
+                return True
+            if not settings.EMBEDDING_SERVER_FALLBACK_LOCAL:
+                return False
         model = _load_model()
         return model is not None
\ No newline at end of file
@@ -0,0 +1,201 @@
+"""
+Size-capped fetching and boilerplate-free text extraction for web pages.
+
+The response is streamed and cut off at WEB_FETCH_MAX_BYTES, and responses
+whose Content-Type is not text are rejected from the headers alone, before
+any body is read. HTML is parsed with lxml (BeautifulSoup's html.parser is
+the fallback when lxml is missing). Non-content elements (scripts, styles,
+forms, navigation, headers and footers) are dropped, along with elements
+whose class or id marks them as chrome (menus, cookie banners, share
+widgets, related links) and link lists whose text is mostly anchor text.
+Block elements end lines, so headings and paragraphs don't run together.
+"""
+import logging
+import re
+from typing import Optional, Tuple
+import requests
+from app.core.config import settings
+from app.services.http_clients import get_http_session
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Try to import lxml, fall back to BeautifulSoup's pure-Python parser
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+    LXML_AVAILABLE = True
+except ImportError:
+    LXML_AVAILABLE = False
+    logger.warning("lxml not installed. Pages will be parsed with html.parser (slower).")
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+# Never content
+_DROP_TAGS = (
+    "script", "style", "noscript", "template", "svg", "canvas", "iframe", "object", "embed",
+    "form", "button", "select", "input", "textarea", "nav", "header", "footer", "aside", "head"
+)
+# Elements that end a line of text
+_BLOCK_TAGS = (
+    "p", "div", "section", "article", "main", "li", "ul", "ol", "dl", "dt", "dd", "table", "tr",
+    "td", "th", "pre", "blockquote", "figcaption", "h1", "h2", "h3", "h4", "h5", "h6", "br", "hr"
+)
+# Containers judged by link density
+_LINK_LIST_TAGS = ("ul", "ol", "div", "section", "table")
+# Never judged as chrome, whatever their class says
+_CONTAINER_TAGS = ("html", "body", "main", "article")
+# class / id tokens that mark page chrome: the word itself, or a token starting or
+# ending with it (site-footer, nav-menu), but not modifiers like has-sidebar
+_CHROME_WORDS = (
+    r"nav|navbar|navigation|menu|breadcrumbs?|sidebar|footer|header|masthead|cookies?|consent|"
+    r"banner|share|sharing|social|advert|ads|promo|sponsored|related|recommended|newsletter|"
+    r"subscribe|signup|popup|modal|comments?|pagination|toolbar"
+)
+_CHROME_TOKEN = re.compile(
+    rf"^(?!(?:has|with|no|is)[-_])(?:(?:{_CHROME_WORDS})(?:[-_].*)?|.*[-_](?:{_CHROME_WORDS}))$",
+    re.I
+)
+_CHARSET = re.compile(r"charset=[\"']?([\w.:-]+)", re.I)
+
+
+class HtmlExtractor:
+    """Fetches pages with a byte cap and extracts their main text"""
+    
+    def __init__(self, session: Optional[requests.Session] = None):
+        self._session = session
+        self.content_types = {
+            value.strip().lower() for value in settings.WEB_FETCH_CONTENT_TYPES.split(",") if value.strip()
+        }
+    
+    @property
+    def session(self) -> requests.Session:
+        # Looked up per call so a forked worker gets its own pool
+        return self._session or get_http_session("web")
+    
+    def fetch_text(self, url: str) -> Optional[str]:
+        """Main text of a page, or None if it could not be fetched or is not text"""
+        fetched = self.fetch(url)
+        if fetched is None:
+            return None
+        body, content_type, encoding = fetched
+        if content_type == "text/plain":
+            return self._normalize(body.decode(encoding or "utf-8", errors="replace"))
+        return self.extract(body, encoding)
+    
+    def fetch(self, url: str) -> Optional[Tuple[bytes, str, Optional[str]]]:
+        """(body up to WEB_FETCH_MAX_BYTES, media type, header charset) or None"""
+        max_bytes = settings.WEB_FETCH_MAX_BYTES
+        with self.session.get(
+            url,
+            headers={'User-Agent': USER_AGENT},
+            timeout=settings.WEB_FETCH_TIMEOUT,
+            stream=True
+        ) as response:
+            response.raise_for_status()
+            
+            header = response.headers.get('Content-Type', '')
+            content_type = header.split(";")[0].strip().lower() or "text/html"
+            if content_type not in self.content_types:
+                metrics.increment("web.fetch.rejected_type")
+                logger.info(f"Skipping {url}: content type {content_type}")
+                return None
+            
+            chunks, size = [], 0
+            for chunk in response.iter_content(chunk_size=65536):
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= max_bytes:
+                    metrics.increment("web.fetch.truncated")
+                    break
+            body = b"".join(chunks)[:max_bytes]
+        
+        metrics.increment("web.fetch.bytes", len(body))
+        charset = _CHARSET.search(header)
+        return body, content_type, charset.group(1) if charset else None
+    
+    def extract(self, body: bytes, encoding: Optional[str] = None) -> str:
+        """Main text of an HTML document, one block per line"""
+        if not body.strip():
+            return ""
+        if not LXML_AVAILABLE:
+            return self._extract_soup(body, encoding)
+        
+        try:
+            parser = lxml_html.HTMLParser(encoding=encoding, remove_comments=True, remove_pis=True)
+            root = lxml_html.document_fromstring(body, parser=parser)
+        except (etree.ParserError, ValueError, LookupError):
+            # Unknown charset or nothing parseable: let lxml guess
+            try:
+                root = lxml_html.document_fromstring(body)
+            except (etree.ParserError, ValueError):
+                return ""
+        
+        for element in list(root.iter(*_DROP_TAGS)):
+            self._drop(element)
+        # Chrome markers are a hint: an element holding most of the page's text stays
+        page_length = len(root.text_content())
+        for element in list(root.iter(etree.Element)):
+            if (
+                element.tag not in _CONTAINER_TAGS
+                and element.getroottree().getroot() is root
+                and self._is_chrome(element)
+                and len(element.text_content()) < page_length / 2
+            ):
+                self._drop(element)
+        for element in list(root.iter(*_LINK_LIST_TAGS)):
+            if element.getroottree().getroot() is root and self._is_link_list(element):
+                self._drop(element)
+        
+        for element in root.iter(*_BLOCK_TAGS):
+            element.tail = "\n" + (element.tail or "")
+        return self._normalize(root.text_content())
+    
+    @staticmethod
+    def _drop(element):
+        """Remove an element and its content, keeping the text that follows it"""
+        if element.getparent() is not None:
+            element.drop_tree()
+    
+    @staticmethod
+    def _is_chrome(element) -> bool:
+        if element.get("hidden") is not None or element.get("aria-hidden") == "true":
+            return True
+        if element.get("role") in ("navigation", "banner", "contentinfo", "complementary"):
+            return True
+        tokens = f"{element.get('class') or ''} {element.get('id') or ''}".split()
+        return any(_CHROME_TOKEN.match(token) for token in tokens)
+    
+    @staticmethod
+    def _is_link_list(element) -> bool:
+        """Mostly anchor text (menus, tag clouds, link farms)"""
+        text_length = len(" ".join(element.text_content().split()))
+        if text_length == 0:
+            return False
+        link_length = sum(len(" ".join(link.text_content().split())) for link in element.iter("a"))
+        return link_length / text_length > settings.WEB_EXTRACT_MAX_LINK_DENSITY
+    
+    @staticmethod
+    def _normalize(text: str) -> str:
+        lines = (" ".join(line.split()) for line in text.splitlines())
+        return "\n".join(line for line in lines if line)
+    
+    def _extract_soup(self, body: bytes, encoding: Optional[str]) -> str:
+        from bs4 import BeautifulSoup
+        
+        soup = BeautifulSoup(body, 'html.parser', from_encoding=encoding)
+        for element in soup(list(_DROP_TAGS)):
+            element.decompose()
+        return self._normalize(soup.get_text("\n"))
+
+
+_extractor: Optional[HtmlExtractor] = None
+
+
+def get_html_extractor() -> HtmlExtractor:
+    """Return the process-wide HTML extractor"""
+    global _extractor
+    
+    if _extractor is None:
+        _extractor = HtmlExtractor()
+    return _extractor
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Process-wide keep-alive HTTP connection pools.
+
+Callers share one requests.Session (search APIs, page fetching) or
+httpx.Client (the LLM SDKs) per name instead of opening a new TCP + TLS
+connection per call. Pools are created on first use and dropped in forked
+children (Celery prefork workers), so a child never shares a socket or a
+pool lock with its parent; the child builds its own on first use.
+"""
+import os
+import threading
+from typing import Dict
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from app.core.config import settings
+
+_sessions: Dict[str, requests.Session] = {}
+_httpx_clients: Dict[str, httpx.Client] = {}
+_lock = threading.Lock()
+
+
+def get_http_session(name: str = "default") -> requests.Session:
+    """Shared requests.Session for name, pooling HTTP_POOL_MAXSIZE connections per host"""
+    with _lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=settings.HTTP_POOL_CONNECTIONS,
+                pool_maxsize=settings.HTTP_POOL_MAXSIZE
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[name] = session
+        return session
+
+
+def get_httpx_client(name: str) -> httpx.Client:
+    """Shared httpx.Client for name (one per SDK), with AI_HTTP_MAX_CONNECTIONS connections"""
+    with _lock:
+        client = _httpx_clients.get(name)
+        if client is None:
+            client = httpx.Client(
+                timeout=settings.AI_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.AI_HTTP_MAX_CONNECTIONS,
+                    keepalive_expiry=settings.HTTP_KEEPALIVE_SECONDS
+                )
+            )
+            _httpx_clients[name] = client
+        return client
+
+
+def _reset_after_fork():
+    # The parent's connections and lock state are not ours; forget them without closing
+    global _lock
+
+    _sessions.clear()
+    _httpx_clients.clear()
+    _lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
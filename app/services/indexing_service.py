@@ -0,0 +1,81 @@
+from typing import Dict, List, Optional, Tuple
+import logging
+from app.models.document import Document
+from app.services.text_processor import TextProcessor
+from app.services.embedding_service import EmbeddingService
+from app.services.analysis_store import get_analysis_store
+from app.database.vector_db import shard_for, vector_db
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def document_metadata(document: Document) -> Dict:
+    """Metadata stored with every vector of a document"""
+    return {
+        'document_id': document.id,
+        'user_id': document.user_id,
+        'institution_id': document.institution_id,
+        'term': (document.doc_metadata or {}).get('term'),
+        'filename': document.original_filename,
+        'word_count': document.word_count
+    }
+
+
+def build_records(
+    document_id: int,
+    metadata: Dict,
+    chunks: List[str],
+    embeddings: List[List[float]]
+) -> Tuple[List[str], List[str], List[List[float]], List[Dict]]:
+    """Turn a document's chunks into vector-index rows (one per chunk)"""
+    ids, texts, vectors, metadatas = [], [], [], []
+    for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+        ids.append(f"{document_id}:{idx}")
+        texts.append(chunk)
+        vectors.append(embedding)
+        metadatas.append({**metadata, 'chunk_index': idx})
+    return ids, texts, vectors, metadatas
+
+
+class IndexingService:
+    """Chunk, embed and store documents in the vector index"""
+    
+    def __init__(self):
+        self.text_processor = TextProcessor()
+        self.embedding_service = EmbeddingService()
+    
+    def chunk_document(self, content: str) -> List[str]:
+        """Chunk document text the same way the detector does"""
+        clean_text = self.text_processor.clean_text(content or "")
+        return self.text_processor.chunk_text(clean_text, settings.CHUNK_SIZE, settings.OVERLAP)
+    
+    def index_document(self, document: Document) -> Optional[int]:
+        """Replace a document's vectors; returns the number stored, or None on failure"""
+        chunks = self.chunk_document(document.content)
+        if not chunks:
+            return 0
+        
+        embeddings = self.embedding_service.generate_embeddings(chunks)
+        if embeddings is None:
+            logger.warning(f"Embeddings unavailable, document {document.id} not indexed")
+            return None
+        
+        metadata = document_metadata(document)
+        ids, texts, vectors, metadatas = build_records(document.id, metadata, chunks, embeddings)
+        vector_db.delete_document_vectors(document.id, shards=[shard_for(metadata)])
+        vector_db.add_documents(ids, texts, vectors, metadatas)
+        self.analyze_document(document, embeddings)
+        return len(ids)
+    
+    def analyze_document(self, document: Document, embeddings: Optional[List[List[float]]] = None) -> bool:
+        """Write the document's analysis sidecar so checks don't re-derive it"""
+        store = get_analysis_store()
+        if store is None:
+            return False
+        try:
+            store.save(document.id, store.build(document, embeddings=embeddings))
+            return True
+        except Exception as e:
+            logger.warning(f"Could not write analysis sidecar for document {document.id}: {e}")
+            return False
\ No newline at end of file
@@ -0,0 +1,222 @@
+"""
+Counters and latency summaries.
+
+Every process records into its own registry. Checks run in Celery workers and
+the API serves /metrics, so each process also pushes what it recorded since
+its last push to Redis every METRICS_PUBLISH_SECONDS (from a daemon thread,
+never on the recording path). Counters are summed with HINCRBYFLOAT; samples
+go to a capped list per name. shared_snapshot() reads that aggregate of all
+processes.
+"""
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+import numpy as np
+from app.core.config import settings
+
+# Latency samples kept per timer for percentiles
+_WINDOW = 2048
+
+COUNTERS_KEY = "metrics:counters"
+# Per summary name: "<name>:count" and "<name>:sum" of every sample ever pushed
+TOTALS_KEY = "metrics:totals"
+SAMPLES_KEY_PREFIX = "metrics:samples:"
+
+
+def _summaries(samples: Dict[str, List[float]], totals: Dict[str, list]) -> Dict:
+    summaries = {}
+    for name, values in samples.items():
+        count, total = totals[name]
+        if not values or not count:
+            continue
+        p50, p95, p99 = np.percentile(values, [50, 95, 99])
+        summaries[name] = {
+            'count': count,
+            'avg': round(total / count, 3),
+            'p50': round(float(p50), 3),
+            'p95': round(float(p95), 3),
+            'p99': round(float(p99), 3),
+            'max': round(max(values), 3)
+        }
+    return summaries
+
+
+class Metrics:
+    """In-process counters and latency summaries, also pushed to Redis for every process's view"""
+    
+    def __init__(self, window: int = _WINDOW):
+        self.window = window
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._samples: Dict[str, Deque[float]] = {}
+        self._totals: Dict[str, list] = {}
+        self._lock = threading.Lock()
+        
+        # Recorded since the last push to Redis
+        self._pending_counters: Dict[str, float] = defaultdict(float)
+        self._pending_samples: Dict[str, List[float]] = defaultdict(list)
+        self._pending_totals: Dict[str, list] = defaultdict(lambda: [0, 0.0])
+        self._publisher_pid: Optional[int] = None
+        self._publishing = False
+    
+    def increment(self, name: str, value: float = 1):
+        with self._lock:
+            self._counters[name] += value
+            self._pending_counters[name] += value
+        self._ensure_publisher()
+    
+    def observe(self, name: str, value: float):
+        """Record one sample (e.g. a latency in milliseconds)"""
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.window)
+                self._totals[name] = [0, 0.0]
+            self._samples[name].append(value)
+            self._totals[name][0] += 1
+            self._totals[name][1] += value
+            self._pending_samples[name].append(value)
+            self._pending_totals[name][0] += 1
+            self._pending_totals[name][1] += value
+        self._ensure_publisher()
+    
+    @contextmanager
+    def timer(self, name: str):
+        """Observe the wall time of a block in milliseconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000)
+    
+    def percentile(self, name: str, q: float) -> float:
+        with self._lock:
+            samples = list(self._samples.get(name, ()))
+        return float(np.percentile(samples, q)) if samples else 0.0
+    
+    def snapshot(self) -> Dict:
+        """This process's counters and summaries"""
+        with self._lock:
+            counters = dict(self._counters)
+            samples = {name: list(values) for name, values in self._samples.items()}
+            totals = {name: list(values) for name, values in self._totals.items()}
+        return {'counters': counters, 'summaries': _summaries(samples, totals)}
+    
+    def _ensure_publisher(self):
+        # One publisher thread per process (a forked child starts its own)
+        if self._publisher_pid == os.getpid() or settings.METRICS_PUBLISH_SECONDS <= 0:
+            return
+        with self._lock:
+            if self._publisher_pid == os.getpid():
+                return
+            self._publisher_pid = os.getpid()
+        threading.Thread(target=self._publish_loop, name="metrics-publisher", daemon=True).start()
+    
+    def _publish_loop(self):
+        while True:
+            time.sleep(settings.METRICS_PUBLISH_SECONDS)
+            self.publish()
+    
+    def publish(self):
+        """Push everything recorded since the last push to Redis (kept for later if Redis is down)"""
+        from app.services.cache_service import cache_service
+        
+        with self._lock:
+            if self._publishing or (not self._pending_counters and not self._pending_samples):
+                return
+            self._publishing = True
+            counters, self._pending_counters = self._pending_counters, defaultdict(float)
+            samples, self._pending_samples = self._pending_samples, defaultdict(list)
+            totals, self._pending_totals = self._pending_totals, defaultdict(lambda: [0, 0.0])
+        try:
+            client = cache_service.redis_client
+            if client is None:
+                self._requeue(counters, samples, totals)
+                return
+            try:
+                pipeline = client.pipeline(transaction=False)
+                for name, value in counters.items():
+                    pipeline.hincrbyfloat(COUNTERS_KEY, name, value)
+                for name, values in samples.items():
+                    key = SAMPLES_KEY_PREFIX + name
+                    pipeline.rpush(key, *values)
+                    pipeline.ltrim(key, -self.window, -1)
+                for name, (count, total) in totals.items():
+                    pipeline.hincrby(TOTALS_KEY, f"{name}:count", count)
+                    pipeline.hincrbyfloat(TOTALS_KEY, f"{name}:sum", total)
+                pipeline.execute()
+            except Exception as e:
+                # Part of the pipeline may have been applied: drop rather than count twice
+                cache_service.mark_redis_failed("metrics", e)
+        finally:
+            self._publishing = False
+    
+    def _requeue(self, counters: Dict[str, float], samples: Dict[str, List[float]], totals: Dict[str, list]):
+        with self._lock:
+            for name, value in counters.items():
+                self._pending_counters[name] += value
+            for name, values in samples.items():
+                pending = self._pending_samples[name]
+                pending[:0] = values
+                # Only the latest window of samples matters for percentiles
+                del pending[:-self.window]
+            for name, (count, total) in totals.items():
+                self._pending_totals[name][0] += count
+                self._pending_totals[name][1] += total
+    
+    def shared_snapshot(self) -> Optional[Dict]:
+        """Counters and summaries of every process, as pushed to Redis (None if Redis is unreachable)"""
+        from app.services.cache_service import cache_service
+        
+        self.publish()
+        client = cache_service.redis_client
+        if client is None:
+            return None
+        try:
+            counters = {
+                name.decode(): float(value)
+                for name, value in client.hgetall(COUNTERS_KEY).items()
+            }
+            raw_totals = {name.decode(): float(value) for name, value in client.hgetall(TOTALS_KEY).items()}
+            names = sorted(name[:-len(":count")] for name in raw_totals if name.endswith(":count"))
+            pipeline = client.pipeline(transaction=False)
+            for name in names:
+                pipeline.lrange(SAMPLES_KEY_PREFIX + name, 0, -1)
+            samples = {
+                name: [float(value) for value in values]
+                for name, values in zip(names, pipeline.execute())
+            }
+        except Exception as e:
+            cache_service.mark_redis_failed("metrics", e)
+            return None
+        
+        totals = {
+            name: [int(raw_totals[f"{name}:count"]), raw_totals.get(f"{name}:sum", 0.0)]
+            for name in names
+        }
+        return {'counters': counters, 'summaries': _summaries(samples, totals)}
+    
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._samples.clear()
+            self._totals.clear()
+            self._pending_counters.clear()
+            self._pending_samples.clear()
+            self._pending_totals.clear()
+    
+    def _reset_after_fork(self):
+        # The parent publishes what it recorded; the child starts with nothing pending
+        self._lock = threading.Lock()
+        self._pending_counters = defaultdict(float)
+        self._pending_samples = defaultdict(list)
+        self._pending_totals = defaultdict(lambda: [0, 0.0])
+        self._publishing = False
+
+
+# Global instance
+metrics = Metrics()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=metrics._reset_after_fork)
\ No newline at end of file
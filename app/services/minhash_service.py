@@ -0,0 +1,233 @@
+import logging
+import threading
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set
+import numpy as np
+from app.core.config import settings
+from app.services.tokenized_document import TextLike, TokenizedDocument
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def shingle_hashes(text: TextLike, size: Optional[int] = None) -> np.ndarray:
+    """32-bit hashes of the lower-cased word k-shingles of text"""
+    size = size or settings.MINHASH_SHINGLE_SIZE
+    if isinstance(text, TokenizedDocument):
+        words = [word.lower() for word in text.words()]
+    else:
+        words = text.lower().split()
+    if len(words) < size:
+        return np.array([zlib.crc32(" ".join(words).encode())], dtype=np.uint64) if words else np.zeros(0, dtype=np.uint64)
+    return np.fromiter(
+        (zlib.crc32(" ".join(words[i:i + size]).encode()) for i in range(len(words) - size + 1)),
+        dtype=np.uint64,
+        count=len(words) - size + 1
+    )
+
+
+class MinHasher:
+    """MinHash signatures using universal hashing (a*x + b) mod p"""
+    
+    def __init__(self, num_perm: Optional[int] = None, seed: int = 1):
+        self.num_perm = num_perm or settings.MINHASH_NUM_PERM
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, int(_MERSENNE_PRIME), size=self.num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, int(_MERSENNE_PRIME), size=self.num_perm, dtype=np.uint64)
+    
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        """Signature (num_perm uint32 minima) of a set of shingle hashes"""
+        signature = np.full(self.num_perm, _MAX_HASH, dtype=np.uint64)
+        # Bound the (num_perm x shingles) temporary for long texts
+        for start in range(0, len(hashes), 4096):
+            block = hashes[start:start + 4096]
+            permuted = np.bitwise_and((np.outer(self._a, block) + self._b[:, None]) % _MERSENNE_PRIME, _MAX_HASH)
+            signature = np.minimum(signature, permuted.min(axis=1))
+        return signature.astype(np.uint32)
+    
+    def chunk_signatures(self, chunks: List[str]) -> np.ndarray:
+        """One signature per chunk, as a (chunks x num_perm) uint32 matrix"""
+        if not chunks:
+            return np.zeros((0, self.num_perm), dtype=np.uint32)
+        return np.vstack([self.signature(shingle_hashes(chunk)) for chunk in chunks])
+    
+    @staticmethod
+    def document_signature(chunk_signatures: np.ndarray) -> np.ndarray:
+        """A document's signature is the element-wise minimum over its chunks"""
+        return chunk_signatures.min(axis=0)
+    
+    @staticmethod
+    def estimate_jaccard(sig1: np.ndarray, sig2: np.ndarray) -> float:
+        return float(np.mean(sig1 == sig2))
+    
+    def to_bytes(self, signatures: np.ndarray) -> bytes:
+        return np.ascontiguousarray(signatures, dtype=np.uint32).tobytes()
+    
+    def from_bytes(self, data: Optional[bytes]) -> np.ndarray:
+        if not data:
+            return np.zeros((0, self.num_perm), dtype=np.uint32)
+        return np.frombuffer(data, dtype=np.uint32).reshape(-1, self.num_perm)
+
+
+class LSHIndex:
+    """
+    Banded LSH over chunk signatures.
+    Two chunks collide in some band with probability 1 - (1 - J^rows)^bands,
+    so the similarity threshold is roughly (1 / bands) ** (1 / rows).
+    """
+    
+    def __init__(self, bands: Optional[int] = None, rows: Optional[int] = None):
+        self.bands = bands or settings.LSH_BANDS
+        self.rows = rows or settings.LSH_ROWS
+        self._buckets: List[Dict[bytes, Set[int]]] = [defaultdict(set) for _ in range(self.bands)]
+        self._keys: Dict[int, List[bytes]] = {}
+        self._lock = threading.RLock()
+    
+    def __len__(self) -> int:
+        return len(self._keys)
+    
+    def __contains__(self, doc_id: int) -> bool:
+        return doc_id in self._keys
+    
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [
+            signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            for band in range(self.bands)
+        ]
+    
+    def add(self, doc_id: int, chunk_signatures: np.ndarray):
+        """Index every chunk signature of a document"""
+        with self._lock:
+            self.remove(doc_id)
+            entries = []
+            for signature in chunk_signatures:
+                for band, key in enumerate(self._band_keys(signature)):
+                    self._buckets[band][key].add(doc_id)
+                    entries.append(key)
+            self._keys[doc_id] = entries
+    
+    def remove(self, doc_id: int):
+        with self._lock:
+            entries = self._keys.pop(doc_id, None)
+            if not entries:
+                return
+            for i, key in enumerate(entries):
+                bucket = self._buckets[i % self.bands].get(key)
+                if bucket is not None:
+                    bucket.discard(doc_id)
+                    if not bucket:
+                        del self._buckets[i % self.bands][key]
+    
+    def query(self, signature: np.ndarray, min_band_hits: int = 1) -> Dict[int, int]:
+        """Candidate document ids for one chunk signature, with their band-hit counts"""
+        hits: Dict[int, int] = defaultdict(int)
+        with self._lock:
+            for band, key in enumerate(self._band_keys(signature)):
+                for doc_id in self._buckets[band].get(key, ()):
+                    hits[doc_id] += 1
+        return {doc_id: count for doc_id, count in hits.items() if count >= min_band_hits}
+    
+    def query_many(self, signatures: Iterable[np.ndarray], min_band_hits: int = 1) -> List[Dict[int, int]]:
+        return [self.query(signature, min_band_hits) for signature in signatures]
+
+
+class MinHashService:
+    """Computes document signatures and keeps the process-wide LSH index in sync with the database"""
+    
+    def __init__(self):
+        self.hasher = MinHasher()
+        self.index = LSHIndex()
+        self._loaded_max_id = 0
+        self._lock = threading.Lock()
+    
+    def signatures_for_chunks(self, chunks: List[str]) -> np.ndarray:
+        return self.hasher.chunk_signatures(chunks)
+    
+    def encode(self, chunks: List[str]) -> bytes:
+        """Serialized chunk signatures for Document.minhash_signatures"""
+        return self.hasher.to_bytes(self.signatures_for_chunks(chunks))
+    
+    def refresh(self):
+        """
+        Load signatures of documents ingested since the last refresh.
+        Runs on its own session, so backfilling never commits the caller's.
+        """
+        from app.database.session import SessionLocal
+        from app.models.document import Document
+        from app.services.indexing_service import IndexingService
+        
+        with self._lock:
+            db = SessionLocal()
+            try:
+                chunker = None
+                rows = db.query(Document.id, Document.minhash_signatures).filter(
+                    Document.id > self._loaded_max_id
+                ).order_by(Document.id).yield_per(500)
+                
+                missing = []
+                for doc_id, data in rows:
+                    if data:
+                        self.index.add(doc_id, self.hasher.from_bytes(data))
+                    else:
+                        missing.append(doc_id)
+                    self._loaded_max_id = max(self._loaded_max_id, doc_id)
+                
+                # Backfill documents ingested before signatures existed
+                for doc_id in missing:
+                    document = db.query(Document).filter(Document.id == doc_id).first()
+                    if document is None:
+                        continue
+                    chunker = chunker or IndexingService()
+                    signatures = self.signatures_for_chunks(chunker.chunk_document(document.content))
+                    document.minhash_signatures = self.hasher.to_bytes(signatures)
+                    self.index.add(doc_id, signatures)
+                if missing:
+                    db.commit()
+                    logger.info(f"Computed MinHash signatures for {len(missing)} documents")
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+    
+    def candidates(self, db, chunks: List[str], exclude_id: Optional[int] = None) -> List[Set[int]]:
+        """Per-chunk candidate source document ids"""
+        from app.models.document import Document
+        
+        self.refresh()
+        signatures = self.signatures_for_chunks(chunks)
+        results = []
+        for chunk, hits in zip(chunks, self.index.query_many(signatures, settings.LSH_MIN_BAND_HITS)):
+            # Blank chunks (e.g. skipped as unchanged) have no shingles to match on
+            if not chunk.strip():
+                results.append(set())
+                continue
+            hits.pop(exclude_id, None)
+            results.append(set(hits))
+        
+        # Other processes may have deleted documents this index still holds
+        found = set().union(*results) if results else set()
+        if found:
+            existing = {row.id for row in db.query(Document.id).filter(Document.id.in_(found)).all()}
+            for doc_id in found - existing:
+                self.index.remove(doc_id)
+            results = [hits & existing for hits in results]
+        return results
+    
+    def remove(self, doc_id: int):
+        self.index.remove(doc_id)
+
+
+_service: Optional[MinHashService] = None
+
+
+def get_minhash_service() -> MinHashService:
+    """Return the process-wide MinHash/LSH service"""
+    global _service
+    
+    if _service is None:
+        _service = MinHashService()
+    return _service
\ No newline at end of file
@@ -0,0 +1,106 @@
+"""
+Local paraphrase scoring in front of the LLM check.
+
+Each (chunk, source window) pair is scored on the CPU from the embedding
+cosine of the two texts and three lexical signals from SimilarityService:
+word Jaccard, LCS ratio and word-trigram overlap. Pairs scoring at least
+PARAPHRASE_LOCAL_ACCEPT are paraphrases and pairs below
+PARAPHRASE_LOCAL_REJECT are not; only the band in between goes to
+AIService.detect_paraphrase_many. Without an embedding model every pair is
+escalated, since lexical signals alone cannot tell reworded text apart.
+
+A PARAPHRASE_AUDIT_RATE share of locally settled pairs is also sent to the
+LLM (the local verdict stands) so paraphrase.audit.agree / .disagree show
+whether the thresholds still hold.
+"""
+import logging
+import random
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.ai_service import AIService
+from app.services.embedding_service import EmbeddingService
+from app.services.metrics import metrics
+from app.services.similarity_service import SimilarityService
+
+logger = logging.getLogger(__name__)
+
+# Weights of the local score (embedding cosine carries the meaning, the lexical
+# signals separate close rewording from loosely related text)
+_EMBEDDING_WEIGHT = 0.7
+_JACCARD_WEIGHT = 0.1
+_LCS_WEIGHT = 0.1
+_NGRAM_WEIGHT = 0.1
+
+
+class ParaphraseClassifier:
+    """Settles clear paraphrase verdicts locally and escalates the rest to the AI service"""
+    
+    def __init__(
+        self,
+        ai_service: Optional[AIService] = None,
+        embedding_service: Optional[EmbeddingService] = None,
+        similarity_service: Optional[SimilarityService] = None
+    ):
+        self.ai_service = ai_service or AIService()
+        self.embedding_service = embedding_service or EmbeddingService()
+        self.similarity_service = similarity_service or SimilarityService()
+    
+    def score_many(self, pairs: List[Tuple[str, str]]) -> List[Optional[float]]:
+        """Local paraphrase score (0-100) per pair, or None if there are no embeddings"""
+        texts = list(dict.fromkeys(str(text) for pair in pairs for text in pair))
+        embeddings = self.embedding_service.generate_embeddings(texts) if texts else None
+        if not embeddings:
+            return [None] * len(pairs)
+        
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1)
+        vectors = vectors / np.where(norms > 0, norms, 1)[:, None]
+        index = {text: i for i, text in enumerate(texts)}
+        
+        scores = []
+        for text1, text2 in pairs:
+            cosine = max(float(np.dot(vectors[index[str(text1)]], vectors[index[str(text2)]])), 0.0) * 100
+            lcs, _ = self.similarity_service.longest_common_subsequence(text1, text2)
+            scores.append(
+                _EMBEDDING_WEIGHT * cosine
+                + _JACCARD_WEIGHT * self.similarity_service.jaccard_similarity(text1, text2)
+                + _LCS_WEIGHT * lcs
+                + _NGRAM_WEIGHT * self.similarity_service.ngram_overlap(text1, text2)
+            )
+        return scores
+    
+    def classify_many(self, pairs: List[Tuple[str, str]]) -> List[Dict]:
+        """Verdicts shaped like AIService.detect_paraphrase (plus 'source': local or ai)"""
+        if not pairs:
+            return []
+        scores = self.score_many(pairs)
+        
+        verdicts: List[Optional[Dict]] = [None] * len(pairs)
+        escalate, audit = [], []
+        for i, score in enumerate(scores):
+            if score is None or settings.PARAPHRASE_LOCAL_REJECT <= score < settings.PARAPHRASE_LOCAL_ACCEPT:
+                escalate.append(i)
+                continue
+            verdicts[i] = {
+                "is_paraphrase": score >= settings.PARAPHRASE_LOCAL_ACCEPT,
+                "confidence": round(score if score >= settings.PARAPHRASE_LOCAL_ACCEPT else 100 - score),
+                "explanation": f"Local score {score:.0f}",
+                "source": "local"
+            }
+            if random.random() < settings.PARAPHRASE_AUDIT_RATE:
+                audit.append(i)
+        
+        metrics.increment("paraphrase.local.decided", len(pairs) - len(escalate))
+        metrics.increment("paraphrase.llm_calls_avoided", len(pairs) - len(escalate) - len(audit))
+        metrics.increment("paraphrase.escalated", len(escalate))
+        
+        asked = escalate + audit
+        ai_verdicts = self.ai_service.detect_paraphrase_many([pairs[i] for i in asked])
+        for i, ai_verdict in zip(asked, ai_verdicts):
+            if verdicts[i] is None:
+                verdicts[i] = {**ai_verdict, "source": "ai"}
+            elif ai_verdict.get("explanation") != "AI detection failed":
+                agreed = bool(ai_verdict.get("is_paraphrase")) == verdicts[i]["is_paraphrase"]
+                metrics.increment("paraphrase.audit.agree" if agreed else "paraphrase.audit.disagree")
+        return verdicts
\ No newline at end of file
@@ -1,16 +1,57 @@
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from app.models.document import Document
 from app.models.match import Match, MatchType, SourceType
+from app.models.submission import Submission, SubmissionStatus
 from app.services.text_processor import TextProcessor
 from app.services.search_service import SearchService
 from app.services.similarity_service import SimilarityService
 from app.services.ai_service import AIService
 from app.services.embedding_service import EmbeddingService
+from app.services.paraphrase_classifier import ParaphraseClassifier
+from app.services.minhash_service import get_minhash_service
+from app.services.document_scope import allows_cross_institution, visible_to
+from app.services.metrics import metrics
+from app.services.analysis_store import get_analysis_store, term_counts, token_hashes
+from app.services.chunker import merge_spans
+from app.services.query_planner import get_query_planner
+from app.services.web_source_matcher import WebSourceMatcher
+from app.services.web_corpus import get_web_corpus_service
+from app.services.reference_corpus import get_reference_corpus_service
 from app.database.vector_db import vector_db
 from app.core.config import settings
 
 
+def corpus_high_water_mark(db: Session) -> int:
+    """Highest document id in the corpus right now"""
+    return db.query(func.max(Document.id)).scalar() or 0
+
+
+def find_exact_duplicate(db: Session, document: Document) -> Optional[Document]:
+    """Earliest other document with byte-identical cleaned text that the document's institution may see"""
+    return visible_to(db.query(Document), document).filter(
+        Document.content_hash == document.content_hash,
+        Document.id != document.id
+    ).order_by(Document.id).first()
+
+
+def exact_duplicate_result(document: Document, original: Document) -> Tuple[float, List[Dict]]:
+    """0% originality with the whole text attributed to the original document"""
+    match = {
+        'match_type': MatchType.EXACT,
+        'source_type': SourceType.DATABASE,
+        'matched_text': document.content[:500],
+        'source_text': original.content[:500],
+        'similarity_score': 100.0,
+        'source_title': original.original_filename,
+        'source_document_id': original.id,
+        'start_position': 0,
+        'end_position': len(document.content.split())
+    }
+    return 0.0, [match]
+
+
 class PlagiarismDetector:
     """Main plagiarism detection engine"""
     
@@ -21,36 +62,67 @@ class PlagiarismDetector:
         self.similarity_service = SimilarityService()
         self.ai_service = AIService()
         self.embedding_service = EmbeddingService()
+        self.paraphrase_classifier = ParaphraseClassifier(
+            self.ai_service, self.embedding_service, self.similarity_service
+        )
+        self.web_corpus = get_web_corpus_service()
+        self.reference_corpus = get_reference_corpus_service()
+        # Max document id the last result covers (set by check_plagiarism / reuse_near_duplicate)
+        self.high_water_mark: Optional[int] = None
+    
+    def current_high_water_mark(self) -> int:
+        """Highest document id in the corpus right now"""
+        return corpus_high_water_mark(self.db)
     
     def check_plagiarism(
         self,
         document: Document,
         check_web: bool = True,
         check_database: bool = True,
-        check_institution: bool = True
+        check_institution: bool = True,
+        check_reference: bool = True
     ) -> Tuple[float, List[Dict]]:
         """
         Main plagiarism checking function
         Returns: (originality_score, matches_list)
         """
         all_matches = []
+        self.high_water_mark = self.current_high_water_mark()
         
-        # Clean and process text
+        # Clean and process text (chunks, keywords and embeddings come from the ingest sidecar)
         clean_text = self.text_processor.clean_text(document.content)
-        chunks = self.text_processor.chunk_text(
-            clean_text,
-            settings.CHUNK_SIZE,
-            settings.OVERLAP
+        analysis = self._load_analysis(document, embed=check_database)
+        chunks, keywords, embeddings = self._chunk_features(clean_text, analysis)
+        
+        # A revision of an earlier draft only needs its new or edited chunks checked
+        revision = self.find_prior_revision(
+            document, check_web, check_database, check_institution, check_reference
         )
+        if revision:
+            draft, prior = revision
+            stages = {
+                SourceType.WEB: check_web,
+                SourceType.DATABASE: check_database,
+                SourceType.INSTITUTION: check_institution,
+                SourceType.REFERENCE: check_reference
+            }
+            chunks, reused = self._reuse_revision_matches(chunks, draft, prior)
+            reused = [m for m in reused if stages.get(m['source_type'], True)]
+            all_matches.extend(reused)
+            # Unchanged chunks were only compared with the corpus the draft saw
+            self.high_water_mark = min(self.high_water_mark, prior.corpus_high_water_mark or 0)
+            revision_of = draft.id
+        else:
+            revision_of = None
         
         # 1. Check against database
         if check_database:
-            db_matches = self._check_database(document, chunks)
+            db_matches = self._check_database(document, chunks, embeddings=embeddings)
             all_matches.extend(db_matches)
         
         # 2. Check against web
         if check_web:
-            web_matches = self._check_web(chunks)
+            web_matches = self._check_web(chunks, keywords=keywords)
             all_matches.extend(web_matches)
         
         # 3. Check institution database (if applicable)
@@ -58,6 +130,13 @@ class PlagiarismDetector:
             inst_matches = self._check_institution(document, chunks)
             all_matches.extend(inst_matches)
         
+        # 4. Check imported reference corpora
+        if check_reference and settings.ENABLE_REFERENCE_CORPUS:
+            all_matches.extend(self._check_reference(chunks, embeddings=embeddings))
+        
+        if revision_of is not None:
+            all_matches = [m for m in all_matches if m.get('source_document_id') != revision_of]
+        
         # Calculate originality score
         originality_score = self._calculate_originality_score(
             document.content,
@@ -66,133 +145,526 @@ class PlagiarismDetector:
         
         return originality_score, all_matches
     
-    def _check_database(self, document: Document, chunks: List[str]) -> List[Dict]:
-        """Check against stored documents"""
-        matches = []
+    def check_delta(
+        self,
+        document: Document,
+        after_document_id: int,
+        check_database: bool = True,
+        check_institution: bool = True
+    ) -> List[Dict]:
+        """
+        Matches against documents ingested after after_document_id only
+        (web and reference sources are not part of the corpus and are not re-checked)
+        """
+        self.high_water_mark = self.current_high_water_mark()
+        if self.high_water_mark <= after_document_id:
+            return []
+        
+        clean_text = self.text_processor.clean_text(document.content)
+        analysis = self._load_analysis(document, embed=check_database)
+        chunks, _, embeddings = self._chunk_features(clean_text, analysis)
         
+        matches = []
+        if check_database:
+            matches.extend(self._check_database(
+                document, chunks, after_document_id=after_document_id, embeddings=embeddings
+            ))
+        if check_institution and document.institution_id:
+            matches.extend(self._check_institution(document, chunks, after_document_id=after_document_id))
+        return matches
+    
+    def _load_analysis(self, document: Document, embed: bool = False):
+        """The document's ingest-time analysis sidecar (built on demand), or None"""
+        store = get_analysis_store()
+        if store is None:
+            return None
         try:
-            # Generate embedding for each chunk
-            for idx, chunk in enumerate(chunks):
-                if len(chunk.split()) < settings.MIN_MATCH_LENGTH:
+            return store.get_or_build(document, embed=embed and self.embedding_service.is_available())
+        except Exception as e:
+            print(f"Error loading analysis sidecar: {e}")
+            return None
+    
+    def _chunk_features(
+        self,
+        clean_text: str,
+        analysis
+    ) -> Tuple[List[str], Optional[List[List[str]]], Optional[List[List[float]]]]:
+        """Chunks plus per-chunk keywords and embeddings (None when not precomputed)"""
+        if analysis is None:
+            chunks = self.text_processor.chunk_text(
+                clean_text,
+                settings.CHUNK_SIZE,
+                settings.OVERLAP
+            )
+            return chunks, None, None
+        return analysis.chunks(clean_text), analysis.keywords, analysis.chunk_embeddings()
+    
+    def reuse_near_duplicate(
+        self,
+        document: Document,
+        check_web: bool = True,
+        check_database: bool = True,
+        check_institution: bool = True,
+        check_reference: bool = True
+    ) -> Optional[Tuple[float, List[Dict]]]:
+        """
+        Result for a document flagged as a near-duplicate at upload, built from the
+        original's latest completed check (which must cover every requested stage).
+        Returns None when there is nothing to reuse.
+        """
+        near_duplicate = (document.doc_metadata or {}).get('near_duplicate_of')
+        if not settings.ENABLE_NEAR_DUPLICATE_SHORTCUT or not near_duplicate:
+            return None
+        
+        # The original (and what its check found) must be visible to this document's institution
+        original = visible_to(self.db.query(Document), document).filter(
+            Document.id == near_duplicate['document_id']
+        ).first()
+        if original is None:
+            return None
+        
+        prior = self._latest_covering_submission(
+            original.id, check_web, check_database, check_institution, check_reference
+        )
+        if prior is None:
+            return None
+        self.high_water_mark = prior.corpus_high_water_mark
+        
+        source_ids = {match.source_document_id for match in prior.matches if match.source_document_id is not None}
+        visible_ids = {
+            row.id for row in
+            visible_to(self.db.query(Document.id), document).filter(Document.id.in_(source_ids)).all()
+        } if source_ids else set()
+        matches = [
+            self._match_to_dict(match)
+            for match in prior.matches
+            if match.source_document_id != document.id
+            and (match.source_document_id is None or match.source_document_id in visible_ids)
+        ]
+        originality_score = prior.originality_score
+        
+        # Someone else's document: the original itself is the source
+        if original.user_id != document.user_id and check_database:
+            similarity = 100.0 * (1 - near_duplicate.get('distance', 0) / 64)
+            matches.append({
+                'match_type': MatchType.EXACT if near_duplicate.get('distance', 0) == 0 else MatchType.PARAPHRASE,
+                'source_type': SourceType.DATABASE,
+                'matched_text': document.content[:500],
+                'source_text': original.content[:500],
+                'similarity_score': similarity,
+                'source_document_id': original.id,
+                'start_position': 0,
+                'end_position': len(document.content.split())
+            })
+            originality_score = min(originality_score, 100 - similarity)
+        
+        return originality_score, matches
+    
+    def _latest_covering_submission(
+        self,
+        document_id: int,
+        check_web: bool,
+        check_database: bool,
+        check_institution: bool,
+        check_reference: bool = True
+    ) -> Optional[Submission]:
+        """Latest completed submission of a document that ran every requested stage"""
+        requested = {
+            'check_web': check_web,
+            'check_database': check_database,
+            'check_institution': check_institution,
+            'check_reference': check_reference
+        }
+        for submission in self.db.query(Submission).filter(
+            Submission.document_id == document_id,
+            Submission.status == SubmissionStatus.COMPLETED
+        ).order_by(Submission.completed_at.desc()):
+            covered = submission.check_settings or {}
+            if all(covered.get(stage, True) for stage, wanted in requested.items() if wanted):
+                return submission
+        return None
+    
+    @staticmethod
+    def _match_to_dict(match: Match) -> Dict:
+        return {
+            'match_type': match.match_type,
+            'source_type': match.source_type,
+            'matched_text': match.matched_text,
+            'source_text': match.source_text,
+            'similarity_score': match.similarity_score,
+            'source_url': match.source_url,
+            'source_title': match.source_title,
+            'source_document_id': match.source_document_id,
+            'start_position': match.start_position,
+            'end_position': match.end_position
+        }
+    
+    def find_prior_revision(
+        self,
+        document: Document,
+        check_web: bool = True,
+        check_database: bool = True,
+        check_institution: bool = True,
+        check_reference: bool = True
+    ) -> Optional[Tuple[Document, Submission]]:
+        """
+        An earlier document by the same user that this one is a revision of (MinHash
+        Jaccard >= REVISION_MIN_SIMILARITY), with a completed check covering the
+        requested stages. The most similar qualifying draft wins.
+        """
+        if not settings.ENABLE_REVISION_REUSE or not document.minhash_signatures:
+            return None
+        
+        hasher = get_minhash_service().hasher
+        chunk_signatures = hasher.from_bytes(document.minhash_signatures)
+        if len(chunk_signatures) == 0:
+            return None
+        signature = hasher.document_signature(chunk_signatures)
+        
+        drafts = []
+        for draft_id, data in self.db.query(Document.id, Document.minhash_signatures).filter(
+            Document.user_id == document.user_id,
+            Document.id < document.id,
+            Document.minhash_signatures.isnot(None)
+        ):
+            draft_signatures = hasher.from_bytes(data)
+            if len(draft_signatures) == 0:
+                continue
+            similarity = hasher.estimate_jaccard(signature, hasher.document_signature(draft_signatures))
+            if similarity >= settings.REVISION_MIN_SIMILARITY:
+                drafts.append((similarity, draft_id))
+        
+        for _, draft_id in sorted(drafts, reverse=True):
+            prior = self._latest_covering_submission(
+                draft_id, check_web, check_database, check_institution, check_reference
+            )
+            if prior is not None:
+                return self.db.query(Document).filter(Document.id == draft_id).first(), prior
+        return None
+    
+    def _reuse_revision_matches(
+        self,
+        chunks: List[str],
+        draft: Document,
+        prior: Submission
+    ) -> Tuple[List[str], List[Dict]]:
+        """
+        Carry the prior draft's matches over for chunks that did not change.
+        Returns the chunk list with unchanged chunks blanked out (so every stage
+        skips them) and the reused matches, re-positioned to this document.
+        """
+        draft_chunks = set(self.text_processor.chunk_text(
+            self.text_processor.clean_text(draft.content),
+            settings.CHUNK_SIZE,
+            settings.OVERLAP
+        ))
+        prior_matches: Dict[str, List[Match]] = {}
+        for match in prior.matches:
+            prior_matches.setdefault(match.matched_text, []).append(match)
+        
+        remaining, reused = [], []
+        for chunk in chunks:
+            if chunk not in draft_chunks:
+                remaining.append(chunk)
+                continue
+            remaining.append("")
+            for match in prior_matches.get(chunk, ()):
+                # Matches against the earlier draft itself are not plagiarism
+                if match.source_document_id == draft.id:
                     continue
-                
-                embedding = self.embedding_service.generate_embedding(chunk)
-                
+                data = self._match_to_dict(match)
+                data['start_position'] = chunk.word_start
+                data['end_position'] = chunk.word_end
+                reused.append(data)
+        
+        unchanged = remaining.count("")
+        metrics.increment("check.revision.reused_chunks", unchanged)
+        metrics.increment("check.revision.processed_chunks", len(chunks) - unchanged)
+        return remaining, reused
+    
+    def _check_database(
+        self,
+        document: Document,
+        chunks: List[str],
+        after_document_id: Optional[int] = None,
+        embeddings: Optional[List[List[float]]] = None
+    ) -> List[Dict]:
+        """Check against stored documents (optionally only those newer than after_document_id)"""
+        matches = []
+        
+        try:
+            # Generate embeddings for all eligible chunks in one batch
+            eligible = [
+                (idx, chunk) for idx, chunk in enumerate(chunks)
+                if len(chunk.split()) >= settings.MIN_MATCH_LENGTH
+            ]
+            if embeddings is not None:
+                embeddings = [embeddings[idx] for idx, _ in eligible]
+            else:
+                embeddings = self.embedding_service.generate_embeddings(
+                    [chunk for _, chunk in eligible]
+                ) or []
+            
+            # Only search the shards this document's institution may see
+            shards = vector_db.visible_shards(
+                document.institution_id,
+                allow_cross_institution=self._allows_cross_institution(document)
+            )
+            where = {'document_id': {'$gt': after_document_id}} if after_document_id is not None else None
+            
+            for (_, chunk), embedding in zip(eligible, embeddings):
                 # Search in vector database
                 results = vector_db.search_similar(
                     query_embedding=embedding,
-                    n_results=5
+                    n_results=5,
+                    where=where,
+                    shards=shards
                 )
                 
                 if results and results['ids']:
-                    for i, doc_id in enumerate(results['ids'][0]):
+                    # Several chunks of one source may hit: keep the best per source document
+                    best = {}
+                    for i, vector_id in enumerate(results['ids'][0]):
+                        metadata = (results.get('metadatas') or [[]])[0]
+                        metadata = metadata[i] if i < len(metadata) and metadata[i] else {}
+                        source_id = int(metadata.get('document_id', vector_id.split(':')[0]))
+                        
                         # Skip if same document
-                        if doc_id == str(document.id):
+                        if source_id == document.id:
                             continue
                         
                         distance = results['distances'][0][i]
                         similarity = (1 - distance) * 100  # Convert distance to similarity
                         
                         if similarity >= settings.SEMANTIC_SIMILARITY_THRESHOLD * 100:
-                            source_text = results['documents'][0][i]
-                            
-                            matches.append({
-                                'match_type': MatchType.SEMANTIC,
-                                'source_type': SourceType.DATABASE,
-                                'matched_text': chunk,
-                                'source_text': source_text,
-                                'similarity_score': similarity,
-                                'source_document_id': int(doc_id),
-                                'start_position': idx * settings.CHUNK_SIZE,
-                                'end_position': idx * settings.CHUNK_SIZE + len(chunk.split())
-                            })
+                            if source_id not in best or similarity > best[source_id][0]:
+                                best[source_id] = (similarity, results['documents'][0][i])
+                    
+                    for source_id, (similarity, source_text) in best.items():
+                        matches.append({
+                            'match_type': MatchType.SEMANTIC,
+                            'source_type': SourceType.DATABASE,
+                            'matched_text': chunk,
+                            'source_text': source_text,
+                            'similarity_score': similarity,
+                            'source_document_id': source_id,
+                            'start_position': chunk.word_start,
+                            'end_position': chunk.word_end
+                        })
         
         except Exception as e:
             print(f"Error checking database: {e}")
         
         return matches
     
-    def _check_web(self, chunks: List[str]) -> List[Dict]:
-        """Check against web sources"""
+    def _allows_cross_institution(self, document: Document) -> bool:
+        """Whether a check may search other institutions' vectors"""
+        return allows_cross_institution(document.institution)
+    
+    def _check_web(self, chunks: List[str], keywords: Optional[List[List[str]]] = None) -> List[Dict]:
+        """Check against web sources (the local web corpus first, then search providers)"""
         matches = []
         
         try:
-            # Select important chunks to search (to save API calls)
-            important_chunks = self._select_important_chunks(chunks, limit=10)
+            seen = set()
             
-            for idx, chunk in enumerate(important_chunks):
-                if len(chunk.split()) < settings.MIN_MATCH_LENGTH:
-                    continue
+            # Pages fetched by earlier checks; chunks with a strong local hit are not searched for
+            if settings.ENABLE_WEB_CORPUS:
+                local_matches = self._check_web_corpus(chunks)
+                for chunk, url, title, similarity, window_text in local_matches:
+                    seen.add((chunk.word_start, chunk.word_end, url))
+                    matches.append(self._window_match(chunk, url, title, similarity, window_text))
                 
-                # Create search query from chunk
-                keywords = self.text_processor.extract_keywords(chunk, top_n=5)
-                query = ' '.join(keywords[:3])  # Use top 3 keywords
-                
-                # Search web
-                search_results = self.search_service.search(query, num_results=5)
-                
-                for result in search_results:
-                    # Fetch content from URL
-                    source_content = self.search_service.fetch_url_content(result['url'])
-                    
-                    if source_content:
-                        # Calculate similarity
-                        similarity = self.similarity_service.cosine_similarity_score(
-                            chunk,
-                            source_content[:1000]  # Compare with first 1000 chars
-                        )
-                        
-                        if similarity >= settings.EXACT_MATCH_THRESHOLD:
-                            # Check if it's a paraphrase using AI
-                            is_paraphrase = False
-                            if similarity < 95:  # Not exact match
-                                ai_result = self.ai_service.detect_paraphrase(
-                                    chunk,
-                                    source_content[:500]
-                                )
-                                is_paraphrase = ai_result['is_paraphrase']
-                            
-                            match_type = MatchType.EXACT if similarity >= 95 else (
-                                MatchType.PARAPHRASE if is_paraphrase else MatchType.SEMANTIC
-                            )
-                            
-                            matches.append({
-                                'match_type': match_type,
-                                'source_type': SourceType.WEB,
-                                'matched_text': chunk,
-                                'source_text': source_content[:500],
-                                'similarity_score': similarity,
-                                'source_url': result['url'],
-                                'source_title': result['title'],
-                                'start_position': idx * settings.CHUNK_SIZE,
-                                'end_position': idx * settings.CHUNK_SIZE + len(chunk.split())
-                            })
+                strong = {
+                    chunk for chunk, _, _, similarity, _ in local_matches
+                    if similarity >= settings.WEB_CORPUS_SKIP_SEARCH_SCORE
+                }
+                metrics.increment("web.corpus.searches_avoided", len(strong))
+                chunks = ["" if chunk in strong else chunk for chunk in chunks]
+            
+            # Search web; each result URL is kept once, however many queries return it
+            searched_chunks, sources = [], {}
+            for chunk, query in self._plan_web_searches(chunks, keywords):
+                searched_chunks.append(chunk)
+                for result in self.search_service.search(query, num_results=5):
+                    if result.get('url'):
+                        sources.setdefault(result['url'], result.get('title', ''))
+            
+            # Fetch each page once (or reuse the stored copy) and window it
+            matcher = WebSourceMatcher(self.similarity_service)
+            stored = self.web_corpus.fresh_by_url(self.db, sources) if settings.ENABLE_WEB_CORPUS else {}
+            fetched = 0
+            for url, title in sources.items():
+                if url in stored:
+                    matcher.add_page(url, title, stored[url].content)
+                    continue
+                source_content = self.search_service.fetch_url_content(url)
+                fetched += 1
+                if source_content:
+                    matcher.add_page(url, title, source_content)
+                    if settings.ENABLE_WEB_CORPUS:
+                        self.web_corpus.ingest(url, title, source_content)
+            metrics.increment("web.pages.fetched", fetched)
+            metrics.increment("web.pages.reused", len(stored))
+            
+            # Every searched chunk against every window of every page, in one pass.
+            # Chunks are keyed by position: repeated text at two offsets is two matches
+            searched_chunks = list({(chunk.word_start, chunk.word_end): chunk for chunk in searched_chunks}.values())
+            for chunk, page, similarity, window_text in matcher.best_matches(
+                searched_chunks,
+                settings.EXACT_MATCH_THRESHOLD
+            ):
+                key = (chunk.word_start, chunk.word_end, page.url)
+                if key not in seen:
+                    seen.add(key)
+                    matches.append(self._window_match(chunk, page.url, page.title, similarity, window_text))
+            
+            self._classify_paraphrases(matches)
         
         except Exception as e:
             print(f"Error checking web: {e}")
         
         return matches
     
-    def _check_institution(self, document: Document, chunks: List[str]) -> List[Dict]:
-        """Check against institution's document database"""
+    def _check_web_corpus(self, chunks: List[str]) -> List[Tuple[str, str, str, float, str]]:
+        """(chunk, url, title, similarity, window text) for chunks matching stored pages"""
+        eligible = [chunk for chunk in chunks if len(chunk.split()) >= settings.MIN_MATCH_LENGTH]
+        candidates = self.web_corpus.candidates(self.db, eligible)
+        sources = self.web_corpus.load(self.db, set().union(*candidates) if candidates else ())
+        if not sources:
+            return []
+        
+        matcher = WebSourceMatcher(self.similarity_service)
+        for source in sources:
+            matcher.add_page(source.url, source.title, source.content)
+        results = [
+            (chunk, page.url, page.title, similarity, window_text)
+            for chunk, page, similarity, window_text in matcher.best_matches(
+                eligible,
+                settings.EXACT_MATCH_THRESHOLD
+            )
+        ]
+        
+        hit_urls = {url for _, url, _, _, _ in results}
+        self.web_corpus.record_hits([source.id for source in sources if source.url in hit_urls])
+        metrics.increment("web.corpus.matches", len(results))
+        return results
+    
+    def _window_match(
+        self,
+        chunk: str,
+        url: str,
+        title: str,
+        similarity: float,
+        window_text: str,
+        source_type: SourceType = SourceType.WEB
+    ) -> Dict:
+        """Match for a chunk and the best-matching window of a web page or reference document"""
+        # Not exact: SEMANTIC until _classify_paraphrases asks the AI about it
+        match_type = MatchType.EXACT if similarity >= 95 else MatchType.SEMANTIC
+        
+        return {
+            'match_type': match_type,
+            'source_type': source_type,
+            'matched_text': chunk,
+            'source_text': window_text,
+            'similarity_score': similarity,
+            'source_url': url,
+            'source_title': title,
+            'start_position': chunk.word_start,
+            'end_position': chunk.word_end
+        }
+    
+    def _classify_paraphrases(self, matches: List[Dict]):
+        """Mark window matches judged paraphrases as PARAPHRASE (locally, or by the AI in one batch)"""
+        pending = [match for match in matches if match['match_type'] == MatchType.SEMANTIC]
+        if not pending:
+            return
+        pairs = [(match['matched_text'], match['source_text']) for match in pending]
+        if settings.ENABLE_LOCAL_PARAPHRASE:
+            verdicts = self.paraphrase_classifier.classify_many(pairs)
+        else:
+            verdicts = self.ai_service.detect_paraphrase_many(pairs)
+        for match, verdict in zip(pending, verdicts):
+            if verdict.get('is_paraphrase'):
+                match['match_type'] = MatchType.PARAPHRASE
+    
+    def _plan_web_searches(
+        self,
+        chunks: List[str],
+        keywords: Optional[List[List[str]]] = None
+    ) -> List[Tuple[str, str]]:
+        """(chunk, query) pairs to search, at most WEB_SEARCH_BUDGET of them"""
+        if settings.ENABLE_QUERY_PLANNER:
+            return [(planned.chunk, planned.query) for planned in get_query_planner().plan(chunks)]
+        
+        # Select important chunks to search (to save API calls)
+        chunk_keywords = dict(zip(chunks, keywords)) if keywords is not None else {}
+        searches = []
+        for chunk in self._select_important_chunks(chunks, limit=settings.WEB_SEARCH_BUDGET):
+            if len(chunk.split()) < settings.MIN_MATCH_LENGTH:
+                continue
+            
+            # Create search query from chunk
+            chunk_terms = chunk_keywords.get(chunk) or self.text_processor.extract_keywords(chunk, top_n=5)
+            searches.append((chunk, ' '.join(chunk_terms[:3])))  # Use top 3 keywords
+        return searches
+    
+    def _check_institution(
+        self,
+        document: Document,
+        chunks: List[str],
+        after_document_id: Optional[int] = None
+    ) -> List[Dict]:
+        """Check against institution's document database (optionally only newer documents)"""
         matches = []
         
         try:
             # Query documents from same institution
-            institution_docs = self.db.query(Document).filter(
+            query = self.db.query(Document).filter(
                 Document.institution_id == document.institution_id,
                 Document.id != document.id
-            ).all()
+            )
+            if after_document_id is not None:
+                query = query.filter(Document.id > after_document_id)
+            
+            if settings.ENABLE_LSH_CANDIDATES:
+                # Only score documents that share LSH buckets with a chunk
+                chunk_candidates = get_minhash_service().candidates(self.db, chunks, exclude_id=document.id)
+                candidate_ids = set().union(*chunk_candidates) if chunk_candidates else set()
+                institution_docs = query.filter(Document.id.in_(candidate_ids)).all() if candidate_ids else []
+            else:
+                institution_docs = query.all()
+                chunk_candidates = None
+            docs_by_id = {doc.id: doc for doc in institution_docs}
             
-            for chunk in chunks:
+            # Candidate sources are tokenized once (from their sidecars), not per chunk
+            store = get_analysis_store()
+            source_counts = {}
+            
+            for chunk_idx, chunk in enumerate(chunks):
                 if len(chunk.split()) < settings.MIN_MATCH_LENGTH:
                     continue
                 
-                for inst_doc in institution_docs:
-                    similarity = self.similarity_service.cosine_similarity_score(
-                        chunk,
-                        inst_doc.content
-                    )
+                if chunk_candidates is not None:
+                    chunk_docs = [docs_by_id[i] for i in chunk_candidates[chunk_idx] if i in docs_by_id]
+                else:
+                    chunk_docs = institution_docs
+                
+                chunk_counts = term_counts(token_hashes(chunk)) if store else None
+                for inst_doc in chunk_docs:
+                    if store:
+                        if inst_doc.id not in source_counts:
+                            source_counts[inst_doc.id] = store.get_or_build(inst_doc).term_counts()
+                        similarity = self.similarity_service.cosine_similarity_from_counts(
+                            chunk_counts,
+                            source_counts[inst_doc.id]
+                        )
+                    else:
+                        similarity = self.similarity_service.cosine_similarity_score(
+                            chunk,
+                            inst_doc.content
+                        )
                     
                     if similarity >= settings.EXACT_MATCH_THRESHOLD:
                         matches.append({
@@ -202,8 +674,8 @@ class PlagiarismDetector:
                             'source_text': inst_doc.content[:500],
                             'similarity_score': similarity,
                             'source_document_id': inst_doc.id,
-                            'start_position': 0,
-                            'end_position': len(chunk.split())
+                            'start_position': chunk.word_start,
+                            'end_position': chunk.word_end
                         })
         
         except Exception as e:
@@ -211,6 +683,84 @@ class PlagiarismDetector:
         
         return matches
     
+    def _check_reference(
+        self,
+        chunks: List[str],
+        embeddings: Optional[List[List[float]]] = None
+    ) -> List[Dict]:
+        """Check against imported reference corpora (copied text via LSH, reworded text via vectors)"""
+        matches = []
+        
+        try:
+            reference = self.reference_corpus
+            if reference.is_empty(self.db):
+                return []
+            eligible = [
+                (idx, chunk) for idx, chunk in enumerate(chunks)
+                if len(chunk.split()) >= settings.MIN_MATCH_LENGTH
+            ]
+            eligible_chunks = [chunk for _, chunk in eligible]
+            seen = set()
+            
+            # Copied text: LSH candidates verified window by window
+            if settings.REFERENCE_USE_LSH:
+                candidates = reference.candidates(self.db, eligible_chunks)
+                documents = {
+                    document.id: document
+                    for document in reference.load(self.db, set().union(*candidates) if candidates else ())
+                }
+                matcher = WebSourceMatcher(self.similarity_service)
+                for document in documents.values():
+                    matcher.add_page(str(document.id), document.title, document.content)
+                for chunk, page, similarity, window_text in matcher.best_matches(
+                    eligible_chunks,
+                    settings.EXACT_MATCH_THRESHOLD
+                ):
+                    document = documents[int(page.url)]
+                    seen.add((chunk, document.id))
+                    matches.append(self._window_match(
+                        chunk, document.url, document.title, similarity, window_text,
+                        source_type=SourceType.REFERENCE
+                    ))
+                self._classify_paraphrases(matches)
+            
+            # Reworded text: nearest chunks in the reference vector shard
+            if reference.has_vectors():
+                if embeddings is not None:
+                    embeddings = [embeddings[idx] for idx, _ in eligible]
+                else:
+                    embeddings = self.embedding_service.generate_embeddings(eligible_chunks) or []
+                
+                for chunk, embedding in zip(eligible_chunks, embeddings):
+                    # Keep the best hit per reference document
+                    best = {}
+                    for hit in reference.search_vectors(embedding):
+                        reference_id = hit['reference_id']
+                        if hit['similarity'] < settings.SEMANTIC_SIMILARITY_THRESHOLD * 100 or (chunk, reference_id) in seen:
+                            continue
+                        if reference_id not in best or hit['similarity'] > best[reference_id]['similarity']:
+                            best[reference_id] = hit
+                    
+                    for hit in best.values():
+                        matches.append({
+                            'match_type': MatchType.SEMANTIC,
+                            'source_type': SourceType.REFERENCE,
+                            'matched_text': chunk,
+                            'source_text': hit['text'],
+                            'similarity_score': hit['similarity'],
+                            'source_url': hit['metadata'].get('url'),
+                            'source_title': hit['metadata'].get('title'),
+                            'start_position': chunk.word_start,
+                            'end_position': chunk.word_end
+                        })
+            
+            metrics.increment("reference.matches", len(matches))
+        
+        except Exception as e:
+            print(f"Error checking reference corpora: {e}")
+        
+        return matches
+    
     def _select_important_chunks(self, chunks: List[str], limit: int = 10) -> List[str]:
         """Select most important chunks for checking (to save API calls)"""
         # Score chunks based on length and keyword density
@@ -234,14 +784,12 @@ class PlagiarismDetector:
         
         total_words = len(full_text.split())
         
-        # Calculate matched words (avoid double counting)
-        matched_positions = set()
-        for match in matches:
-            start = match.get('start_position', 0)
-            end = match.get('end_position', 0)
-            matched_positions.update(range(start, end))
-        
-        matched_words = len(matched_positions)
+        # Calculate matched words (overlapping chunks and sources counted once)
+        covered = merge_spans([
+            (match.get('start_position') or 0, match.get('end_position') or 0)
+            for match in matches
+        ])
+        matched_words = sum(end - start for start, end in covered)
         plagiarism_percentage = (matched_words / total_words * 100) if total_words > 0 else 0
         
         originality_score = 100 - plagiarism_percentage
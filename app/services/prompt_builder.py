@@ -0,0 +1,108 @@
+"""
+Token-budgeted prompts for AI adjudication.
+
+Paraphrase prompts no longer carry two whole chunks. Both texts are split
+into sentences and each sentence of the submitted text is aligned with its
+most similar source sentence (word Jaccard). The best-aligned pairs go into
+the prompt, strongest first, until AI_PARAPHRASE_TOKEN_BUDGET is used.
+Sentences with no counterpart in the source carry no evidence either way,
+so they are left out. Summaries keep whole leading sentences within
+AI_SUMMARY_TOKEN_BUDGET. Answers are a compact JSON object
+({"p": 0|1, "c": 0-100}), so a verdict costs a few output tokens, not a
+paragraph of explanation.
+"""
+from typing import List, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.ai_scheduler import estimate_tokens
+from app.services.chunker import sentence_starts
+from app.services.tokenized_document import TextLike, TokenizedDocument, tokenize
+
+# Output tokens a compact paraphrase verdict needs
+PARAPHRASE_MAX_TOKENS = 20
+
+_PARAPHRASE_INSTRUCTIONS = (
+    "Do the B sentences restate the A sentences (same meaning, possibly reworded)? "
+    'Reply with JSON only: {"p":1 or 0,"c":confidence 0-100}'
+)
+
+
+def split_sentences(text: TextLike) -> List[TokenizedDocument]:
+    """Sentences of text as slices of its tokens"""
+    tokens = tokenize(text)
+    if len(tokens) == 0:
+        return []
+    bounds = [0] + sentence_starts(tokens).tolist() + [len(tokens)]
+    return [tokens[start:end] for start, end in zip(bounds, bounds[1:]) if end > start]
+
+
+def align_sentences(text1: TextLike, text2: TextLike) -> List[Tuple[str, str, float]]:
+    """
+    (sentence of text1, best-matching sentence of text2, Jaccard 0-100) for every
+    sentence of text1 that has a counterpart, strongest alignment first
+    """
+    sentences1 = split_sentences(text1)
+    sentences2 = split_sentences(text2)
+    if not sentences1 or not sentences2:
+        return []
+    words2 = [np.unique(sentence.ids) for sentence in sentences2]
+    
+    aligned = []
+    for sentence in sentences1:
+        words1 = np.unique(sentence.ids)
+        best_score, best = 0.0, None
+        for candidate, words in zip(sentences2, words2):
+            shared = len(np.intersect1d(words1, words, assume_unique=True))
+            score = shared / (len(words1) + len(words) - shared) * 100
+            if score > best_score:
+                best_score, best = score, candidate
+        if best is not None:
+            aligned.append((sentence.text, best.text, best_score))
+    # Repeated sentences would only repeat the same evidence
+    aligned = list({pair[:2]: pair for pair in aligned}.values())
+    aligned.sort(key=lambda pair: -pair[2])
+    return aligned
+
+
+def _fit(text: str, budget: int) -> str:
+    """text cut to about budget tokens, at a word boundary"""
+    if estimate_tokens(text) <= budget:
+        return text
+    return text[:budget * 4].rsplit(" ", 1)[0]
+
+
+def paraphrase_prompt(text1: TextLike, text2: TextLike, budget: int = 0) -> str:
+    """Compact paraphrase prompt from the aligned sentence pairs that fit the token budget"""
+    budget = budget or settings.AI_PARAPHRASE_TOKEN_BUDGET
+    aligned = align_sentences(text1, text2)
+    pairs = [pair for pair in aligned if pair[2] >= settings.AI_ALIGN_MIN_SIMILARITY] or aligned[:1]
+    if not pairs:
+        # Nothing to align (no sentence shares a word): compare the texts themselves
+        pairs = [(str(text1), str(text2), 0.0)]
+    
+    lines, used = [], 0
+    for sentence1, sentence2, _ in pairs:
+        cost = estimate_tokens(sentence1) + estimate_tokens(sentence2)
+        if lines and used + cost > budget:
+            continue
+        if not lines and cost > budget:
+            # A single pair over budget: split the budget between its sides
+            sentence1, sentence2 = _fit(sentence1, budget // 2), _fit(sentence2, budget // 2)
+        n = len(lines) + 1
+        lines.append(f"A{n}: {sentence1}\nB{n}: {sentence2}")
+        used += cost
+    return _PARAPHRASE_INSTRUCTIONS + "\n" + "\n".join(lines)
+
+
+def summary_prompt(text: TextLike, max_length: int, budget: int = 0) -> str:
+    """Summary prompt over the leading whole sentences that fit the token budget"""
+    budget = budget or settings.AI_SUMMARY_TOKEN_BUDGET
+    kept, used = [], 0
+    for sentence in split_sentences(text):
+        sentence_text = sentence.text
+        cost = estimate_tokens(sentence_text)
+        if kept and used + cost > budget:
+            break
+        kept.append(_fit(sentence_text, budget) if not kept else sentence_text)
+        used += cost
+    return f"Summarize in at most {max_length} characters:\n" + " ".join(kept)
\ No newline at end of file
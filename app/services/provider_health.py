@@ -0,0 +1,174 @@
+"""
+Health, latency and quota tracking for external providers.
+
+Every provider gets a circuit breaker: after CIRCUIT_BREAKER_FAILURES
+consecutive failures it is skipped for CIRCUIT_BREAKER_COOLDOWN_SECONDS, then a
+single trial call decides whether it closes again. Call latencies go to the
+metrics registry as <kind>.<provider>.latency_ms, and their percentiles drive
+hedging delays. Monthly quotas are counted in Redis so all worker processes
+draw on the same allowance (an in-process count stands in while Redis is down).
+"""
+import calendar
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+from app.core.config import settings
+from app.services.cache_service import cache_service
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open trial call"""
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, failure_threshold: Optional[int] = None, cooldown_seconds: Optional[float] = None):
+        self.failure_threshold = failure_threshold or settings.CIRCUIT_BREAKER_FAILURES
+        self.cooldown_seconds = cooldown_seconds or settings.CIRCUIT_BREAKER_COOLDOWN_SECONDS
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    def _cooled_down(self) -> bool:
+        return time.monotonic() - self._opened_at >= self.cooldown_seconds
+    
+    def available(self) -> bool:
+        """Whether a call would currently be allowed (does not reserve the trial call)"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            return not self._trial_in_flight and (self.state == self.HALF_OPEN or self._cooled_down())
+    
+    def allow(self) -> bool:
+        """Reserve a call; in the half-open state only one trial call is let through"""
+        with self._lock:
+            if self.state == self.OPEN and self._cooled_down():
+                self.state = self.HALF_OPEN
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_in_flight = False
+    
+    def release_trial(self):
+        """The call says nothing about health (e.g. throttled): free the trial without changing state"""
+        with self._lock:
+            self._trial_in_flight = False
+    
+    def record_failure(self) -> bool:
+        """Count a failure; True if this opened the breaker"""
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                return True
+            return False
+
+
+class ProviderHealth:
+    """A provider's breaker plus its latency and error metrics"""
+    
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+        self.breaker = CircuitBreaker()
+    
+    @property
+    def latency_metric(self) -> str:
+        return f"{self.kind}.{self.name}.latency_ms"
+    
+    def record(self, latency_ms: float, ok: bool):
+        metrics.observe(self.latency_metric, latency_ms)
+        if ok:
+            self.breaker.record_success()
+            return
+        metrics.increment(f"{self.kind}.{self.name}.errors")
+        if self.breaker.record_failure():
+            metrics.increment(f"{self.kind}.{self.name}.breaker_opened")
+            logger.warning(f"{self.kind} provider {self.name} failing; skipped for {self.breaker.cooldown_seconds:.0f}s")
+    
+    def latency_percentile(self, q: float) -> Optional[float]:
+        """Recent latency percentile in milliseconds (None before the first call)"""
+        value = metrics.percentile(self.latency_metric, q)
+        return value or None
+
+
+_health: Dict[Tuple[str, str], ProviderHealth] = {}
+_health_lock = threading.Lock()
+
+
+def get_provider_health(kind: str, name: str) -> ProviderHealth:
+    """Return the process-wide health record of a provider"""
+    with _health_lock:
+        if (kind, name) not in _health:
+            _health[(kind, name)] = ProviderHealth(kind, name)
+        return _health[(kind, name)]
+
+
+class QuotaTracker:
+    """Calendar-month call counts per provider, shared through Redis"""
+    
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._local: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def _key(self, name: str) -> str:
+        return f"quota:{self.kind}:{name}:{datetime.now(timezone.utc):%Y%m}"
+    
+    def used(self, name: str) -> int:
+        key = self._key(name)
+        client = cache_service.redis_client
+        if client is not None:
+            try:
+                return int(client.get(key) or 0)
+            except Exception as e:
+                cache_service.mark_redis_failed("quota", e)
+        with self._lock:
+            return self._local.get(key, 0)
+    
+    def consume(self, name: str, amount: int = 1):
+        key = self._key(name)
+        client = cache_service.redis_client
+        if client is not None:
+            try:
+                pipeline = client.pipeline(transaction=False)
+                pipeline.incrby(key, amount)
+                pipeline.expire(key, 40 * 24 * 3600)
+                pipeline.execute()
+                return
+            except Exception as e:
+                cache_service.mark_redis_failed("quota", e)
+        with self._lock:
+            self._local[key] = self._local.get(key, 0) + amount
+    
+    def status(self, name: str, limit: int) -> Tuple[bool, bool]:
+        """
+        (exhausted, ahead_of_pace) for a monthly limit (0 = unlimited). A provider
+        is ahead of pace when it has used more than its share of the quota for the
+        month so far (plus one day's share).
+        """
+        if limit <= 0:
+            return False, False
+        used = self.used(name)
+        now = datetime.now(timezone.utc)
+        days = calendar.monthrange(now.year, now.month)[1]
+        month_elapsed = (now.day - 1 + (now.hour * 3600 + now.minute * 60 + now.second) / 86400) / days
+        return used >= limit, used / limit > month_elapsed + 1 / days
\ No newline at end of file
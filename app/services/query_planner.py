@@ -0,0 +1,205 @@
+"""
+IDF-weighted web search planning.
+
+A corpus document-frequency table (one Redis hash, updated as documents are
+ingested and deleted) tells how distinctive each word is. For every chunk the
+planner picks the rarest phrase that stays inside one clause and turns it into
+a quoted exact-phrase query; chunks are then chosen greedily by that rarity
+until the per-check search budget is spent. Queries are de-duplicated, since
+overlapping chunks often share their rarest phrase.
+"""
+import logging
+import math
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+from app.core.config import settings
+from app.services.cache_service import cache_service
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DF_TERMS_KEY = "df:v1:terms"
+DF_DOCS_KEY = "df:v1:docs"
+
+# Same tokens as the TF-IDF scorer
+_TERM_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+# Punctuation that ends a clause; quoted phrases never span it
+_CLAUSE_END = ".,;:!?"
+
+
+def document_terms(text: str) -> Set[str]:
+    """Distinct lower-cased terms of a document (what the DF table counts)"""
+    return set(_TERM_PATTERN.findall((text or "").lower()))
+
+
+class DocumentFrequencyTable:
+    """Corpus-wide document frequencies kept in Redis"""
+    
+    def add_document(self, text: str):
+        self._update(document_terms(text), 1)
+    
+    def remove_document(self, text: str):
+        self._update(document_terms(text), -1)
+    
+    def _update(self, terms: Set[str], delta: int):
+        client = cache_service.redis_client
+        if client is None or not terms:
+            return
+        try:
+            pipeline = client.pipeline(transaction=False)
+            for term in terms:
+                pipeline.hincrby(DF_TERMS_KEY, term, delta)
+            pipeline.incrby(DF_DOCS_KEY, delta)
+            pipeline.execute()
+        except Exception as e:
+            cache_service.mark_redis_failed("df update", e)
+    
+    def lookup(self, terms: Iterable[str]) -> Tuple[int, Dict[str, int]]:
+        """(corpus size, document frequency of each term); (0, {}) if Redis is unreachable"""
+        terms = list(set(terms))
+        client = cache_service.redis_client
+        if client is None or not terms:
+            return 0, {}
+        try:
+            pipeline = client.pipeline(transaction=False)
+            pipeline.get(DF_DOCS_KEY)
+            pipeline.hmget(DF_TERMS_KEY, terms)
+            total, counts = pipeline.execute()
+        except Exception as e:
+            cache_service.mark_redis_failed("df lookup", e)
+            return 0, {}
+        return int(total or 0), {
+            term: max(int(count), 0) for term, count in zip(terms, counts) if count is not None
+        }
+    
+    def rebuild(self, texts: Iterable[str]) -> int:
+        """Recount from scratch into temporary keys, then swap them in; returns documents counted"""
+        client = cache_service.redis_client
+        if client is None:
+            raise RuntimeError("Redis is not available")
+        
+        terms_key, docs_key = f"{DF_TERMS_KEY}:rebuild", f"{DF_DOCS_KEY}:rebuild"
+        client.delete(terms_key, docs_key)
+        documents = 0
+        pipeline = client.pipeline(transaction=False)
+        for text in texts:
+            for term in document_terms(text):
+                pipeline.hincrby(terms_key, term, 1)
+            documents += 1
+            if len(pipeline) >= 10000:
+                pipeline.execute()
+        pipeline.set(docs_key, documents)
+        pipeline.execute()
+        
+        if client.exists(terms_key):
+            client.rename(terms_key, DF_TERMS_KEY)
+        else:
+            client.delete(DF_TERMS_KEY)
+        client.rename(docs_key, DF_DOCS_KEY)
+        return documents
+
+
+# Global instance
+document_frequencies = DocumentFrequencyTable()
+
+
+class PlannedQuery:
+    """One web search: the chunk it checks, the query text and its expected value"""
+    
+    def __init__(self, chunk: str, query: str, score: float):
+        self.chunk = chunk
+        self.query = query
+        self.score = score
+    
+    def __repr__(self) -> str:
+        return f"PlannedQuery({self.query!r}, score={self.score:.2f})"
+
+
+class QueryPlanner:
+    """Chooses which chunks to search for, and with which query, under a budget"""
+    
+    def __init__(self, frequencies: Optional[DocumentFrequencyTable] = None):
+        self.frequencies = frequencies or document_frequencies
+    
+    def plan(self, chunks: List[str], budget: Optional[int] = None) -> List[PlannedQuery]:
+        """Best queries for the chunks, at most budget of them (WEB_SEARCH_BUDGET by default)"""
+        budget = settings.WEB_SEARCH_BUDGET if budget is None else budget
+        chunks = [chunk for chunk in chunks if len(chunk.split()) >= settings.MIN_MATCH_LENGTH]
+        if budget <= 0 or not chunks:
+            return []
+        
+        words_by_chunk = [chunk.split() for chunk in chunks]
+        terms = {
+            term
+            for words in words_by_chunk
+            for word in words
+            for term in _TERM_PATTERN.findall(word.lower())
+        }
+        total, frequencies = self.frequencies.lookup(terms)
+        idf = {term: self._idf(term, total, frequencies) for term in terms}
+        
+        candidates = []
+        for chunk, words in zip(chunks, words_by_chunk):
+            phrase, score = self._best_phrase(words, idf)
+            if phrase:
+                candidates.append(PlannedQuery(chunk, phrase, score))
+        
+        plan, seen_queries = [], set()
+        for candidate in sorted(candidates, key=lambda c: c.score, reverse=True):
+            if len(plan) >= budget:
+                break
+            if candidate.query in seen_queries:
+                continue
+            plan.append(candidate)
+            seen_queries.add(candidate.query)
+        
+        metrics.increment("web.plan.candidates", len(candidates))
+        metrics.increment("web.plan.queries", len(plan))
+        return plan
+    
+    @staticmethod
+    def _idf(term: str, total: int, frequencies: Dict[str, int]) -> float:
+        """Smoothed IDF; stopwords and numbers weigh nothing, unknown terms count as unseen"""
+        if term in ENGLISH_STOP_WORDS or term.isdigit():
+            return 0.0
+        return math.log((total + 1) / (frequencies.get(term, 0) + 1)) + 1
+    
+    def _best_phrase(self, words: List[str], idf: Dict[str, float]) -> Tuple[str, float]:
+        """Rarest clause-internal window of QUERY_PHRASE_WORDS words, as a quoted query"""
+        size = settings.QUERY_PHRASE_WORDS
+        weights = []
+        for word in words:
+            word_terms = _TERM_PATTERN.findall(word.lower())
+            weights.append(max((idf[term] for term in word_terms), default=0.0))
+        
+        best, best_score = None, 0.0
+        for start in range(0, max(len(words) - size + 1, 1)):
+            window = words[start:start + size]
+            # Punctuation is only allowed on the last word of the phrase
+            if any(word[-1] in _CLAUSE_END for word in window[:-1]):
+                continue
+            content = [w for w in weights[start:start + size] if w > 0]
+            if len(content) < 2:
+                continue
+            score = sum(content) / size
+            if score > best_score:
+                best, best_score = window, score
+        
+        if best is None:
+            return "", 0.0
+        phrase = " ".join(best).strip(_CLAUSE_END + "-")
+        query = f'"{phrase}"' if settings.QUERY_QUOTE_PHRASES else phrase
+        return query, best_score
+
+
+_planner: Optional[QueryPlanner] = None
+
+
+def get_query_planner() -> QueryPlanner:
+    """Return the process-wide query planner"""
+    global _planner
+    
+    if _planner is None:
+        _planner = QueryPlanner()
+    return _planner
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""
+Offline reference corpora (Wikipedia dumps, local document sets).
+
+Documents are imported in bulk by app.commands.import_reference_corpus, which
+stores their text and per-chunk MinHash signatures in reference_documents and
+their chunk vectors in the reference vector shard. Checks find candidates
+through both: the process-wide LSH index for copied text (optional, since it
+is held in memory) and the vector shard for reworded text.
+"""
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+from app.core.config import settings
+from app.database.vector_db import REFERENCE_SHARD, vector_db
+from app.models.reference_document import ReferenceDocument
+from app.services.minhash_service import LSHIndex, get_minhash_service
+
+logger = logging.getLogger(__name__)
+
+
+class ReferenceCorpusService:
+    """Finds candidate reference documents for query chunks"""
+    
+    def __init__(self):
+        self.hasher = get_minhash_service().hasher
+        self.index = LSHIndex()
+        self._loaded_max_id = 0
+        self._lock = threading.Lock()
+    
+    def refresh(self, db):
+        """Load signatures of reference documents imported since the last refresh"""
+        with self._lock:
+            rows = db.query(ReferenceDocument.id, ReferenceDocument.minhash_signatures).filter(
+                ReferenceDocument.id > self._loaded_max_id
+            ).order_by(ReferenceDocument.id).yield_per(500)
+            for reference_id, data in rows:
+                if data:
+                    self.index.add(reference_id, self.hasher.from_bytes(data))
+                self._loaded_max_id = max(self._loaded_max_id, reference_id)
+    
+    def candidates(self, db, chunks: List[str]) -> List[Set[int]]:
+        """Per-chunk candidate reference document ids from the LSH index"""
+        self.refresh(db)
+        signatures = self.hasher.chunk_signatures(chunks)
+        return [
+            set(hits) if chunk.strip() else set()
+            for chunk, hits in zip(chunks, self.index.query_many(signatures, settings.LSH_MIN_BAND_HITS))
+        ]
+    
+    def has_vectors(self) -> bool:
+        return vector_db.is_available() and REFERENCE_SHARD in vector_db.list_shards()
+    
+    def search_vectors(self, embedding: List[float], n_results: int = 5) -> List[Dict]:
+        """Nearest reference chunks as dicts of reference_id, text, similarity (0-100) and metadata"""
+        results = vector_db.search_similar(embedding, n_results=n_results, shards=[REFERENCE_SHARD])
+        if not results or not results['ids'] or not results['ids'][0]:
+            return []
+        
+        hits = []
+        metadatas = (results.get('metadatas') or [[]])[0]
+        for i, vector_id in enumerate(results['ids'][0]):
+            metadata = metadatas[i] if i < len(metadatas) and metadatas[i] else {}
+            hits.append({
+                'reference_id': int(metadata.get('reference_id', vector_id.split(':')[1])),
+                'text': results['documents'][0][i],
+                'similarity': (1 - results['distances'][0][i]) * 100,
+                'metadata': metadata
+            })
+        return hits
+    
+    def load(self, db, reference_ids: Iterable[int]) -> List[ReferenceDocument]:
+        """Reference documents by id (deleted ones are dropped from the index)"""
+        reference_ids = set(reference_ids)
+        if not reference_ids:
+            return []
+        documents = db.query(ReferenceDocument).filter(ReferenceDocument.id.in_(reference_ids)).all()
+        for missing in reference_ids - {document.id for document in documents}:
+            self.index.remove(missing)
+        return documents
+    
+    def is_empty(self, db) -> bool:
+        return db.query(ReferenceDocument.id).first() is None
+
+
+def reference_records(
+    reference_id: int,
+    metadata: Dict,
+    chunks: List[str],
+    embeddings: List[List[float]]
+):
+    """Vector-index rows for a reference document's chunks (ids ref:<id>:<chunk>)"""
+    ids, texts, vectors, metadatas = [], [], [], []
+    for idx, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+        ids.append(f"ref:{reference_id}:{idx}")
+        texts.append(chunk)
+        vectors.append(embedding)
+        metadatas.append({**metadata, 'reference_id': reference_id, 'chunk_index': idx})
+    return ids, texts, vectors, metadatas
+
+
+_service: Optional[ReferenceCorpusService] = None
+
+
+def get_reference_corpus_service() -> ReferenceCorpusService:
+    """Return the process-wide reference corpus service"""
+    global _service
+    
+    if _service is None:
+        _service = ReferenceCorpusService()
+    return _service
\ No newline at end of file
@@ -1,4 +1,5 @@
 from typing import List, Dict
+import numpy as np
 from jinja2 import Template
 from datetime import datetime
 from app.models.submission import Submission
@@ -82,29 +83,28 @@ class ReportGenerator:
         words = content.split()
         highlighted = []
         
-        # Create a map of positions to highlight
-        highlight_map = {}
-        for match in matches:
-            for pos in range(match.start_position, match.end_position):
-                if pos not in highlight_map:
-                    highlight_map[pos] = []
-                highlight_map[pos].append({
-                    'type': match.match_type.value,
-                    'similarity': match.similarity_score
-                })
+        # Owner of each word position: the first match covering it (-1 for none)
+        owners = np.full(len(words), -1, dtype=np.int64)
+        for i in reversed(range(len(matches))):
+            match = matches[i]
+            owners[max(match.start_position or 0, 0):max(match.end_position or 0, 0)] = i
         
-        # Build highlighted HTML
-        for i, word in enumerate(words):
-            if i in highlight_map:
-                match_info = highlight_map[i][0]  # Take first match
-                color = self._get_color_by_similarity(match_info['similarity'])
+        # One span per run of words with the same owner
+        run_starts = np.flatnonzero(np.diff(owners, prepend=-2))
+        run_ends = np.append(run_starts[1:], len(words))
+        for start, end in zip(run_starts.tolist(), run_ends.tolist()):
+            text = ' '.join(words[start:end])
+            owner = int(owners[start])
+            if owner >= 0:
+                match = matches[owner]
+                color = self._get_color_by_similarity(match.similarity_score)
                 highlighted.append(
-                    f'<span class="match {match_info["type"]}" '
+                    f'<span class="match {match.match_type.value}" '
                     f'style="background-color: {color};" '
-                    f'title="Similarity: {match_info["similarity"]:.1f}%">{word}</span>'
+                    f'title="Similarity: {match.similarity_score:.1f}%">{text}</span>'
                 )
             else:
-                highlighted.append(word)
+                highlighted.append(text)
         
         return ' '.join(highlighted)
     
@@ -1,28 +1,163 @@
+"""
+Web search across DuckDuckGo, Serper and SerpAPI.
+
+Providers are tried in SEARCH_PRIORITY order, except that providers whose
+circuit breaker is open or whose monthly quota is spent are skipped, and paid
+providers that are ahead of their monthly pace go last. Searches are hedged:
+if the current provider has not answered within its recent p95 latency
+(clamped to SEARCH_HEDGE_MIN_MS..SEARCH_HEDGE_MAX_MS), the next provider is
+queried too and the first successful answer wins. A failure moves on to the
+next provider at once.
+"""
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from typing import List, Dict, Optional
-import requests
 from duckduckgo_search import DDGS
 from app.core.config import settings
+from app.services.html_extractor import get_html_extractor
+from app.services.http_clients import get_http_session
+from app.services.metrics import metrics
+from app.services.provider_health import QuotaTracker, get_provider_health
+
+_quotas = QuotaTracker("search")
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_pid: Optional[int] = None
+_executor_lock = threading.Lock()
+
+
+def _search_executor() -> ThreadPoolExecutor:
+    """Process-wide pool for (hedged) provider calls, recreated in forked children"""
+    global _executor, _executor_pid
+    
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=settings.SEARCH_WORKERS, thread_name_prefix="search")
+            _executor_pid = os.getpid()
+        return _executor
 
 
 class SearchService:
     """Search the web using multiple search APIs"""
     
+    def _enabled(self, provider: str) -> bool:
+        if provider == "duckduckgo":
+            return settings.USE_DUCKDUCKGO
+        if provider == "serper":
+            return bool(settings.SERPER_API_KEY)
+        if provider == "serpapi":
+            return bool(settings.SERPAPI_KEY)
+        return False
+    
+    @staticmethod
+    def _monthly_quota(provider: str) -> int:
+        return {
+            "serper": settings.SERPER_MONTHLY_QUOTA,
+            "serpapi": settings.SERPAPI_MONTHLY_QUOTA
+        }.get(provider, 0)
+    
+    def route(self) -> List[str]:
+        """Providers to try for the next query, best first"""
+        candidates = []
+        for position, provider in enumerate(p.strip() for p in settings.SEARCH_PRIORITY.split(",")):
+            if not self._enabled(provider) or not get_provider_health("search", provider).breaker.available():
+                continue
+            exhausted, ahead_of_pace = _quotas.status(provider, self._monthly_quota(provider))
+            if exhausted:
+                metrics.increment(f"search.{provider}.quota_exhausted")
+                continue
+            candidates.append((ahead_of_pace, position, provider))
+        return [provider for _, _, provider in sorted(candidates)]
+    
     def search(self, query: str, num_results: int = 10) -> List[Dict]:
-        """Search using priority order"""
-        for search_method in settings.SEARCH_PRIORITY.split(","):
-            try:
-                if search_method == "duckduckgo" and settings.USE_DUCKDUCKGO:
-                    return self._search_duckduckgo(query, num_results)
-                elif search_method == "serper" and settings.SERPER_API_KEY:
-                    return self._search_serper(query, num_results)
-                elif search_method == "serpapi" and settings.SERPAPI_KEY:
-                    return self._search_serpapi(query, num_results)
-            except Exception as e:
-                print(f"Error with {search_method}: {e}")
+        """Search with the healthiest providers, hedging slow ones"""
+        providers = self.route()
+        if not settings.SEARCH_HEDGE:
+            for provider in providers:
+                if self._reserve(provider):
+                    results = self._call(provider, query, num_results)
+                    if results is not None:
+                        return results
+            return []
+        return self._search_hedged(providers, query, num_results)
+    
+    def _search_hedged(self, providers: List[str], query: str, num_results: int) -> List[Dict]:
+        queue = list(providers)
+        pending: Dict[Future, str] = {}
+        launched: List[str] = []
+        executor = _search_executor()
+        deadline = time.monotonic() + settings.SEARCH_TIMEOUT
+        
+        def launch() -> bool:
+            while queue:
+                provider = queue.pop(0)
+                if self._reserve(provider):
+                    pending[executor.submit(self._call, provider, query, num_results)] = provider
+                    launched.append(provider)
+                    return True
+            return False
+        
+        launch()
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            wait_for = min(self._hedge_delay(launched[-1]), remaining) if queue else remaining
+            done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+            
+            if not done:
+                # The newest request is slower than usual: hedge with the next provider
+                if launch():
+                    metrics.increment("search.hedged")
                 continue
+            
+            for future in done:
+                provider = pending.pop(future)
+                results = future.result()
+                if results is not None:
+                    if provider != launched[0]:
+                        metrics.increment("search.hedge_wins")
+                    return results
+            # A provider failed: move on without waiting out the hedge delay
+            launch()
         
+        metrics.increment("search.failed")
         return []
     
+    def _hedge_delay(self, provider: str) -> float:
+        """Seconds to wait for a provider before hedging"""
+        latency = get_provider_health("search", provider).latency_percentile(settings.SEARCH_HEDGE_PERCENTILE)
+        if latency is None:
+            latency = settings.SEARCH_HEDGE_MAX_MS
+        return min(max(latency, settings.SEARCH_HEDGE_MIN_MS), settings.SEARCH_HEDGE_MAX_MS) / 1000
+    
+    def _reserve(self, provider: str) -> bool:
+        """Take the breaker's permission (and a unit of quota) for one call"""
+        if not get_provider_health("search", provider).breaker.allow():
+            return False
+        if self._monthly_quota(provider):
+            _quotas.consume(provider)
+        return True
+    
+    def _call(self, provider: str, query: str, num_results: int) -> Optional[List[Dict]]:
+        """One provider call with health accounting; None on failure"""
+        method = {
+            "duckduckgo": self._search_duckduckgo,
+            "serper": self._search_serper,
+            "serpapi": self._search_serpapi
+        }[provider]
+        health = get_provider_health("search", provider)
+        start = time.perf_counter()
+        try:
+            results = method(query, num_results)
+        except Exception as e:
+            health.record((time.perf_counter() - start) * 1000, ok=False)
+            print(f"Error with {provider}: {e}")
+            return None
+        health.record((time.perf_counter() - start) * 1000, ok=True)
+        return results
+    
     def _search_duckduckgo(self, query: str, num_results: int) -> List[Dict]:
         """Search using DuckDuckGo (Free, No API key)"""
         results = []
@@ -47,7 +182,7 @@ class SearchService:
             'num': num_results
         }
         
-        response = requests.post(url, json=payload, headers=headers)
+        response = get_http_session("search").post(url, json=payload, headers=headers, timeout=settings.SEARCH_TIMEOUT)
         response.raise_for_status()
         data = response.json()
         
@@ -63,16 +198,19 @@ class SearchService:
     
     def _search_serpapi(self, query: str, num_results: int) -> List[Dict]:
         """Search using SerpAPI"""
-        from serpapi import GoogleSearch
-        
         params = {
+            "engine": "google",
             "q": query,
             "num": num_results,
             "api_key": settings.SERPAPI_KEY
         }
         
-        search = GoogleSearch(params)
-        data = search.get_dict()
+        # The JSON endpoint GoogleSearch wraps, called on the pooled session
+        response = get_http_session("search").get(
+            "https://serpapi.com/search.json", params=params, timeout=settings.SEARCH_TIMEOUT
+        )
+        response.raise_for_status()
+        data = response.json()
         
         results = []
         for item in data.get('organic_results', []):
@@ -85,32 +223,9 @@ class SearchService:
         return results
     
     def fetch_url_content(self, url: str) -> Optional[str]:
-        """Fetch and extract text from URL"""
+        """Fetch and extract text from URL (size-capped, boilerplate stripped)"""
         try:
-            from bs4 import BeautifulSoup
-            
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.content, 'html.parser')
-            
-            # Remove script and style elements
-            for script in soup(["script", "style"]):
-                script.decompose()
-            
-            # Get text
-            text = soup.get_text()
-            
-            # Clean up
-            lines = (line.strip() for line in text.splitlines())
-            chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-            text = ' '.join(chunk for chunk in chunks if chunk)
-            
-            return text
+            return get_html_extractor().fetch_text(url)
         
         except Exception as e:
             print(f"Error fetching URL {url}: {e}")
@@ -0,0 +1,213 @@
+import hashlib
+import logging
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_BITS = 64
+_SHIFTS = np.arange(_BITS, dtype=np.uint64)
+
+
+def to_signed(fingerprint: int) -> int:
+    """Map an unsigned 64-bit fingerprint into a signed BIGINT column"""
+    return fingerprint - (1 << _BITS) if fingerprint >= (1 << (_BITS - 1)) else fingerprint
+
+
+def to_unsigned(value: int) -> int:
+    return value & ((1 << _BITS) - 1)
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def simhash(text: str, shingle_size: int = 1) -> int:
+    """64-bit SimHash over count-weighted lower-cased words (or word shingles)"""
+    words = text.lower().split()
+    if not words:
+        return 0
+    
+    size = min(shingle_size, len(words))
+    features = Counter(" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(f.encode(), digest_size=8).digest(), "little") for f in features),
+        dtype=np.uint64,
+        count=len(features)
+    )
+    weights = np.fromiter(features.values(), dtype=np.float64, count=len(features))
+    
+    bits = ((hashes[:, None] >> _SHIFTS) & np.uint64(1)).astype(np.float64)
+    totals = weights @ (2 * bits - 1)
+    return sum(1 << int(i) for i in np.flatnonzero(totals > 0))
+
+
+class SimHashIndex:
+    """
+    Multi-table permutation index for Hamming-distance lookups.
+    The fingerprint is cut into max_distance + 1 blocks; two fingerprints within
+    max_distance bits must agree exactly on at least one block (pigeonhole), so
+    each block is a hash table key and only those buckets are verified.
+    """
+    
+    def __init__(self, max_distance: Optional[int] = None):
+        self.max_distance = settings.SIMHASH_MAX_DISTANCE if max_distance is None else max_distance
+        blocks = self.max_distance + 1
+        width = _BITS // blocks
+        self._blocks = [
+            (i * width, _BITS - i * width if i == blocks - 1 else width)
+            for i in range(blocks)
+        ]
+        self._tables: List[Dict[int, Set[int]]] = [defaultdict(set) for _ in self._blocks]
+        self._fingerprints: Dict[int, int] = {}
+        self._lock = threading.RLock()
+    
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+    
+    def _keys(self, fingerprint: int) -> List[int]:
+        return [(fingerprint >> start) & ((1 << width) - 1) for start, width in self._blocks]
+    
+    def add(self, doc_id: int, fingerprint: int):
+        with self._lock:
+            self.remove(doc_id)
+            for table, key in zip(self._tables, self._keys(fingerprint)):
+                table[key].add(doc_id)
+            self._fingerprints[doc_id] = fingerprint
+    
+    def remove(self, doc_id: int):
+        with self._lock:
+            fingerprint = self._fingerprints.pop(doc_id, None)
+            if fingerprint is None:
+                return
+            for table, key in zip(self._tables, self._keys(fingerprint)):
+                bucket = table.get(key)
+                if bucket is not None:
+                    bucket.discard(doc_id)
+                    if not bucket:
+                        del table[key]
+    
+    def query(self, fingerprint: int, max_distance: Optional[int] = None) -> List[Tuple[int, int]]:
+        """(doc_id, distance) pairs within max_distance bits, nearest first"""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        with self._lock:
+            candidates = set()
+            for table, key in zip(self._tables, self._keys(fingerprint)):
+                candidates.update(table.get(key, ()))
+            results = [
+                (doc_id, hamming_distance(fingerprint, self._fingerprints[doc_id]))
+                for doc_id in candidates
+            ]
+        return sorted(
+            ((doc_id, distance) for doc_id, distance in results if distance <= max_distance),
+            key=lambda item: (item[1], item[0])
+        )
+
+
+class SimHashService:
+    """Document fingerprints and the process-wide near-duplicate index"""
+    
+    def __init__(self):
+        self.index = SimHashIndex()
+        self._loaded_max_id = 0
+        self._lock = threading.Lock()
+    
+    def fingerprint(self, text: str) -> int:
+        return simhash(text or "")
+    
+    def add(self, doc_id: int, fingerprint: int):
+        self.index.add(doc_id, fingerprint)
+    
+    def remove(self, doc_id: int):
+        self.index.remove(doc_id)
+    
+    def refresh(self):
+        """
+        Load fingerprints of documents ingested since the last refresh.
+        Runs on its own session, so backfilling never commits the caller's.
+        """
+        from app.database.session import SessionLocal
+        from app.models.document import Document
+        
+        with self._lock:
+            db = SessionLocal()
+            try:
+                rows = db.query(Document.id, Document.simhash).filter(
+                    Document.id > self._loaded_max_id
+                ).order_by(Document.id).all()
+                
+                missing = []
+                for doc_id, value in rows:
+                    if value is not None:
+                        self.index.add(doc_id, to_unsigned(value))
+                    else:
+                        missing.append(doc_id)
+                    self._loaded_max_id = max(self._loaded_max_id, doc_id)
+                
+                # Backfill documents ingested before fingerprints existed
+                for doc_id in missing:
+                    document = db.query(Document).filter(Document.id == doc_id).first()
+                    if document is None:
+                        continue
+                    fingerprint = self.fingerprint(document.content)
+                    document.simhash = to_signed(fingerprint)
+                    self.index.add(doc_id, fingerprint)
+                if missing:
+                    db.commit()
+                    logger.info(f"Computed SimHash fingerprints for {len(missing)} documents")
+            except Exception:
+                db.rollback()
+                raise
+            finally:
+                db.close()
+    
+    def find_near_duplicate(
+        self,
+        db,
+        fingerprint: int,
+        institution_id: Optional[int],
+        allow_cross_institution: bool = False,
+        exclude_id: Optional[int] = None
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Nearest existing document within SIMHASH_MAX_DISTANCE that the given
+        institution may see, as (document_id, distance)
+        """
+        from app.models.document import Document
+        from app.services.document_scope import visible_documents
+        
+        self.refresh()
+        matches = [(doc_id, d) for doc_id, d in self.index.query(fingerprint) if doc_id != exclude_id]
+        if not matches:
+            return None
+        
+        ids = [doc_id for doc_id, _ in matches]
+        # Other processes may have deleted documents this index still holds
+        existing = {row.id for row in db.query(Document.id).filter(Document.id.in_(ids)).all()}
+        visible = {
+            row.id for row in
+            visible_documents(db.query(Document.id), institution_id, allow_cross_institution).filter(
+                Document.id.in_(ids)
+            ).all()
+        }
+        for doc_id, distance in matches:
+            if doc_id not in existing:
+                self.index.remove(doc_id)
+            elif doc_id in visible:
+                return doc_id, distance
+        return None
+
+
+_service: Optional[SimHashService] = None
+
+
+def get_simhash_service() -> SimHashService:
+    """Return the process-wide SimHash service"""
+    global _service
+    
+    if _service is None:
+        _service = SimHashService()
+    return _service
\ No newline at end of file
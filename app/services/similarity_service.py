@@ -4,6 +4,7 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.metrics.pairwise import cosine_similarity
 from difflib import SequenceMatcher
 from app.core.config import settings
+from app.services.tokenized_document import TextLike, tokenize
 
 
 class SimilarityService:
@@ -12,45 +13,112 @@ class SimilarityService:
     def __init__(self):
         self.vectorizer = TfidfVectorizer()
     
-    def cosine_similarity_score(self, text1: str, text2: str) -> float:
+    def cosine_similarity_score(self, text1: TextLike, text2: TextLike) -> float:
         """Calculate cosine similarity using TF-IDF"""
         try:
-            tfidf_matrix = self.vectorizer.fit_transform([text1, text2])
+            tfidf_matrix = self.vectorizer.fit_transform([str(text1), str(text2)])
             similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:2])[0][0]
             return float(similarity * 100)  # Convert to percentage
         except Exception as e:
             print(f"Error in cosine similarity: {e}")
             return 0.0
     
-    def jaccard_similarity(self, text1: str, text2: str) -> float:
+    def cosine_similarity_from_counts(
+        self,
+        counts1: Tuple[np.ndarray, np.ndarray],
+        counts2: Tuple[np.ndarray, np.ndarray]
+    ) -> float:
+        """
+        Same score as cosine_similarity_score, from precomputed (term ids, counts).
+        Fitting TF-IDF on just two texts gives shared terms idf 1 and the rest
+        idf 1 + ln(3/2), so no vectorizer (or re-tokenization) is needed.
+        """
+        terms1, tf1 = counts1
+        terms2, tf2 = counts2
+        if len(terms1) == 0 or len(terms2) == 0:
+            return 0.0
+        
+        _, idx1, idx2 = np.intersect1d(terms1, terms2, assume_unique=True, return_indices=True)
+        unique_idf = 1.0 + np.log(1.5)
+        
+        idf1 = np.full(len(terms1), unique_idf)
+        idf1[idx1] = 1.0
+        idf2 = np.full(len(terms2), unique_idf)
+        idf2[idx2] = 1.0
+        
+        norm1 = np.linalg.norm(tf1 * idf1)
+        norm2 = np.linalg.norm(tf2 * idf2)
+        dot = float(np.dot(tf1[idx1].astype(np.float64), tf2[idx2]))
+        return float(dot / (norm1 * norm2) * 100)
+    
+    def pairwise_cosine_matrix(self, counts1, counts2) -> np.ndarray:
+        """
+        cosine_similarity_score for every (row of counts1, row of counts2) pair,
+        from sparse term-count matrices over one vocabulary, in a few sparse
+        products. With the per-pair idf (1 for shared terms, k = 1 + ln(3/2)
+        otherwise) the squared norm of a row is k^2 * sum(tf^2) minus
+        (k^2 - 1) * the sum of tf^2 over terms the other row also has.
+        """
+        k2 = (1.0 + np.log(1.5)) ** 2
+        squared1 = counts1.multiply(counts1)
+        squared2 = counts2.multiply(counts2)
+        present1 = (counts1 > 0).astype(np.float64)
+        present2 = (counts2 > 0).astype(np.float64)
+        
+        dot = (counts1 @ counts2.T).toarray()
+        shared1 = (squared1 @ present2.T).toarray()
+        shared2 = (present1 @ squared2.T).toarray()
+        norm1 = k2 * np.asarray(squared1.sum(axis=1)) - (k2 - 1) * shared1
+        norm2 = k2 * np.asarray(squared2.sum(axis=1)).T - (k2 - 1) * shared2
+        
+        denominator = np.sqrt(norm1 * norm2)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores = np.where(denominator > 0, dot / denominator, 0.0)
+        return scores * 100
+    
+    def jaccard_similarity(self, text1: TextLike, text2: TextLike) -> float:
         """Calculate Jaccard similarity"""
-        words1 = set(text1.lower().split())
-        words2 = set(text2.lower().split())
+        words1 = np.unique(tokenize(text1).ids)
+        words2 = np.unique(tokenize(text2).ids)
+        
+        intersection = len(np.intersect1d(words1, words2, assume_unique=True))
+        union = len(words1) + len(words2) - intersection
         
-        intersection = words1.intersection(words2)
-        union = words1.union(words2)
+        if union == 0:
+            return 0.0
+        
+        return (intersection / union) * 100
+    
+    def ngram_overlap(self, text1: TextLike, text2: TextLike, n: int = 3) -> float:
+        """Share of the shorter text's word n-grams that also occur in the other text"""
+        ids1 = tokenize(text1).ids.tolist()
+        ids2 = tokenize(text2).ids.tolist()
+        grams1 = {tuple(ids1[i:i + n]) for i in range(len(ids1) - n + 1)}
+        grams2 = {tuple(ids2[i:i + n]) for i in range(len(ids2) - n + 1)}
         
-        if len(union) == 0:
+        if not grams1 or not grams2:
             return 0.0
         
-        return (len(intersection) / len(union)) * 100
+        return len(grams1 & grams2) / min(len(grams1), len(grams2)) * 100
     
-    def levenshtein_similarity(self, text1: str, text2: str) -> float:
+    def levenshtein_similarity(self, text1: TextLike, text2: TextLike) -> float:
         """Calculate similarity using Levenshtein distance"""
-        ratio = SequenceMatcher(None, text1, text2).ratio()
+        ratio = SequenceMatcher(None, str(text1), str(text2)).ratio()
         return ratio * 100
     
-    def longest_common_subsequence(self, text1: str, text2: str) -> Tuple[float, str]:
+    def longest_common_subsequence(self, text1: TextLike, text2: TextLike) -> Tuple[float, str]:
         """Find longest common subsequence"""
-        words1 = text1.split()
-        words2 = text2.split()
+        tokens1 = tokenize(text1)
+        # Case-insensitive word comparison on hashed word ids
+        ids1 = tokens1.ids.tolist()
+        ids2 = tokenize(text2).ids.tolist()
         
-        m, n = len(words1), len(words2)
+        m, n = len(ids1), len(ids2)
         dp = [[0] * (n + 1) for _ in range(m + 1)]
         
         for i in range(1, m + 1):
             for j in range(1, n + 1):
-                if words1[i-1].lower() == words2[j-1].lower():
+                if ids1[i-1] == ids2[j-1]:
                     dp[i][j] = dp[i-1][j-1] + 1
                 else:
                     dp[i][j] = max(dp[i-1][j], dp[i][j-1])
@@ -59,10 +127,11 @@ class SimilarityService:
         similarity = (lcs_length / max(m, n)) * 100 if max(m, n) > 0 else 0
         
         # Reconstruct LCS
+        words1 = tokens1.words()
         lcs_words = []
         i, j = m, n
         while i > 0 and j > 0:
-            if words1[i-1].lower() == words2[j-1].lower():
+            if ids1[i-1] == ids2[j-1]:
                 lcs_words.append(words1[i-1])
                 i -= 1
                 j -= 1
@@ -74,7 +143,7 @@ class SimilarityService:
         lcs_text = ' '.join(reversed(lcs_words))
         return similarity, lcs_text
     
-    def calculate_combined_similarity(self, text1: str, text2: str) -> float:
+    def calculate_combined_similarity(self, text1: TextLike, text2: TextLike) -> float:
         """Calculate weighted average of multiple similarity metrics"""
         cosine = self.cosine_similarity_score(text1, text2)
         jaccard = self.jaccard_similarity(text1, text2)
@@ -86,21 +155,21 @@ class SimilarityService:
     
     def find_matching_segments(
         self, 
-        text1: str, 
-        text2: str, 
+        text1: TextLike, 
+        text2: TextLike, 
         min_length: int = 10
     ) -> List[Tuple[str, float, int, int]]:
         """Find all matching segments between two texts"""
-        words1 = text1.split()
-        words2 = text2.split()
+        tokens1 = tokenize(text1)
+        tokens2 = tokenize(text2)
         matches = []
         
-        for i in range(len(words1) - min_length + 1):
-            for j in range(len(words2) - min_length + 1):
+        for i in range(len(tokens1) - min_length + 1):
+            for j in range(len(tokens2) - min_length + 1):
                 # Try different segment lengths
-                for length in range(min_length, min(len(words1) - i, len(words2) - j) + 1):
-                    segment1 = ' '.join(words1[i:i+length])
-                    segment2 = ' '.join(words2[j:j+length])
+                for length in range(min_length, min(len(tokens1) - i, len(tokens2) - j) + 1):
+                    segment1 = tokens1[i:i+length].text
+                    segment2 = tokens2[j:j+length].text
                     
                     similarity = self.levenshtein_similarity(segment1, segment2)
                     
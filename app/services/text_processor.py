@@ -4,6 +4,8 @@ from typing import List, Tuple
 import nltk
 from nltk.corpus import stopwords
 from nltk.tokenize import word_tokenize, sent_tokenize
+from app.services.tokenized_document import TextLike, TokenizedDocument, tokenize
+from app.services.chunker import TextChunk, iter_chunks
 
 # Download NLTK data (run once)
 try:
@@ -39,25 +41,17 @@ class TextProcessor:
         text = re.sub(r'\[\d+\]', '', text)
         return text
     
-    def chunk_text(self, text: str, chunk_size: int = 100, overlap: int = 20) -> List[str]:
-        """Split text into overlapping chunks"""
-        words = text.split()
-        chunks = []
-        
-        for i in range(0, len(words), chunk_size - overlap):
-            chunk = ' '.join(words[i:i + chunk_size])
-            if len(chunk.split()) >= 10:  # Minimum chunk size
-                chunks.append(chunk)
-        
-        return chunks
+    def chunk_text(self, text: TextLike, chunk_size: int = 100, overlap: int = 20) -> List[TextChunk]:
+        """Split text into overlapping, sentence-aligned chunks (strings carrying their offsets)"""
+        return list(iter_chunks(text, chunk_size, overlap))
     
     def extract_sentences(self, text: str) -> List[str]:
         """Extract sentences from text"""
         return sent_tokenize(text)
     
-    def extract_keywords(self, text: str, top_n: int = 20) -> List[str]:
+    def extract_keywords(self, text: TextLike, top_n: int = 20) -> List[str]:
         """Extract important keywords (non-stop words)"""
-        words = word_tokenize(text.lower())
+        words = word_tokenize(str(text).lower())
         keywords = [w for w in words if w.isalnum() and w not in self.stop_words]
         
         # Count frequency
@@ -72,14 +66,12 @@ class TextProcessor:
         # Create hash
         return hashlib.sha256(normalized.encode()).hexdigest()
     
-    def calculate_word_count(self, text: str) -> int:
+    def calculate_word_count(self, text: TextLike) -> int:
         """Calculate word count"""
+        if isinstance(text, TokenizedDocument):
+            return len(text)
         return len(text.split())
     
-    def create_ngrams(self, text: str, n: int = 3) -> List[str]:
+    def create_ngrams(self, text: TextLike, n: int = 3) -> List[str]:
         """Create n-grams from text"""
-        words = text.split()
-        ngrams = []
-        for i in range(len(words) - n + 1):
-            ngrams.append(' '.join(words[i:i+n]))
-        return ngrams
\ No newline at end of file
+        return [ngram.text for ngram in tokenize(text).ngrams(n)]
\ No newline at end of file
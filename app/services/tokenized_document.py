@@ -0,0 +1,108 @@
+"""
+Array-backed tokenized text.
+
+A TokenizedDocument is built in one regex pass and holds the source string,
+the character offsets of every whitespace-delimited word and the word ids
+(crc32 of the lower-cased word). Chunks, windows and n-grams are slices
+that share those arrays, so the pipeline stops re-splitting, re-joining
+and re-lowering the same text at every stage.
+"""
+import re
+import zlib
+from typing import Iterator, List, Union
+import numpy as np
+
+_WORD_PATTERN = re.compile(r"\S+")
+# Whitespace other than a plain space
+_OTHER_WHITESPACE = re.compile(r"[^\S ]")
+
+
+def word_ids(words: List[str]) -> np.ndarray:
+    """
+    Ids of lower-cased words: their crc32, as in analysis_store.token_hashes.
+    Hashing needs no shared table, so nothing grows with the words a process
+    has seen and ids agree across processes.
+    """
+    return np.fromiter((zlib.crc32(word.encode()) for word in words), dtype=np.uint32, count=len(words))
+
+
+class TokenizedDocument:
+    """A run of words over a shared source string; slicing never copies"""
+    
+    __slots__ = ("source", "ids", "starts", "ends", "_normalized")
+    
+    def __init__(
+        self,
+        source: str,
+        ids: np.ndarray,
+        starts: np.ndarray,
+        ends: np.ndarray,
+        normalized: bool
+    ):
+        self.source = source
+        self.ids = ids
+        self.starts = starts
+        self.ends = ends
+        # Words are separated by exactly one space, so any slice's text is a substring
+        self._normalized = normalized
+    
+    @classmethod
+    def from_text(cls, text: str) -> "TokenizedDocument":
+        text = text or ""
+        spans = [match.span() for match in _WORD_PATTERN.finditer(text)]
+        offsets = np.array(spans, dtype=np.int32).reshape(-1, 2)
+        starts, ends = offsets[:, 0], offsets[:, 1]
+        ids = word_ids([text[start:end].lower() for start, end in spans])
+        
+        normalized = not _OTHER_WHITESPACE.search(text) and bool(np.all(starts[1:] - ends[:-1] == 1))
+        return cls(text, ids, starts, ends, normalized)
+    
+    def __len__(self) -> int:
+        return len(self.ids)
+    
+    def __getitem__(self, key) -> "TokenizedDocument":
+        if not isinstance(key, slice):
+            key = slice(key, key + 1 if key != -1 else None)
+        return TokenizedDocument(
+            self.source, self.ids[key], self.starts[key], self.ends[key], self._normalized
+        )
+    
+    def __str__(self) -> str:
+        return self.text
+    
+    @property
+    def text(self) -> str:
+        """The words joined by single spaces (what ' '.join(text.split()) gives)"""
+        if len(self.ids) == 0:
+            return ""
+        if self._normalized:
+            return self.source[self.starts[0]:self.ends[-1]]
+        return " ".join(self.words())
+    
+    def words(self) -> List[str]:
+        source = self.source
+        return [source[start:end] for start, end in zip(self.starts.tolist(), self.ends.tolist())]
+    
+    def windows(self, size: int, step: int, min_words: int = 1) -> Iterator["TokenizedDocument"]:
+        """Slices of up to size words every step words (shorter than min_words skipped)"""
+        for start in range(0, len(self.ids), step):
+            window = self[start:start + size]
+            if len(window) >= min_words:
+                yield window
+    
+    def ngrams(self, n: int) -> List["TokenizedDocument"]:
+        return [self[i:i + n] for i in range(len(self.ids) - n + 1)]
+    
+    def term_counts(self):
+        """Sorted unique word ids and their counts"""
+        return np.unique(self.ids, return_counts=True)
+
+
+TextLike = Union[str, TokenizedDocument]
+
+
+def tokenize(text: TextLike) -> TokenizedDocument:
+    """TokenizedDocument for text (returned as is if already tokenized)"""
+    if isinstance(text, TokenizedDocument):
+        return text
+    return TokenizedDocument.from_text(text)
\ No newline at end of file
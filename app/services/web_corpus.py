@@ -0,0 +1,173 @@
+"""
+Local corpus of previously fetched web pages.
+
+Pages fetched during checks are stored (text, URL/title, per-chunk MinHash
+signatures) and indexed in a process-wide LSH index, so later checks can find
+common sources locally before spending search-API quota. Retention is bounded
+by page count and by time since a page last produced a match; prune() runs
+from a periodic Celery beat task, not from checks.
+
+Writes use a session of their own, so storing a page never commits or rolls
+back the check task's session.
+"""
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set
+from sqlalchemy.exc import IntegrityError
+from app.core.config import settings
+from app.database.session import SessionLocal
+from app.models.web_source import WebSource
+from app.services.chunker import iter_chunks
+from app.services.minhash_service import LSHIndex, get_minhash_service
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def _own_session():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+class WebCorpusService:
+    """Stores fetched pages and finds candidate pages for query chunks"""
+    
+    def __init__(self):
+        self.hasher = get_minhash_service().hasher
+        self.index = LSHIndex()
+        self._loaded_max_id = 0
+        self._lock = threading.Lock()
+    
+    def refresh(self, db):
+        """Load signatures of pages stored (by any process) since the last refresh"""
+        with self._lock:
+            rows = db.query(WebSource.id, WebSource.minhash_signatures).filter(
+                WebSource.id > self._loaded_max_id
+            ).order_by(WebSource.id).yield_per(500)
+            for source_id, data in rows:
+                if data:
+                    self.index.add(source_id, self.hasher.from_bytes(data))
+                self._loaded_max_id = max(self._loaded_max_id, source_id)
+    
+    def candidates(self, db, chunks: List[str]) -> List[Set[int]]:
+        """Per-chunk candidate page ids"""
+        self.refresh(db)
+        signatures = self.hasher.chunk_signatures(chunks)
+        return [
+            set(hits) if chunk.strip() else set()
+            for chunk, hits in zip(chunks, self.index.query_many(signatures, settings.LSH_MIN_BAND_HITS))
+        ]
+    
+    def load(self, db, source_ids: Iterable[int]) -> List[WebSource]:
+        """Stored pages by id (pages pruned by another process are dropped from the index)"""
+        source_ids = set(source_ids)
+        if not source_ids:
+            return []
+        sources = db.query(WebSource).filter(WebSource.id.in_(source_ids)).all()
+        for missing in source_ids - {source.id for source in sources}:
+            self.index.remove(missing)
+        return sources
+    
+    def fresh_by_url(self, db, urls: Iterable[str]) -> Dict[str, WebSource]:
+        """Stored pages for these URLs that are recent enough to use instead of re-fetching"""
+        urls = list(urls)
+        if not urls:
+            return {}
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.WEB_CORPUS_REFETCH_DAYS)
+        sources = db.query(WebSource).filter(WebSource.url.in_(urls)).all()
+        return {
+            source.url: source for source in sources
+            if source.fetched_at is None or self._aware(source.fetched_at) >= cutoff
+        }
+    
+    def ingest(self, url: str, title: str, content: str) -> Optional[int]:
+        """Store (or refresh) a fetched page, returning its id"""
+        content = (content or "")[:settings.WEB_CORPUS_MAX_PAGE_CHARS]
+        chunks = list(iter_chunks(content, settings.CHUNK_SIZE, settings.OVERLAP))
+        if not chunks:
+            return None
+        signatures = self.hasher.chunk_signatures(chunks)
+        
+        with _own_session() as db:
+            source = db.query(WebSource).filter(WebSource.url == url).first()
+            if source is None:
+                source = WebSource(url=url, hit_count=0)
+                db.add(source)
+            source.title = title
+            source.content = content
+            source.content_hash = hashlib.sha256(content.encode()).hexdigest()
+            source.word_count = len(content.split())
+            source.minhash_signatures = self.hasher.to_bytes(signatures)
+            source.fetched_at = datetime.now(timezone.utc)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another check stored the same URL first
+                db.rollback()
+                return None
+            source_id = source.id
+        self.index.add(source_id, signatures)
+        return source_id
+    
+    def record_hits(self, source_ids: Iterable[int]):
+        """Mark pages as useful so retention keeps them"""
+        source_ids = list(set(source_ids))
+        if not source_ids:
+            return
+        with _own_session() as db:
+            db.query(WebSource).filter(WebSource.id.in_(source_ids)).update(
+                {
+                    WebSource.hit_count: WebSource.hit_count + 1,
+                    WebSource.last_hit_at: datetime.now(timezone.utc)
+                },
+                synchronize_session=False
+            )
+            db.commit()
+    
+    def prune(self) -> int:
+        """Apply retention: drop pages unused for WEB_CORPUS_MAX_AGE_DAYS, then the least recently used beyond WEB_CORPUS_MAX_PAGES"""
+        cutoff = datetime.now(timezone.utc) - timedelta(days=settings.WEB_CORPUS_MAX_AGE_DAYS)
+        with _own_session() as db:
+            expired = [
+                row.id for row in
+                db.query(WebSource.id).filter(WebSource.last_hit_at < cutoff).all()
+            ]
+            excess = db.query(WebSource).count() - len(expired) - settings.WEB_CORPUS_MAX_PAGES
+            if excess > 0:
+                expired += [
+                    row.id for row in
+                    db.query(WebSource.id).filter(WebSource.last_hit_at >= cutoff)
+                    .order_by(WebSource.last_hit_at, WebSource.id).limit(excess).all()
+                ]
+            if not expired:
+                return 0
+            
+            db.query(WebSource).filter(WebSource.id.in_(expired)).delete(synchronize_session=False)
+            db.commit()
+        for source_id in expired:
+            self.index.remove(source_id)
+        logger.info(f"Pruned {len(expired)} pages from the web corpus")
+        return len(expired)
+    
+    @staticmethod
+    def _aware(value: datetime) -> datetime:
+        # SQLite hands back naive datetimes
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+_service: Optional[WebCorpusService] = None
+
+
+def get_web_corpus_service() -> WebCorpusService:
+    """Return the process-wide web corpus service"""
+    global _service
+    
+    if _service is None:
+        _service = WebCorpusService()
+    return _service
\ No newline at end of file
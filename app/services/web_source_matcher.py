@@ -0,0 +1,152 @@
+"""
+Whole-page comparison of query chunks with fetched web sources.
+
+Each fetched page is tokenized once (TF-IDF tokens with their character
+spans) and cut into overlapping windows of WEB_WINDOW_WORDS tokens. Every
+query chunk is then scored against every window of every page in one sparse
+matrix pass. Promising (chunk, page) pairs are then refined by rescoring
+every chunk-length window around the best coarse window, so neither the
+window grid nor a chunk shorter than a window hides a verbatim copy. The best
+window per (chunk, page) is reported; copying from anywhere on a page is
+found, not just from its first paragraph.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from scipy import sparse
+from app.core.config import settings
+from app.services.similarity_service import SimilarityService
+
+# Same tokens as the TF-IDF scorer
+_TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+# Coarse scores this far below the threshold are still refined
+_REFINE_MARGIN = 30.0
+
+
+class WebPage:
+    """A fetched page as token ids, token character spans and window offsets"""
+    
+    def __init__(self, url: str, title: str, text: str, ids: np.ndarray, spans: np.ndarray, windows: np.ndarray):
+        self.url = url
+        self.title = title
+        self.text = text
+        self.ids = ids
+        self.spans = spans
+        self.windows = windows
+    
+    def window_text(self, window: int) -> str:
+        start, end = self.windows[window]
+        return self.span_text(start, end)
+    
+    def span_text(self, start: int, end: int) -> str:
+        """Page text covering tokens [start, end)"""
+        return self.text[self.spans[start, 0]:self.spans[end - 1, 1]]
+
+
+class WebSourceMatcher:
+    """Scores query chunks against all windows of the pages fetched for one check"""
+    
+    def __init__(self, similarity_service: Optional[SimilarityService] = None):
+        self.similarity_service = similarity_service or SimilarityService()
+        self.vocabulary: Dict[str, int] = {}
+        self.pages: List[WebPage] = []
+    
+    def _term_ids(self, text: str, max_tokens: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Token ids (in this matcher's vocabulary) and character spans of text"""
+        vocabulary = self.vocabulary
+        ids, spans = [], []
+        for match in _TOKEN_PATTERN.finditer(text):
+            term = match.group().lower()
+            term_id = vocabulary.get(term)
+            if term_id is None:
+                term_id = vocabulary[term] = len(vocabulary)
+            ids.append(term_id)
+            spans.append(match.span())
+            if max_tokens and len(ids) >= max_tokens:
+                break
+        return np.array(ids, dtype=np.int64), np.array(spans, dtype=np.int64).reshape(-1, 2)
+    
+    def add_page(self, url: str, title: str, text: str) -> Optional[WebPage]:
+        """Tokenize and window a page (None if it has no text)"""
+        ids, spans = self._term_ids(text, max_tokens=settings.WEB_MAX_PAGE_WORDS)
+        if len(ids) == 0:
+            return None
+        
+        size, step = settings.WEB_WINDOW_WORDS, max(settings.WEB_WINDOW_STEP, 1)
+        starts = np.arange(0, max(len(ids) - size, 0) + 1, step)
+        # Make sure the tail of the page is covered too
+        if starts[-1] + size < len(ids):
+            starts = np.append(starts, len(ids) - size)
+        windows = np.stack([starts, np.minimum(starts + size, len(ids))], axis=1)
+        
+        page = WebPage(url, title, text, ids, spans, windows)
+        self.pages.append(page)
+        return page
+    
+    def _count_rows(self, rows: List[np.ndarray]) -> sparse.csr_matrix:
+        """Term count matrix with one row per id sequence"""
+        indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(row) for row in rows])
+        indices = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(indices)), indices, indptr),
+            shape=(len(rows), len(self.vocabulary))
+        )
+        matrix.sum_duplicates()
+        return matrix
+    
+    def best_matches(
+        self,
+        chunks: List[str],
+        threshold: float
+    ) -> List[Tuple[str, WebPage, float, str]]:
+        """(chunk, page, similarity, best window text) for every chunk/page pair at or above threshold"""
+        if not chunks or not self.pages:
+            return []
+        
+        chunk_rows = [self._term_ids(chunk)[0] for chunk in chunks]
+        window_rows, owners = [], []
+        for page in self.pages:
+            for start, end in page.windows:
+                window_rows.append(page.ids[start:end])
+            owners.append(len(page.windows))
+        
+        scores = self.similarity_service.pairwise_cosine_matrix(
+            self._count_rows(chunk_rows),
+            self._count_rows(window_rows)
+        )
+        
+        matches = []
+        bounds = np.concatenate([[0], np.cumsum(owners)])
+        for page_index, page in enumerate(self.pages):
+            page_scores = scores[:, bounds[page_index]:bounds[page_index + 1]]
+            best_windows = page_scores.argmax(axis=1)
+            for chunk_index, window in enumerate(best_windows):
+                similarity = float(page_scores[chunk_index, window])
+                if similarity < threshold - _REFINE_MARGIN:
+                    continue
+                start, end = page.windows[window]
+                if similarity < 100.0:
+                    refined, span = self._refine(chunk_rows[chunk_index], page, int(start))
+                    if refined > similarity:
+                        similarity, (start, end) = refined, span
+                if similarity >= threshold:
+                    matches.append((chunks[chunk_index], page, similarity, page.span_text(start, end)))
+        return matches
+    
+    def _refine(self, chunk_ids: np.ndarray, page: WebPage, around: int) -> Tuple[float, Tuple[int, int]]:
+        """Best chunk-length window starting within one window size of `around`"""
+        length = min(max(len(chunk_ids), 1), len(page.ids))
+        first = max(around - settings.WEB_WINDOW_WORDS, 0)
+        last = min(around + settings.WEB_WINDOW_WORDS, len(page.ids) - length)
+        starts = np.arange(first, last + 1)
+        if len(starts) == 0:
+            return 0.0, (around, around + length)
+        
+        scores = self.similarity_service.pairwise_cosine_matrix(
+            self._count_rows([chunk_ids]),
+            self._count_rows([page.ids[start:start + length] for start in starts])
+        )[0]
+        best = int(scores.argmax())
+        return float(scores[best]), (int(starts[best]), int(starts[best]) + length)
\ No newline at end of file
@@ -1,5 +1,7 @@
 from celery import Celery
+from celery.signals import task_postrun, worker_process_shutdown
 from app.core.config import settings
+from app.services.metrics import metrics
 
 celery_app = Celery(
     "plagiarism_checker",
@@ -18,4 +20,28 @@ celery_app.conf.update(
     task_track_started=True,
     task_time_limit=300,  # 5 minutes
     task_soft_time_limit=240,  # 4 minutes
-)
\ No newline at end of file
+    beat_schedule={
+        # Web corpus retention runs here rather than inside checks
+        'prune-web-corpus': {
+            'task': 'app.tasks.plagiarism_tasks.prune_web_corpus_task',
+            'schedule': settings.WEB_CORPUS_PRUNE_INTERVAL_SECONDS,
+        },
+        # IVF training is too slow for the upload path
+        'train-vector-indexes': {
+            'task': 'app.tasks.plagiarism_tasks.train_vector_indexes_task',
+            'schedule': settings.LOCAL_VECTOR_TRAIN_INTERVAL_SECONDS,
+        },
+    },
+)
+
+
+@task_postrun.connect
+def publish_task_metrics(**kwargs):
+    # Push what the task recorded (ai.* tokens/cost, check latencies) right away
+    metrics.publish()
+
+
+@worker_process_shutdown.connect
+def publish_metrics_on_shutdown(**kwargs):
+    # A recycled child would otherwise lose what it recorded since its last push
+    metrics.publish()
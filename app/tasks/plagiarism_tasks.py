@@ -1,6 +1,8 @@
 from celery import Task
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from datetime import datetime
+from typing import Dict, List, Optional
 import time
 from app.tasks.celery_app import celery_app
 from app.database.session import SessionLocal
@@ -11,6 +13,10 @@ from app.models.report import Report
 from app.services.plagiarism_detector import PlagiarismDetector
 from app.services.report_generator import ReportGenerator
 from app.services.cache_service import cache_service
+from app.services.metrics import metrics
+from app.services.web_corpus import get_web_corpus_service
+from app.services.document_scope import allows_cross_institution
+from app.core.config import settings
 
 
 class DatabaseTask(Task):
@@ -28,13 +34,110 @@ class DatabaseTask(Task):
             self._db.close()
 
 
+def write_report(db: Session, submission: Submission, document: Document) -> Report:
+    """Create or refresh the submission's report from its saved matches"""
+    report_generator = ReportGenerator()
+    
+    # Get all matches
+    matches = db.query(Match).filter(Match.submission_id == submission.id).all()
+    
+    # Generate HTML report
+    html_content = report_generator.generate_html_report(
+        submission=submission,
+        matches=matches,
+        document_content=document.content
+    )
+    
+    # Generate JSON report
+    json_data = report_generator.generate_json_report(
+        submission=submission,
+        matches=matches
+    )
+    
+    # Save report
+    report = db.query(Report).filter(Report.submission_id == submission.id).first()
+    if report is None:
+        report = Report(submission_id=submission.id)
+        db.add(report)
+    report.html_content = html_content
+    report.json_data = json_data
+    report.summary = f"Originality Score: {submission.originality_score:.1f}%"
+    
+    db.commit()
+    return report
+
+
+def complete_submission(
+    db: Session,
+    submission: Submission,
+    document: Document,
+    originality_score: float,
+    matches_data: List[Dict],
+    processing_time: float,
+    corpus_epoch: Optional[str] = None
+) -> Submission:
+    """Save matches, mark the submission completed, build its report and cache the result"""
+    
+    # Count matches by type
+    web_matches = sum(1 for m in matches_data if m['source_type'].value == 'web')
+    db_matches = sum(1 for m in matches_data if m['source_type'].value == 'database')
+    
+    # Save matches
+    for match_data in matches_data:
+        match = Match(
+            submission_id=submission.id,
+            match_type=match_data['match_type'],
+            source_type=match_data['source_type'],
+            matched_text=match_data['matched_text'],
+            source_text=match_data['source_text'],
+            similarity_score=match_data['similarity_score'],
+            source_url=match_data.get('source_url'),
+            source_title=match_data.get('source_title'),
+            source_document_id=match_data.get('source_document_id'),
+            start_position=match_data['start_position'],
+            end_position=match_data['end_position']
+        )
+        db.add(match)
+    
+    # Update submission
+    submission.status = SubmissionStatus.COMPLETED
+    submission.originality_score = originality_score
+    submission.plagiarism_percentage = 100 - originality_score
+    submission.total_matches = len(matches_data)
+    submission.web_matches = web_matches
+    submission.database_matches = db_matches
+    submission.processing_time = processing_time
+    submission.completed_at = datetime.utcnow()
+    
+    db.commit()
+    db.refresh(submission)
+    
+    write_report(db, submission, document)
+    
+    # Cache result (keyed by the corpus epoch the check started at)
+    cache_service.cache_document_check(
+        content_hash=document.content_hash,
+        result={
+            'submission_id': submission.id,
+            'originality_score': originality_score,
+            'plagiarism_percentage': 100 - originality_score
+        },
+        check_settings=submission.check_settings or {},
+        institution_id=document.institution_id,
+        corpus_epoch=corpus_epoch
+    )
+    
+    return submission
+
+
 @celery_app.task(base=DatabaseTask, bind=True)
 def check_plagiarism_task(
     self,
     submission_id: int,
     check_web: bool = True,
     check_database: bool = True,
-    check_institution: bool = True
+    check_institution: bool = True,
+    check_reference: bool = True
 ):
     """Background task for plagiarism checking"""
     
@@ -59,24 +162,121 @@ def check_plagiarism_task(
             db.commit()
             return {"error": "Document not found"}
         
+        # Read before the check runs: a document added meanwhile must invalidate this result
+        corpus_epoch = cache_service.get_corpus_epoch(
+            document.institution_id,
+            allows_cross_institution(document.institution)
+        )
+        
         # Initialize detector
         detector = PlagiarismDetector(db)
         
-        # Perform plagiarism check
-        originality_score, matches_data = detector.check_plagiarism(
+        # Near-duplicates of an already checked document reuse its result
+        result = detector.reuse_near_duplicate(
             document=document,
             check_web=check_web,
             check_database=check_database,
-            check_institution=check_institution
+            check_institution=check_institution,
+            check_reference=check_reference
         )
         
-        # Count matches by type
-        web_matches = sum(1 for m in matches_data if m['source_type'].value == 'web')
-        db_matches = sum(1 for m in matches_data if m['source_type'].value == 'database')
+        # Perform plagiarism check
+        path = "near_duplicate"
+        if result is None:
+            path = "full"
+            result = detector.check_plagiarism(
+                document=document,
+                check_web=check_web,
+                check_database=check_database,
+                check_institution=check_institution,
+                check_reference=check_reference
+            )
+        originality_score, matches_data = result
+        submission.corpus_high_water_mark = detector.high_water_mark
+        
+        complete_submission(
+            db,
+            submission,
+            document,
+            originality_score,
+            matches_data,
+            processing_time=time.time() - start_time,
+            corpus_epoch=corpus_epoch
+        )
+        metrics.increment(f"check.{path}.count")
+        metrics.observe(f"check.{path}.latency_ms", (time.time() - start_time) * 1000)
+        
+        return {
+            "submission_id": submission.id,
+            "status": "completed",
+            "originality_score": originality_score,
+            "total_matches": len(matches_data)
+        }
+    
+    except Exception as e:
+        # Handle errors
+        submission = db.query(Submission).filter(Submission.id == submission_id).first()
+        if submission:
+            submission.status = SubmissionStatus.FAILED
+            submission.error_message = str(e)
+            submission.processing_time = time.time() - start_time
+            db.commit()
+        
+        return {"error": str(e)}
+
+
+@celery_app.task(base=DatabaseTask, bind=True)
+def recheck_submission_task(self, submission_id: int):
+    """
+    Re-check a completed submission against documents ingested since it was
+    checked, merging any new matches into the existing result
+    """
+    
+    db: Session = self.db
+    start_time = time.time()
+    
+    try:
+        submission = db.query(Submission).filter(Submission.id == submission_id).first()
+        if not submission or submission.status != SubmissionStatus.COMPLETED:
+            return {"error": "Submission not found or not completed"}
+        
+        document = db.query(Document).filter(Document.id == submission.document_id).first()
+        if not document:
+            return {"error": "Document not found"}
+        
+        check_settings = submission.check_settings or {}
+        after_document_id = submission.corpus_high_water_mark or 0
         
-        # Save matches
-        for match_data in matches_data:
-            match = Match(
+        detector = PlagiarismDetector(db)
+        new_matches = detector.check_delta(
+            document=document,
+            after_document_id=after_document_id,
+            check_database=check_settings.get('check_database', True),
+            check_institution=check_settings.get('check_institution', True)
+        )
+        
+        # Documents ingested while the original check ran may already be matched
+        existing = [
+            {
+                'source_type': match.source_type,
+                'source_document_id': match.source_document_id,
+                'start_position': match.start_position,
+                'end_position': match.end_position
+            }
+            for match in submission.matches
+        ]
+        seen = {
+            (m['source_document_id'], m['start_position'], m['end_position'])
+            for m in existing if m['source_document_id']
+        }
+        added = []
+        for match_data in new_matches:
+            key = (match_data.get('source_document_id'), match_data['start_position'], match_data['end_position'])
+            if key in seen:
+                continue
+            seen.add(key)
+            added.append(match_data)
+            db.add(Match(
                 submission_id=submission.id,
                 match_type=match_data['match_type'],
                 source_type=match_data['source_type'],
@@ -88,76 +288,80 @@ def check_plagiarism_task(
                 source_document_id=match_data.get('source_document_id'),
                 start_position=match_data['start_position'],
                 end_position=match_data['end_position']
+            ))
+        
+        if added:
+            all_matches = existing + added
+            originality_score = detector._calculate_originality_score(document.content, all_matches)
+            submission.originality_score = originality_score
+            submission.plagiarism_percentage = 100 - originality_score
+            submission.total_matches = len(all_matches)
+            submission.database_matches = sum(
+                1 for m in all_matches if m['source_type'].value == 'database'
             )
-            db.add(match)
-        
-        # Update submission
-        submission.status = SubmissionStatus.COMPLETED
-        submission.originality_score = originality_score
-        submission.plagiarism_percentage = 100 - originality_score
-        submission.total_matches = len(matches_data)
-        submission.web_matches = web_matches
-        submission.database_matches = db_matches
-        submission.processing_time = time.time() - start_time
+        submission.corpus_high_water_mark = detector.high_water_mark
         submission.completed_at = datetime.utcnow()
-        
         db.commit()
-        db.refresh(submission)
-        
-        # Generate report
-        report_generator = ReportGenerator()
         
-        # Get all matches
-        matches = db.query(Match).filter(Match.submission_id == submission.id).all()
+        if added:
+            write_report(db, submission, document)
         
-        # Generate HTML report
-        html_content = report_generator.generate_html_report(
-            submission=submission,
-            matches=matches,
-            document_content=document.content
-        )
-        
-        # Generate JSON report
-        json_data = report_generator.generate_json_report(
-            submission=submission,
-            matches=matches
-        )
-        
-        # Save report
-        report = Report(
-            submission_id=submission.id,
-            html_content=html_content,
-            json_data=json_data,
-            summary=f"Originality Score: {originality_score:.1f}%"
-        )
-        
-        db.add(report)
-        db.commit()
-        
-        # Cache result
-        cache_service.cache_document_check(
-            content_hash=document.content_hash,
-            result={
-                'submission_id': submission.id,
-                'originality_score': originality_score,
-                'plagiarism_percentage': 100 - originality_score
-            }
-        )
+        metrics.increment("check.delta.count")
+        metrics.observe("check.delta.latency_ms", (time.time() - start_time) * 1000)
         
         return {
             "submission_id": submission.id,
             "status": "completed",
-            "originality_score": originality_score,
-            "total_matches": len(matches_data)
+            "originality_score": submission.originality_score,
+            "new_matches": len(added),
+            "corpus_high_water_mark": submission.corpus_high_water_mark
         }
     
     except Exception as e:
-        # Handle errors
-        submission = db.query(Submission).filter(Submission.id == submission_id).first()
-        if submission:
-            submission.status = SubmissionStatus.FAILED
-            submission.error_message = str(e)
-            submission.processing_time = time.time() - start_time
-            db.commit()
-        
-        return {"error": str(e)}
\ No newline at end of file
+        db.rollback()
+        return {"error": str(e)}
+
+
+@celery_app.task(base=DatabaseTask, bind=True)
+def rescan_institution_task(self, institution_id: int):
+    """Queue delta re-checks for the latest completed submission of every institution document"""
+    
+    db: Session = self.db
+    current = db.query(func.max(Document.id)).scalar() or 0
+    
+    latest = db.query(
+        Submission.document_id,
+        func.max(Submission.id).label('submission_id')
+    ).join(Document, Document.id == Submission.document_id).filter(
+        Document.institution_id == institution_id,
+        Submission.status == SubmissionStatus.COMPLETED
+    ).group_by(Submission.document_id).subquery()
+    
+    stale = db.query(Submission.id).join(
+        latest, Submission.id == latest.c.submission_id
+    ).filter(
+        (Submission.corpus_high_water_mark.is_(None)) | (Submission.corpus_high_water_mark < current)
+    ).all()
+    
+    for (submission_id,) in stale:
+        recheck_submission_task.delay(submission_id)
+    
+    return {"institution_id": institution_id, "queued": len(stale)}
+
+
+@celery_app.task
+def prune_web_corpus_task():
+    """Apply web corpus retention (scheduled by Celery beat)"""
+    if not settings.ENABLE_WEB_CORPUS:
+        return {"pruned": 0}
+    return {"pruned": get_web_corpus_service().prune()}
+
+
+@celery_app.task
+def train_vector_indexes_task():
+    """Retrain local IVF indexes that have grown enough (scheduled by Celery beat)"""
+    from app.database.vector_db import vector_db
+    
+    if not vector_db.is_available():
+        return {"retrained": []}
+    return {"retrained": vector_db.train_indexes()}
@@ -0,0 +1,110 @@
+"""
+Speed / memory benchmark for web page text extraction.
+
+Runs the previous extraction (BeautifulSoup html.parser plus generator passes
+over get_text) and HtmlExtractor over a directory of saved HTML pages, or over
+synthetic pages (navigation, sidebars, scripts, footers around an article)
+when no directory is given, and reports time, peak Python-heap memory (lxml's
+own C allocations are not traced) and how much text each keeps. Pages are
+capped at WEB_FETCH_MAX_BYTES for HtmlExtractor, as when fetched.
+
+Run with: python -m benchmarks.html_extraction_benchmark --corpus ./saved_pages
+"""
+import argparse
+import os
+import random
+import time
+import tracemalloc
+from typing import Callable, List, Tuple
+from app.core.config import settings
+from app.services.html_extractor import HtmlExtractor
+
+
+def legacy_extract(body: bytes) -> str:
+    """Extraction as fetch_url_content did it before HtmlExtractor"""
+    from bs4 import BeautifulSoup
+    
+    soup = BeautifulSoup(body, 'html.parser')
+    for script in soup(["script", "style"]):
+        script.decompose()
+    text = soup.get_text()
+    lines = (line.strip() for line in text.splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    return ' '.join(chunk for chunk in chunks if chunk)
+
+
+def load_corpus(path: str) -> List[Tuple[str, bytes]]:
+    pages = []
+    for directory, _, filenames in os.walk(path):
+        for filename in sorted(filenames):
+            if filename.lower().endswith((".html", ".htm")):
+                with open(os.path.join(directory, filename), "rb") as handle:
+                    pages.append((filename, handle.read()))
+    return pages
+
+
+def synthetic_page(rng: random.Random, paragraphs: int) -> bytes:
+    words = [f"w{i}" for i in range(5000)]
+    
+    def sentence() -> str:
+        return " ".join(rng.choice(words) for _ in range(rng.randint(8, 20))).capitalize() + "."
+    
+    menu = "".join(f'<li><a href="/p{i}">{rng.choice(words)}</a></li>' for i in range(60))
+    article = "".join(f"<p>{' '.join(sentence() for _ in range(5))}</p>" for _ in range(paragraphs))
+    script = "var x = 1;" * 2000
+    return (
+        f"<html><head><title>t</title><style>body {{ color: red }}</style><script>{script}</script></head>"
+        f'<body><div class="site-header"><ul class="nav-menu">{menu}</ul></div>'
+        f'<div class="layout has-sidebar"><article><h1>{sentence()}</h1>{article}</article>'
+        f'<div class="sidebar"><ul>{menu}</ul></div></div>'
+        f'<div class="cookie-banner">{sentence()}</div><footer>{sentence()} {menu}</footer></body></html>'
+    ).encode()
+
+
+def measure(extract: Callable[[bytes], str], pages: List[Tuple[str, bytes]]) -> Tuple[float, float, int]:
+    """(ms per page, peak traced memory in MB, output characters)"""
+    start = time.perf_counter()
+    characters = sum(len(extract(body)) for _, body in pages)
+    elapsed = time.perf_counter() - start
+    
+    # Separate pass: tracing allocations slows extraction down considerably
+    tracemalloc.start()
+    for _, body in pages:
+        extract(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed * 1000 / len(pages), peak / 1e6, characters
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directory of saved .html pages (synthetic pages if omitted)")
+    parser.add_argument("--pages", type=int, default=50, help="Synthetic pages")
+    parser.add_argument("--paragraphs", type=int, default=200, help="Article paragraphs per synthetic page")
+    args = parser.parse_args()
+    
+    if args.corpus:
+        pages = load_corpus(args.corpus)
+    else:
+        rng = random.Random(0)
+        pages = [(f"page{i}", synthetic_page(rng, args.paragraphs)) for i in range(args.pages)]
+    if not pages:
+        raise SystemExit("No pages to extract")
+    
+    total_bytes = sum(len(body) for _, body in pages)
+    capped = [(name, body[:settings.WEB_FETCH_MAX_BYTES]) for name, body in pages]
+    print(f"{len(pages)} pages, {total_bytes / 1e6:.1f} MB ({sum(len(b) for _, b in capped) / 1e6:.1f} MB after the cap)")
+    
+    extractor = HtmlExtractor()
+    print(f"{'extractor':<12} {'ms/page':>9} {'MB/s':>7} {'peak MB':>8} {'chars':>10}")
+    for name, extract, corpus in (
+        ("legacy", legacy_extract, pages),
+        ("lxml", extractor.extract, capped)
+    ):
+        ms_per_page, peak_mb, characters = measure(extract, corpus)
+        throughput = sum(len(body) for _, body in corpus) / 1e6 / (ms_per_page * len(corpus) / 1000)
+        print(f"{name:<12} {ms_per_page:>9.2f} {throughput:>7.1f} {peak_mb:>8.1f} {characters:>10}")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,86 @@
+"""
+Recall / pruning benchmark for MinHash-LSH candidate retrieval.
+
+Builds a synthetic corpus of random-word documents, plants lightly edited
+copies of some corpus chunks in the queries, and compares the LSH candidate
+sets against a brute-force scan for several (bands, rows) settings.
+
+Run with: python -m benchmarks.lsh_benchmark --docs 5000
+"""
+import argparse
+import time
+import numpy as np
+from app.core.config import settings
+from app.services.minhash_service import LSHIndex, MinHasher
+
+
+def make_corpus(docs: int, chunks_per_doc: int, chunk_words: int, vocab: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    words = [f"w{i}" for i in range(vocab)]
+    return [
+        [" ".join(rng.choice(words, size=chunk_words)) for _ in range(chunks_per_doc)]
+        for _ in range(docs)
+    ], words, rng
+
+
+def edit(chunk: str, rate: float, words, rng) -> str:
+    """Replace a fraction of the words, like a light paraphrase"""
+    tokens = chunk.split()
+    for i in np.flatnonzero(rng.random(len(tokens)) < rate):
+        tokens[i] = words[rng.integers(len(words))]
+    return " ".join(tokens)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=2000)
+    parser.add_argument("--chunks", type=int, default=10, help="Chunks per document")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--edit-rate", type=float, default=0.05, help="Fraction of words changed in planted copies")
+    parser.add_argument("--vocab", type=int, default=5000)
+    args = parser.parse_args()
+    
+    corpus, words, rng = make_corpus(args.docs, args.chunks, settings.CHUNK_SIZE, args.vocab)
+    hasher = MinHasher()
+    
+    start = time.perf_counter()
+    signatures = [hasher.chunk_signatures(chunks) for chunks in corpus]
+    print(f"{args.docs} docs x {args.chunks} chunks signed in {time.perf_counter() - start:.1f}s")
+    
+    # Each query is an edited copy of one corpus chunk; its document is the expected hit
+    sources = rng.integers(args.docs, size=args.queries)
+    queries = [edit(corpus[d][rng.integers(args.chunks)], args.edit_rate, words, rng) for d in sources]
+    query_signatures = hasher.chunk_signatures(queries)
+    
+    # Brute force: estimated Jaccard against every chunk of every document
+    start = time.perf_counter()
+    for signature in query_signatures:
+        for doc_signatures in signatures:
+            (doc_signatures == signature).mean(axis=1).max()
+    brute_ms = (time.perf_counter() - start) * 1000 / args.queries
+    print(f"brute force: {args.docs} candidates/query, {brute_ms:.2f} ms/query")
+    
+    print(f"{'bands':>5} {'rows':>4} {'threshold':>9} {'recall':>7} {'cands':>8} {'ms/query':>9}")
+    for bands, rows in ((16, 8), (32, 4), (42, 3), (64, 2)):
+        if bands * rows > hasher.num_perm:
+            continue
+        index = LSHIndex(bands=bands, rows=rows)
+        for doc_id, doc_signatures in enumerate(signatures):
+            index.add(doc_id, doc_signatures)
+        
+        hits, sizes = 0, []
+        start = time.perf_counter()
+        for signature, expected in zip(query_signatures, sources):
+            candidates = index.query(signature)
+            sizes.append(len(candidates))
+            hits += int(expected) in candidates
+        elapsed_ms = (time.perf_counter() - start) * 1000 / args.queries
+        threshold = (1 / bands) ** (1 / rows)
+        print(
+            f"{bands:>5} {rows:>4} {threshold:>9.2f} {hits / args.queries:>7.3f} "
+            f"{np.mean(sizes):>8.1f} {elapsed_ms:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
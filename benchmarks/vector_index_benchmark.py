@@ -0,0 +1,116 @@
+"""
+Recall / latency benchmark for the vector index backends.
+
+Compares the local flat, IVF and IVF-PQ indexes (and Chroma's HNSW index
+when chromadb is installed) against exact brute-force top-k on synthetic
+clustered embeddings.
+
+Run with: python -m benchmarks.vector_index_benchmark --rows 100000
+"""
+import argparse
+import shutil
+import tempfile
+import time
+import numpy as np
+from app.core.config import settings
+from app.database.local_vector_index import LocalVectorIndex
+
+
+def make_dataset(rows: int, queries: int, dim: int, clusters: int, seed: int = 0):
+    """Clustered unit vectors, roughly shaped like sentence embeddings"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    data = centers[rng.integers(clusters, size=rows)] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32)
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    picks = rng.choice(rows, size=queries, replace=False)
+    query = data[picks] + 0.2 * rng.normal(size=(queries, dim)).astype(np.float32)
+    query /= np.linalg.norm(query, axis=1, keepdims=True)
+    return data, query
+
+
+def ground_truth(data: np.ndarray, queries: np.ndarray, k: int):
+    scores = queries @ data.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+
+def measure(search, queries: np.ndarray, truth, k: int):
+    """Return (recall@k, p50 ms, p95 ms)"""
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        ids = search(query.tolist(), k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len(expected & {int(i) for i in ids})
+    return hits / (len(queries) * k), np.percentile(latencies, 50), np.percentile(latencies, 95)
+
+
+def bench_local(index_type: str, data, queries, truth, k: int, batch: int):
+    path = tempfile.mkdtemp(prefix=f"bench_{index_type}_")
+    try:
+        settings.LOCAL_VECTOR_IVF_MIN_ROWS = len(data) + 1  # Train once, after loading
+        index = LocalVectorIndex(path, index_type=index_type)
+        
+        start = time.perf_counter()
+        for offset in range(0, len(data), batch):
+            block = data[offset:offset + batch]
+            ids = [str(i) for i in range(offset, offset + len(block))]
+            index.add(ids, block, [""] * len(block), [{}] * len(block))
+        if index_type != "flat":
+            index.train()
+        build = time.perf_counter() - start
+        
+        recall, p50, p95 = measure(
+            lambda q, n: index.search(q, n_results=n)["ids"][0], queries, truth, k
+        )
+        return build, recall, p50, p95
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def bench_chroma(data, queries, truth, k: int, batch: int):
+    import chromadb
+    
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection("bench", metadata={"hnsw:space": "cosine"})
+    
+    start = time.perf_counter()
+    for offset in range(0, len(data), batch):
+        block = data[offset:offset + batch]
+        collection.add(ids=[str(i) for i in range(offset, offset + len(block))], embeddings=block.tolist())
+    build = time.perf_counter() - start
+    
+    recall, p50, p95 = measure(
+        lambda q, n: collection.query(query_embeddings=[q], n_results=n)["ids"][0], queries, truth, k
+    )
+    return build, recall, p50, p95
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args()
+    
+    data, queries = make_dataset(args.rows, args.queries, args.dim, args.clusters)
+    truth = ground_truth(data, queries, args.k)
+    
+    print(f"{args.rows} rows, {args.queries} queries, dim={args.dim}, k={args.k}")
+    print(f"{'engine':<10} {'build s':>9} {'recall':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    
+    for index_type in ("flat", "ivf", "ivfpq"):
+        build, recall, p50, p95 = bench_local(index_type, data, queries, truth, args.k, args.batch)
+        print(f"{index_type:<10} {build:>9.2f} {recall:>8.3f} {p50:>8.2f} {p95:>8.2f}")
+    
+    try:
+        build, recall, p50, p95 = bench_chroma(data, queries, truth, args.k, args.batch)
+        print(f"{'chroma':<10} {build:>9.2f} {recall:>8.3f} {p50:>8.2f} {p95:>8.2f}")
+    except ImportError:
+        print("chroma     skipped (chromadb not installed)")
+
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file